@@ -0,0 +1,281 @@
+'''
+Benchmarks of the gradient widgets.
+
+Measures widget construction, property updates, ``render_texture()`` and
+screens with many gradients, and writes the results to a JSON file for
+regression tracking. A hidden window is used, so the benchmarks run on
+headless Linux with a software OpenGL (Mesa llvmpipe), e.g.::
+
+    LIBGL_ALWAYS_SOFTWARE=1 xvfb-run python benchmarks/run_benchmarks.py \\
+        --output results.json
+
+    # compare with the previous results
+    python benchmarks/run_benchmarks.py --compare results.json
+'''
+
+import os
+import sys
+import json
+import argparse
+import platform
+from statistics import mean, median
+from time import perf_counter
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+# benchmark the working tree, not the installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kivy.base import EventLoop
+from kivy.graphics.opengl import glFinish, glGetString, GL_RENDERER
+
+import bouquet
+from bouquet.gradients import ColorStop, LinearGradient, BilinearGradient, \
+                              RadialGradient, ConicalGradient, \
+                              GradientAnimation
+from bouquet.gradients.base import use_headless_context, ensure_gl_context
+from bouquet.gradients.cache import texture_cache
+from bouquet.gradients.scheduler import rebake_scheduler
+
+
+GRADIENTS = (LinearGradient, BilinearGradient, RadialGradient, ConicalGradient)
+RENDER_SIZES = (64, 256, 1024)
+BENCHMARKS = {}
+
+
+def benchmark(name, repeat=None):
+    '''
+    Registers the benchmark. The function does the setup and returns
+    the function to measure.
+    '''
+    def decorator(func):
+        BENCHMARKS[name] = (func, repeat)
+        return func
+    return decorator
+
+
+def draw_frame():
+    # processes the scheduled updates and draws the window
+    EventLoop.idle()
+    glFinish()
+
+
+def color_stops(count=4):
+    return [
+        ColorStop(position=i / (count - 1), color=(i % 2, 0.5, 1.0, 1.0))
+        for i in range(count)
+    ]
+
+
+for gradient_cls in GRADIENTS:
+    def construct(gradient_cls=gradient_cls):
+        kwargs = {}
+        if gradient_cls is not BilinearGradient:
+            kwargs['color_stops'] = color_stops()
+
+        def run():
+            gradient_cls(**kwargs)
+            rebake_scheduler.flush()
+        return run
+    benchmark(f'construct_{gradient_cls.__name__}')(construct)
+
+
+@benchmark('color_stops_reassign')
+def color_stops_reassign():
+    widget = LinearGradient(max_analytic_stops=0)
+    stops = [color_stops(4), color_stops(5)]
+
+    def run():
+        widget.color_stops = stops[0]
+        rebake_scheduler.flush()
+        stops.reverse()
+    return run
+
+
+def single_stop_animation(ramp_engine, count):
+    widget = LinearGradient(
+        color_stops=color_stops(count), ramp_engine=ramp_engine
+    )
+    stop = widget.color_stops[5]
+    rebake_scheduler.flush()
+    # moves the color stop between its neighbours, like gradient editors
+    positions = [stop.position, stop.position + 0.25 / (count - 1)]
+
+    def run():
+        stop.position = positions[0]
+        rebake_scheduler.flush()
+        positions.reverse()
+    return run
+
+
+benchmark('single_stop_animation')(
+    lambda: single_stop_animation('fbo', 16)
+)
+benchmark('single_stop_animation_cpu_500_stops')(
+    lambda: single_stop_animation('cpu', 500)
+)
+
+
+def property_change(gradient_cls, name, values):
+    widget = gradient_cls(color_stops=color_stops())
+    rebake_scheduler.flush()
+
+    def run():
+        setattr(widget, name, values[0])
+        rebake_scheduler.flush()
+        values.reverse()
+    return run
+
+
+benchmark('angle_change')(
+    lambda: property_change(LinearGradient, 'angle', [30, 60])
+)
+benchmark('radius_change')(
+    lambda: property_change(RadialGradient, 'radius', [0.5, 0.7])
+)
+benchmark('gradient_center_pos_change')(
+    lambda: property_change(
+        ConicalGradient, 'gradient_center_pos', [(0.3, 0.3), (0.6, 0.6)]
+    )
+)
+
+
+@benchmark('animation_frame_100_widgets')
+def animation_frame():
+    # animates the angle and a color stop from Python, one frame
+    widgets = [LinearGradient(color_stops=color_stops()) for i in range(100)]
+    rebake_scheduler.flush()
+    frames = [0]
+
+    def run():
+        frames[0] += 1
+        for widget in widgets:
+            widget.angle = frames[0] % 360
+            widget.color_stops[1].color = (frames[0] % 2, 0.5, 0.0, 1.0)
+        rebake_scheduler.flush()
+    return run
+
+
+@benchmark('gradient_animation_frame_100_widgets')
+def gradient_animation_frame():
+    # the same animation interpolated on the GPU, one frame
+    stops = color_stops()
+    animation = GradientAnimation(
+        {'color_stops': stops, 'angle': 0},
+        {'color_stops': stops[::-1], 'angle': 360},
+        duration=10.0, repeat=True
+    )
+    widgets = [LinearGradient(color_stops=stops) for i in range(100)]
+    for widget in widgets:
+        animation.start(widget)
+    rebake_scheduler.flush()
+
+    def run():
+        animation._update(1.0 / 60.0)
+    return run
+
+
+for size in RENDER_SIZES:
+    def render_texture(size=size):
+        stops = color_stops()
+
+        def run():
+            LinearGradient.render_texture(
+                size=(size, size), angle=45, color_stops=stops
+            )
+            glFinish()
+        return run
+    benchmark(f'render_texture_{size}')(render_texture)
+
+
+@benchmark('screen_1000_widgets', repeat=3)
+def screen_1000_widgets():
+    from kivy.core.window import Window
+    from kivy.uix.gridlayout import GridLayout
+
+    def run():
+        layout = GridLayout(cols=40)
+        for i in range(1000):
+            gradient_cls = GRADIENTS[i % len(GRADIENTS)]
+            if gradient_cls is BilinearGradient:
+                layout.add_widget(gradient_cls())
+            else:
+                layout.add_widget(gradient_cls(color_stops=color_stops()))
+        Window.add_widget(layout)
+        try:
+            draw_frame()
+        finally:
+            Window.remove_widget(layout)
+    return run
+
+
+def run_benchmark(setup, repeat, warmup=2):
+    func = setup()
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append((perf_counter() - start) * 1000.0)
+    return {
+        'repeat': repeat,
+        'min_ms': min(times),
+        'median_ms': median(times),
+        'mean_ms': mean(times)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-o', '--output', help='write results to JSON file')
+    parser.add_argument(
+        '-c', '--compare', help='compare with results from JSON file'
+    )
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=20,
+        help='number of measurements per benchmark (default: 20)'
+    )
+    parser.add_argument(
+        '-k', '--filter', default='',
+        help='run only benchmarks which names contain this string'
+    )
+    args = parser.parse_args(argv)
+
+    use_headless_context()
+    ensure_gl_context()
+    EventLoop.ensure_window()
+    # measure rendering, not the cache
+    texture_cache.max_bytes = 0
+
+    results = {}
+    for name, (setup, repeat) in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        results[name] = result = run_benchmark(setup, repeat or args.repeat)
+        print(f'{name:<34} {result["median_ms"]:10.3f} ms')
+
+    report = {
+        'bouquet': bouquet.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'gl_renderer': glGetString(GL_RENDERER).decode(errors='replace'),
+        'benchmarks': results
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['benchmarks']
+        print('\nChange of the median time:')
+        for name, result in results.items():
+            if name in baseline:
+                old = baseline[name]['median_ms']
+                change = (result['median_ms'] - old) / old * 100.0
+                print(f'{name:<34} {change:+9.1f} %')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
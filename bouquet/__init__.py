@@ -7,11 +7,7 @@ widgets and helpful tools for Kivy framework.
 
 '''
 
-from kivy.logger import Logger
-
 from ._version import __version__
 
 __license__ = 'MIT'
 __author__ = 'mak8kammerer'
-
-Logger.info(f'Bouquet: Version: {__version__}')
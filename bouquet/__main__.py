@@ -1,5 +1,18 @@
+import os
+import sys
 import webbrowser
 
+if __name__ == '__main__' and sys.argv[1:2] == ['export']:
+    # don't let Kivy parse the command line arguments
+    os.environ['KIVY_NO_ARGS'] = '1'
+    from bouquet.gradients.export import main
+    sys.exit(main(sys.argv[2:]))
+
+if __name__ == '__main__' and sys.argv[1:2] == ['--stress']:
+    os.environ['KIVY_NO_ARGS'] = '1'
+    from bouquet.stress import main
+    sys.exit(main(sys.argv[2:]))
+
 from kivy.lang import Builder
 from kivy.app import runTouchApp
 from kivy.uix.label import Label
@@ -181,4 +194,6 @@ BoxLayout:
 '''
 
 
-runTouchApp(Builder.load_string(KV))
+# worker processes of the export command import this module too
+if __name__ == '__main__':
+    runTouchApp(Builder.load_string(KV))
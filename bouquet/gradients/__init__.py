@@ -10,15 +10,51 @@ How to use gradients with Vertex Instructions?
 This is possible to use gradient textures with Vertex Instructions via the
 ``***Gradient.render_texture()`` function. You can take a look at code examples
 in the :ref:`Examples` section.
+
+Headless rendering
+~~~~~~~~~~~~~~~~~~
+
+Importing ``bouquet.gradients`` doesn't create a window. The OpenGL context
+is created by the first gradient widget or ``render_texture()`` call. Call
+:func:`~bouquet.gradients.base.use_headless_context` before that to render
+gradients with a hidden window.
 '''
 
-from .base import ColorStop
-from .linear import LinearGradient
-from .bilinear import BilinearGradient
-from .radial import RadialGradient
-from .conical import ConicalGradient
+from importlib import import_module
+
+from kivy.factory import Factory
 
 __all__ = (
-    'ColorStop', 'LinearGradient', 'BilinearGradient',
-    'RadialGradient', 'ConicalGradient'
+    'ColorStop', 'ColorStopArray', 'LinearGradient', 'BilinearGradient',
+    'RadialGradient', 'ConicalGradient', 'GradientAnimation'
 )
+
+# Submodules are imported on first access to keep the import time low.
+_modules = {
+    'ColorStop': 'base',
+    'ColorStopArray': 'base',
+    'LinearGradient': 'linear',
+    'BilinearGradient': 'bilinear',
+    'RadialGradient': 'radial',
+    'ConicalGradient': 'conical',
+    'GradientAnimation': 'animation'
+}
+
+
+def __getattr__(name):
+    module = _modules.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+for _name, _module in _modules.items():
+    if _module != 'base':
+        Factory.register(_name, module=f'{__name__}.{_module}')
+del _name, _module
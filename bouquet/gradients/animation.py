@@ -0,0 +1,247 @@
+'''
+Animations of the gradient widgets interpolated on the GPU.
+
+Animating a gradient by changing its properties from Python updates the
+widget every frame. :class:`GradientAnimation` uploads two keyframes (color
+stops and properties like the angle of linear gradients) to the shaders
+instead, and the shaders interpolate them. Every frame, the CPU only updates
+the progress between the keyframes, a single float uniform; the next
+keyframes are uploaded when the animation passes one. It makes animated
+backgrounds nearly free for the CPU::
+
+    from bouquet.gradients import ColorStop, GradientAnimation
+
+    animation = GradientAnimation(
+        {'color_stops': [ColorStop(color='#ff5f6d'),
+                         ColorStop(position=1.0, color='#ffc371')],
+         'angle': 0},
+        {'color_stops': [ColorStop(color='#2193b0'),
+                         ColorStop(position=0.6, color='#6dd5ed')],
+         'angle': 180},
+        duration=10.0, repeat=True
+    )
+    animation.start(linear_gradient)
+
+The color stops are passed to the shaders as uniforms, so a keyframe can't
+have more than :data:`~bouquet.gradients.base.MAX_ANALYTIC_STOPS` color
+stops. The color stops of two keyframes are interpolated in pairs, in the
+order of their positions; if a keyframe has fewer color stops, its last
+color stop is repeated.
+'''
+
+__all__ = ('GradientAnimation', )
+
+from numbers import Number
+
+from kivy.animation import AnimationTransition
+from kivy.clock import Clock
+from kivy.event import EventDispatcher
+
+from .base import ColorStop, ColorStopArray, GradientBase, MAX_ANALYTIC_STOPS
+
+
+class GradientAnimation(EventDispatcher):
+    '''
+    Animates gradient widgets through the keyframes.
+
+    :param keyframes:
+        Two or more dicts with the values of the gradient properties:
+        `'color_stops'` (a list of :class:`~bouquet.gradients.ColorStop`
+        objects or a :class:`~bouquet.gradients.ColorStopArray`) and
+        :attr:`~bouquet.gradients.LinearGradient.angle` of linear gradients,
+        `gradient_center_pos` of radial and conical gradients and
+        :attr:`~bouquet.gradients.RadialGradient.radius` of radial gradients.
+        Missing values are taken from the previous keyframe, or from
+        the widget for the first keyframe. The color stops are copied when
+        the animation is started, later changes don't affect it.
+    :param duration:
+        Time from the first to the last keyframe in seconds. The keyframes
+        are evenly spaced.
+    :param transition:
+        Name of a :class:`~kivy.animation.AnimationTransition` function
+        (e.g. `'in_out_sine'`) or a function applied to the progress of
+        the whole animation.
+    :param repeat:
+        Start over from the first keyframe after the last one, until
+        :meth:`stop` is called.
+
+    When the animation is over, the widget properties are set to the last
+    keyframe. While it runs, changes of the animated properties are
+    not shown.
+
+    :Events:
+        `on_start`: `widget`
+            Fired when the animation is started on the widget.
+        `on_complete`: `widget`
+            Fired when the animation is over or stopped with :meth:`stop`.
+
+    :raises ValueError: If there are fewer than two keyframes or
+        the duration isn't positive.
+    '''
+
+    __events__ = ('on_start', 'on_complete')
+
+    def __init__(self, *keyframes, duration: float = 1.0,
+                 transition='linear', repeat: bool = False, **kwargs):
+        super(GradientAnimation, self).__init__(**kwargs)
+        if len(keyframes) < 2:
+            raise ValueError('At least two keyframes are required.')
+        if duration <= 0.0:
+            raise ValueError('Duration must be positive.')
+        if isinstance(transition, str):
+            transition = getattr(AnimationTransition, transition)
+        self.keyframes = [dict(keyframe) for keyframe in keyframes]
+        self.duration = float(duration)
+        self.transition = transition
+        self.repeat = repeat
+        # widget -> [keyframes, last keyframe, elapsed time, keyframe index,
+        # progress between the keyframes]
+        self._widgets = {}
+        self._clock_event = None
+
+    def on_start(self, widget):
+        pass
+
+    def on_complete(self, widget):
+        pass
+
+    @property
+    def widgets(self) -> list:
+        '''
+        Widgets animated by this animation.
+        '''
+        return list(self._widgets)
+
+    def start(self, widget):
+        '''
+        Starts the animation on the widget from the first keyframe. The other
+        animation of the widget, if any, is cancelled.
+
+        :raises TypeError: If the widget isn't a gradient with color stops.
+        :raises ValueError: If a keyframe has more than
+            :data:`~bouquet.gradients.base.MAX_ANALYTIC_STOPS` color stops
+            or a property the widget doesn't animate.
+        '''
+        if not isinstance(widget, GradientBase):
+            c = widget.__class__.__name__
+            raise TypeError(f'Expected gradient with color stops, got {c}.')
+        keyframes, last_keyframe = self._get_keyframes(widget)
+        if widget._animation is not None:
+            widget._animation.cancel(widget)
+        widget._animation = self
+        self._widgets[widget] = [keyframes, last_keyframe, 0.0, 0, 0.0]
+        widget._set_keyframes((keyframes[0], keyframes[1]))
+        widget._set_animation_time(0.0)
+        if self._clock_event is None:
+            self._clock_event = Clock.schedule_interval(self._update, 0)
+        self.dispatch('on_start', widget)
+
+    def stop(self, widget):
+        '''
+        Stops the animation of the widget at the current frame and fires
+        `on_complete`. The widget properties are set to the shown values.
+        '''
+        if self.cancel(widget):
+            self.dispatch('on_complete', widget)
+
+    def cancel(self, widget) -> bool:
+        '''
+        Same as :meth:`stop`, but doesn't fire `on_complete`. Returns `False`
+        if the widget isn't animated by this animation.
+        '''
+        state = self._widgets.get(widget)
+        if state is None:
+            return False
+        keyframes, _, _, index, time = state
+        keyframe, next_keyframe = keyframes[index], keyframes[index + 1]
+        values = {
+            name: _mix(keyframe[name], next_keyframe[name], time)
+            for name in keyframe
+        }
+        values['color_stops'] = [
+            ColorStop(position=min(max(position, 0.0), 1.0), color=color)
+            for position, *color in values['color_stops']
+        ]
+        self._remove(widget, values)
+        return True
+
+    def _remove(self, widget, values):
+        del self._widgets[widget]
+        widget._animation = None
+        for name, value in values.items():
+            setattr(widget, name, value)
+        widget._set_keyframes(None)
+        if not self._widgets:
+            self._clock_event.cancel()
+            self._clock_event = None
+
+    def _get_keyframes(self, widget) -> tuple:
+        # Returns the keyframes with all animated values (color stops as
+        # lists of the sorted `[position, r, g, b, a]` values, padded to
+        # the same length) and the values of the last keyframe as given.
+        values = {
+            name: getattr(widget, name)
+            for name in widget._animated_properties
+        }
+        values['color_stops'] = widget.color_stops
+        keyframes = []
+        for keyframe in self.keyframes:
+            for name in keyframe:
+                if name not in values:
+                    c = widget.__class__.__name__
+                    raise ValueError(f'{c} can\'t animate {name!r}.')
+            values.update(keyframe)
+            keyframe = {
+                name: value if isinstance(value, Number) else list(value)
+                for name, value in values.items() if name != 'color_stops'
+            }
+            keyframe['color_stops'] = _get_stop_data(values['color_stops'])
+            keyframes.append(keyframe)
+
+        count = max(len(keyframe['color_stops']) for keyframe in keyframes)
+        if count > MAX_ANALYTIC_STOPS:
+            raise ValueError(
+                f'Keyframes can have at most {MAX_ANALYTIC_STOPS} color stops.'
+            )
+        for keyframe in keyframes:
+            stops = keyframe['color_stops']
+            stops.extend([stops[-1]] * (count - len(stops)))
+        return keyframes, values
+
+    def _update(self, dt):
+        duration = self.duration
+        for widget, state in list(self._widgets.items()):
+            keyframes = state[0]
+            elapsed = state[2] + dt
+            if elapsed >= duration:
+                if not self.repeat:
+                    self._remove(widget, state[1])
+                    self.dispatch('on_complete', widget)
+                    continue
+                elapsed %= duration
+            state[2] = elapsed
+
+            position = self.transition(elapsed / duration) \
+                * (len(keyframes) - 1)
+            index = min(max(int(position), 0), len(keyframes) - 2)
+            if index != state[3]:
+                state[3] = index
+                widget._set_keyframes((keyframes[index], keyframes[index + 1]))
+            state[4] = time = position - index
+            widget._set_animation_time(time)
+
+
+def _get_stop_data(stops) -> list:
+    if isinstance(stops, ColorStopArray):
+        data = [list(stop) for stop in stops._sorted_data()]
+    else:
+        stops = sorted(stops, key=lambda stop: stop.position)
+        data = [list(stop._data) for stop in stops]
+    # no color stops, the gradient is white
+    return data or [[0.0, 1.0, 1.0, 1.0, 1.0]]
+
+
+def _mix(a, b, time):
+    if isinstance(a, Number):
+        return a + (b - a) * time
+    return [_mix(x, y, time) for x, y in zip(a, b)]
@@ -0,0 +1,276 @@
+'''
+Background baking of gradient textures.
+
+:func:`bake_texture` returns immediately with a placeholder texture, so
+screens with many baked gradients don't block the frame they're created in.
+The pixels are computed by the CPU backend (:mod:`bouquet.gradients.raster`)
+in a worker thread. Without NumPy, the gradients are rendered with
+``render_texture()``, one gradient per frame.
+
+.. code-block:: python
+
+    bake = bake_texture(LinearGradient, size=(1920, 1080), angle=45,
+                        color_stops=color_stops, preview=True)
+    bake.bind(texture=lambda bake, texture: setattr(image, 'texture', texture))
+
+    # or in a coroutine, e.g. with App.async_run()
+    texture = await bake_texture_async(LinearGradient, size=(1920, 1080))
+'''
+
+__all__ = (
+    'TextureBake', 'bake_texture', 'bake_texture_async', 'PREVIEW_SIZE'
+)
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from kivy.clock import Clock
+from kivy.event import EventDispatcher
+from kivy.graphics.texture import Texture
+from kivy.logger import Logger
+from kivy.properties import BooleanProperty, ObjectProperty
+
+from . import raster
+from .base import ensure_gl_context, render_gradient_texture, \
+                  _get_cached_texture, _put_cached_texture
+
+
+PREVIEW_SIZE = 16
+'''Size of the longest side of the low-resolution preview textures.'''
+
+_executor = None
+_placeholder = None
+_gl_queue = deque()     # TextureBake instances waiting for GL rendering
+
+
+class TextureBake(EventDispatcher):
+    '''
+    Handle of the gradient texture baked in the background, returned by
+    :func:`bake_texture`. Bind to :attr:`texture` to update the widgets
+    once the gradient is baked.
+    '''
+
+    texture = ObjectProperty()
+    '''
+    The 1x1 white placeholder or the low-resolution preview texture until
+    the gradient is baked, then the baked texture.
+
+    :attr:`texture` is an :class:`~kivy.properties.ObjectProperty`.
+    '''
+
+    done = BooleanProperty(False)
+    '''
+    Indicates if baking is over. If it failed, :attr:`error` is set and
+    :attr:`texture` is not changed.
+
+    :attr:`done` is a :class:`~kivy.properties.BooleanProperty` and defaults
+    to `False`.
+    '''
+
+    error = ObjectProperty(None, allownone=True)
+    '''
+    Exception raised while baking the gradient, if any.
+
+    :attr:`error` is an :class:`~kivy.properties.ObjectProperty` and
+    defaults to `None`.
+    '''
+
+    def __init__(self, gradient_cls, size, kwargs, key, **properties):
+        super(TextureBake, self).__init__(**properties)
+        self.gradient_cls = gradient_cls
+        self.size = size
+        self._kwargs = kwargs
+        self._key = key
+        self._future = None
+        self._callbacks = []
+        self._cancelled = False
+
+    def add_done_callback(self, callback, error_callback=None):
+        '''
+        Calls `callback(texture)` once the gradient is baked, or immediately
+        if it's already baked. If baking fails, `error_callback(error)` is
+        called instead.
+        '''
+        if not self.done:
+            self._callbacks.append((callback, error_callback))
+        elif self.error is None:
+            callback(self.texture)
+        elif error_callback is not None:
+            error_callback(self.error)
+
+    def cancel(self):
+        '''
+        Cancels baking. The placeholder texture is kept.
+        '''
+        self._cancelled = True
+        self._callbacks.clear()
+        if self._future is not None:
+            self._future.cancel()
+
+    def _finish(self, texture):
+        if self._cancelled:
+            return
+        self.texture = texture
+        self.done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback, _ in callbacks:
+            callback(texture)
+
+    def _fail(self, error):
+        if self._cancelled:
+            return
+        Logger.error(f'Bouquet: Unable to bake the gradient: {error!r}')
+        self.error = error
+        self.done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for _, error_callback in callbacks:
+            if error_callback is not None:
+                error_callback(error)
+
+    def _on_pixels(self, future):
+        # called in the worker thread
+        if future.cancelled():
+            return
+        Clock.schedule_once(partial(self._upload, future), 0)
+
+    def _upload(self, future, _):
+        if self._cancelled:
+            return
+        error = future.exception()
+        if error is not None:
+            self._fail(error)
+            return
+        pixels = future.result().reshape(-1)
+        texture = Texture.create(size=self.size, colorfmt='rgba')
+        texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        texture.add_reload_observer(partial(_reload_pixels, pixels))
+        if self._key is not None:
+            _put_cached_texture(self._key, texture, lambda: pixels)
+        self._finish(texture)
+
+
+def bake_texture(gradient_cls, callback=None, preview: bool = False,
+                 **kwargs) -> TextureBake:
+    '''
+    Starts baking the gradient texture in the background and returns
+    the :class:`TextureBake`. Cached textures are returned immediately.
+
+    :param gradient_cls:
+        Gradient widget class, e.g. :class:`~bouquet.gradients.LinearGradient`.
+    :param callback:
+        Function called with the baked texture.
+    :param preview:
+        Show a low-resolution preview of the gradient (see
+        :data:`PREVIEW_SIZE`) instead of the 1x1 white placeholder.
+    :param kwargs:
+        Same arguments as ``render_texture()`` of the gradient class.
+    :raises TypeError: If the gradient has no such property.
+    '''
+    ensure_gl_context()
+    width = kwargs.pop('width', 100)
+    height = kwargs.pop('height', 100)
+    size = tuple(kwargs.pop('size', (width, height)))
+
+    key, texture = _get_cached_texture(gradient_cls, size, kwargs)
+    if texture is not None:
+        bake = TextureBake(gradient_cls, size, kwargs, key)
+        bake._finish(texture)
+    else:
+        if preview:
+            scale = PREVIEW_SIZE / max(size)
+            preview_size = (
+                max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+            )
+            texture = render_gradient_texture(
+                gradient_cls, dict(kwargs, size=preview_size)
+            )
+        else:
+            texture = _get_placeholder()
+        bake = TextureBake(gradient_cls, size, kwargs, key, texture=texture)
+        _start(bake)
+
+    if callback is not None:
+        bake.add_done_callback(callback)
+    return bake
+
+
+async def bake_texture_async(gradient_cls, **kwargs) -> Texture:
+    '''
+    Coroutine version of :func:`bake_texture`, which returns the baked
+    texture. Requires a running :mod:`asyncio` event loop, e.g.
+    :meth:`~kivy.app.App.async_run`. If baking fails, the error is raised.
+    '''
+    import asyncio
+
+    future = asyncio.get_running_loop().create_future()
+
+    def set_result(texture):
+        if not future.done():
+            future.set_result(texture)
+
+    def set_exception(error):
+        if not future.done():
+            future.set_exception(error)
+
+    bake = bake_texture(gradient_cls, **kwargs)
+    bake.add_done_callback(set_result, set_exception)
+    try:
+        return await future
+    finally:
+        bake.cancel()
+
+
+def _start(bake):
+    global _executor
+    if raster.numpy is None:
+        _gl_queue.append(bake)
+        if len(_gl_queue) == 1:
+            Clock.schedule_once(_render_next, 0)
+        return
+    # validate the request now, so errors are raised to the caller
+    request = raster._parse_request(
+        bake.gradient_cls, dict(bake._kwargs, size=bake.size)
+    )
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=min(4, os.cpu_count() or 1),
+            thread_name_prefix='bouquet-bake'
+        )
+    bake._future = _executor.submit(raster._render, *request)
+    bake._future.add_done_callback(bake._on_pixels)
+
+
+def _render_next(_):
+    # renders one gradient per frame with OpenGL
+    while _gl_queue:
+        bake = _gl_queue.popleft()
+        if not bake._cancelled:
+            # a failed gradient doesn't stop the rest of the queue
+            try:
+                texture = render_gradient_texture(
+                    bake.gradient_cls, dict(bake._kwargs, size=bake.size)
+                )
+            except Exception as error:
+                bake._fail(error)
+            else:
+                bake._finish(texture)
+            break
+    if _gl_queue:
+        Clock.schedule_once(_render_next, 0)
+
+
+def _get_placeholder():
+    global _placeholder
+    if _placeholder is None:
+        _placeholder = Texture.create(size=(1, 1), colorfmt='rgba')
+        _placeholder.blit_buffer(b'\xff\xff\xff\xff', colorfmt='rgba')
+        _placeholder.add_reload_observer(
+            partial(_reload_pixels, b'\xff\xff\xff\xff')
+        )
+    return _placeholder
+
+
+def _reload_pixels(pixels, texture):
+    texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
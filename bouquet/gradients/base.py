@@ -4,58 +4,511 @@ Base module for gradients with color stops.
 # TODO: implement alternative color spaces
 
 __all__ = (
-    'ColorStop', 'GradientBase',
-    'enable_copy_blending', 'disable_copy_blending'
+    'ColorStop', 'ColorStopArray', 'GradientBase', 'render_gradient_texture',
+    'render_gradient_pixels', 'create_render_context', 'ensure_gl_context',
+    'use_headless_context', 'load_kv_rule',
+    'MAX_ANALYTIC_STOPS', 'GRADIENT_COLOR_FUNCTION',
+    'enable_copy_blending', 'disable_copy_blending',
+    'enable_instrumentation', 'disable_instrumentation',
+    'instrumentation_stats', 'reset_instrumentation_stats'
 )
 
+import os
+from array import array
+from functools import partial
+from operator import itemgetter
+from time import perf_counter
+
+from kivy.clock import Clock
+from kivy.config import Config
 from kivy.event import EventDispatcher
-from kivy.graphics import Callback, Mesh
+from kivy.graphics import Callback, Canvas, RenderContext
 from kivy.graphics.fbo import Fbo
-from kivy.graphics.opengl import glBlendFuncSeparate, \
-                                 GL_ZERO, GL_ONE_MINUS_SRC_ALPHA, \
-                                 GL_SRC_ALPHA, GL_ONE
 from kivy.graphics.texture import Texture
-from kivy.properties import ColorProperty, BoundedNumericProperty, \
-                                ListProperty, ObjectProperty
+from kivy.lang import Builder
+from kivy.logger import Logger
+from kivy.properties import AliasProperty, ColorProperty, \
+                                BoundedNumericProperty, ListProperty, \
+                                ObjectProperty, OptionProperty, Property, \
+                                ReferenceListProperty
 from kivy.uix.anchorlayout import AnchorLayout
+from kivy.utils import colormap, get_color_from_hex
 
+from .. import __version__
+from .cache import texture_cache, disk_cache
+from .instrumentation import count_shader_compile, record_event, timed, \
+                              enable_instrumentation, \
+                              disable_instrumentation, \
+                              instrumentation_stats, \
+                              reset_instrumentation_stats
+from .scheduler import rebake_scheduler
+from .ramp import RAMP_ENGINES, RAMP_WIDTH, MAX_RAMP_WIDTH, \
+                  MAX_FBO_RAMP_STOPS, ramp_atlas, ramp_registry, \
+                  create_ramp, release_ramp, get_default_ramp_engine, \
+                  enable_copy_blending, disable_copy_blending
 
-FBO_VERTEX_SHADER = '''
-#ifdef GL_ES
-    precision highp float;
-#endif
 
-attribute float vertexPos;
-attribute vec4  vertexColor;
+_gl_context_created = False
 
-varying vec4 fragmentColor;
 
-void main() {
-    fragmentColor = vertexColor;
-    gl_Position = vec4(vertexPos * 2.0 - 1.0, 0.0, 0.0, 1.0);
-}
-'''
+def use_headless_context(video_driver: str = None):
+    '''
+    Makes :func:`ensure_gl_context` create a hidden window, so the gradients
+    can be rendered with ``render_texture()`` by batch workers and render
+    servers. It must be called before the OpenGL context is created.
+
+    :param video_driver:
+        SDL video driver to use, e.g. `'offscreen'` (requires EGL) or
+        `'x11'` with a virtual X server. By default, SDL picks the driver.
+    :raises RuntimeError: If the OpenGL context is already created.
+    '''
+    if _gl_context_created:
+        raise RuntimeError('OpenGL context is already created.')
+    Config.set('graphics', 'window_state', 'hidden')
+    if video_driver is not None:
+        os.environ['SDL_VIDEODRIVER'] = video_driver
+
+
+def ensure_gl_context():
+    '''
+    Creates the OpenGL context (Kivy window) if it doesn't exist yet.
+    Importing ``bouquet.gradients`` doesn't create the context; it's created
+    by the first gradient widget or ``render_texture()`` call.
+
+    :raises RuntimeError: If the OpenGL context can't be created.
+    '''
+    global _gl_context_created
+    if _gl_context_created:
+        return
+    from kivy.core.window import Window
+    if Window is None:
+        raise RuntimeError('Unable to create OpenGL context.')
+    _gl_context_created = True
+    Logger.info(f'Bouquet: Version: {__version__}')
 
 
-FBO_FRAGMENT_SHADER = '''
-#ifdef GL_ES
-    precision highp float;
-#endif
+_loaded_kv_rules = set()
+# index of the first rule loaded after this module was imported, the
+# lazily loaded rules are inserted there
+_kv_rule_index = len(Builder.rules)
 
-varying vec4 fragmentColor;
 
-void main() {
-    gl_FragColor = fragmentColor;
+def load_kv_rule(name: str, kv: str):
+    '''
+    Loads the KV rule of the gradient widget class, if it isn't loaded yet.
+    Gradient widgets call it on instantiation, so importing a gradient
+    module doesn't parse its KV rule.
+
+    The rule is put before the rules loaded after the import of
+    :mod:`bouquet.gradients`, so the rules of the app for the same class are
+    applied after it, as if it was loaded on import.
+
+    :param name:
+        Name of the widget class.
+    :param kv:
+        KV rule of the widget class.
+    '''
+    global _kv_rule_index
+    if name not in _loaded_kv_rules:
+        _loaded_kv_rules.add(name)
+        rules = Builder.rules
+        count = len(rules)
+        Builder.load_string(kv, filename=f'bouquet.gradients.{name}.kv')
+        new_rules = rules[count:]
+        del rules[count:]
+        # rules may have been unloaded since the import
+        index = min(_kv_rule_index, count)
+        rules[index:index] = new_rules
+        _kv_rule_index = index + len(new_rules)
+        _clear_kv_match_cache()
+
+
+def _clear_kv_match_cache():
+    # Builder caches the rules matching each widget and has no public API
+    # to clear the cache after the rules were reordered. load_string()
+    # clears it too, so it's fine to skip it if the private method is gone.
+    clear_match_cache = getattr(Builder, '_clear_matchcache', None)
+    if clear_match_cache is not None:
+        clear_match_cache()
+
+
+MAX_ANALYTIC_STOPS = 8
+
+GRADIENT_COLOR_FUNCTION = '''
+uniform int       gradientStopCount;
+uniform float     gradientStopPositions[8];
+uniform vec4      gradientStopColors[8];
+uniform float     gradientNextStopPositions[8];
+uniform vec4      gradientNextStopColors[8];
+uniform float     gradientTime;
+uniform float     gradientRow;
+uniform sampler2D gradientTexture;
+
+// Returns color of the gradient at the position t. If gradientStopCount
+// is 0, the color is sampled from the 1D gradient texture, otherwise
+// the color stops are interpolated directly. While a GradientAnimation
+// runs, the color stops are interpolated with the color stops of the next
+// keyframe by gradientTime first.
+vec4 gradientColor(float t) {
+    if (gradientStopCount == 0) {
+        return texture2D(gradientTexture, vec2(t, gradientRow));
+    }
+    vec4 color = mix(
+        gradientStopColors[0], gradientNextStopColors[0], gradientTime
+    );
+    vec4 previousColor = color;
+    float previous = mix(
+        gradientStopPositions[0], gradientNextStopPositions[0], gradientTime
+    );
+    for (int i = 1; i < 8; i++) {
+        if (i >= gradientStopCount) {
+            break;
+        }
+        // GLSL ES 1.00 allows only the loop index in array indices
+        float position = mix(
+            gradientStopPositions[i], gradientNextStopPositions[i],
+            gradientTime
+        );
+        vec4 stopColor = mix(
+            gradientStopColors[i], gradientNextStopColors[i], gradientTime
+        );
+        if (t >= previous) {
+            float length = position - previous;
+            float f = length > 0.0 ? clamp((t - previous) / length, 0.0, 1.0)
+                                   : 1.0;
+            color = mix(previousColor, stopColor, f);
+        }
+        previous = position;
+        previousColor = stopColor;
+    }
+    return color;
 }
 '''
+'''
+GLSL function used by the gradient fragment shaders to get the color at
+a position of the gradient line.
+'''
+
+
+def create_render_context(owner, **kwargs) -> RenderContext:
+    '''
+    Creates :class:`~kivy.graphics.RenderContext` for the gradient widget and
+    records the time spent compiling its shader in
+    :mod:`~bouquet.gradients.instrumentation`.
+
+    :param owner:
+        Gradient widget class.
+    :param kwargs:
+        :class:`~kivy.graphics.RenderContext` arguments.
+    '''
+    ensure_gl_context()
+    start = perf_counter()
+    context = RenderContext(**kwargs)
+    count_shader_compile(owner.__name__, perf_counter() - start)
+    return context
+
+
+@timed('render_texture')
+def render_gradient_texture(gradient_cls, kwargs: dict,
+                            target=None) -> Texture:
+    '''
+    Renders a `gradient_cls` widget at FBO and returns the texture. If
+    :data:`~bouquet.gradients.cache.texture_cache` or
+    :data:`~bouquet.gradients.cache.disk_cache` is enabled, the results are
+    stored there, so identical requests return the already baked texture.
+
+    One widget per class is kept for rendering, so its shader is compiled
+    only once.
+
+    :param gradient_cls:
+        Gradient widget class.
+    :param kwargs:
+        Widget properties; `width`, `height` and `size` define
+        the texture size.
+    :param target:
+        :class:`~kivy.graphics.fbo.Fbo` or
+        :class:`~kivy.graphics.texture.Texture` to render into instead of
+        creating a new texture. The FBO is resized only when the size
+        changes. A texture can't be resized, so a new texture is created
+        if its size doesn't match. The framebuffer of the last target
+        texture is kept for the next calls with it, until it isn't used for
+        a second. The caches are not used in both cases, and the target is
+        removed from :data:`~bouquet.gradients.cache.texture_cache`, so
+        the cached texture isn't overwritten for the other callers.
+    :raises TypeError: If the widget has no such property.
+    '''
+    # the FBO and the texture need the context, create it first
+    ensure_gl_context()
+    width = kwargs.pop('width', 100)
+    height = kwargs.pop('height', 100)
+    width, height = size = kwargs.pop('size', (width, height))
+
+    key = None
+    if target is not None:
+        if isinstance(target, Texture) and target.size != tuple(size):
+            target = None
+        if isinstance(target, Fbo):
+            fbo = target
+            if tuple(fbo.size) != tuple(size):
+                fbo.size = size
+        elif target is not None:
+            fbo = _get_target_fbo(gradient_cls, target, size)
+        if target is not None:
+            texture_cache.discard(fbo.texture)
+    else:
+        key, texture = _get_cached_texture(gradient_cls, size, kwargs)
+        if texture is not None:
+            return texture
+
+    if target is None:
+        start = perf_counter()
+        fbo = Fbo(size=size)
+        elapsed = perf_counter() - start
+        count_shader_compile('Fbo', elapsed)
+        record_event('fbo_allocation', gradient_cls.__name__, elapsed)
+    _draw_gradient(gradient_cls, size, kwargs, fbo)
+
+    if key is not None:
+        _put_cached_texture(key, fbo.texture, lambda: fbo.pixels)
+    return fbo.texture
+
+
+_target_fbo = None
+
+
+def _get_target_fbo(gradient_cls, target, size):
+    # Creates only the framebuffer, the texture is reused. The FBO of
+    # the last texture is kept, so rendering into the same texture again
+    # (e.g. every frame) doesn't create another FBO and compile its shader.
+    # It isn't cached per texture, since the FBO holds its texture. For
+    # the same reason, it's dropped when it isn't used for a while, so
+    # the texture can be freed.
+    global _target_fbo
+    fbo = _target_fbo
+    if fbo is None or fbo.texture is not target:
+        start = perf_counter()
+        fbo = _target_fbo = Fbo(size=size, texture=target)
+        elapsed = perf_counter() - start
+        count_shader_compile('Fbo', elapsed)
+        record_event('fbo_allocation', gradient_cls.__name__, elapsed)
+    _trigger_release_target_fbo.cancel()
+    _trigger_release_target_fbo()
+    return fbo
+
+
+def _release_target_fbo(*args):
+    global _target_fbo
+    _target_fbo = None
+
 
+_trigger_release_target_fbo = Clock.create_trigger(_release_target_fbo, 1.0)
 
-def enable_copy_blending(_):
-    glBlendFuncSeparate(GL_ONE, GL_ZERO, GL_ONE, GL_ZERO)
 
+def _get_cached_texture(gradient_cls, size, kwargs):
+    # returns the cache key (None, if caching is disabled) and
+    # the cached texture, if any
+    if not texture_cache.max_bytes and disk_cache.directory is None:
+        return None, None
+    key = _texture_key(gradient_cls, size, kwargs)
+    if key is None:
+        return None, None
+    texture = texture_cache.get(key) if texture_cache.max_bytes else None
+    if texture is None and disk_cache.directory is not None:
+        texture = _load_texture(key, size)
+        if texture is not None:
+            texture_cache.put(key, texture)
+    return key, texture
 
-def disable_copy_blending(_):
-    glBlendFuncSeparate(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA, GL_ONE, GL_ONE)
+
+def _put_cached_texture(key, texture, get_pixels):
+    # the pixels are read only when the disk cache is enabled
+    texture_cache.put(key, texture)
+    if disk_cache.directory is not None:
+        disk_cache.put(key, get_pixels())
+
+
+def _load_texture(key, size):
+    # creates the texture from the pixels in the disk cache
+    width, height = size
+    pixels = disk_cache.get(key, int(width) * int(height) * 4)
+    if pixels is None:
+        return None
+    texture = Texture.create(size=size, colorfmt='rgba')
+    with pixels:
+        texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+    texture.add_reload_observer(partial(_reload_texture, key))
+    return texture
+
+
+def _reload_texture(key, texture):
+    # uploads the pixels again after the OpenGL context was lost
+    width, height = texture.size
+    pixels = disk_cache.get(key, width * height * 4)
+    if pixels is not None:
+        with pixels:
+            texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+
+
+_readback_fbo = None
+
+
+def render_gradient_pixels(gradient_cls, kwargs: dict, buffer=None):
+    '''
+    Renders a `gradient_cls` widget and reads its RGBA pixels back into
+    `buffer`. Rows go from bottom to top, like in
+    :attr:`~kivy.graphics.texture.Texture.pixels`.
+
+    Unlike :func:`render_gradient_texture`, no texture is created: all calls
+    render into one FBO, which is reallocated only when the size changes.
+
+    :param gradient_cls:
+        Gradient widget class.
+    :param kwargs:
+        Widget properties; `width`, `height` and `size` define
+        the image size.
+    :param buffer:
+        Writable contiguous buffer of `width * height * 4` bytes, e.g.
+        a `bytearray`, a `memoryview` or a NumPy array of `uint8`. It can
+        be reused across calls. By default, a new `bytearray` is created.
+    :returns: The `buffer`.
+    :raises TypeError:
+        If the widget has no such property or the buffer is read-only.
+    :raises ValueError: If the buffer size doesn't match the image size.
+    '''
+    global _readback_fbo
+    ensure_gl_context()
+    width = kwargs.pop('width', 100)
+    height = kwargs.pop('height', 100)
+    width, height = size = kwargs.pop('size', (width, height))
+
+    nbytes = int(width) * int(height) * 4
+    if buffer is None:
+        buffer = bytearray(nbytes)
+    view = memoryview(buffer)
+    if view.readonly:
+        raise TypeError('Buffer must be writable.')
+    view = view.cast('B')
+    if view.nbytes != nbytes:
+        raise ValueError(
+            f'Buffer size must be {nbytes} bytes, not {view.nbytes}.'
+        )
+
+    fbo = _readback_fbo
+    if fbo is None:
+        start = perf_counter()
+        fbo = _readback_fbo = Fbo(size=size)
+        elapsed = perf_counter() - start
+        count_shader_compile('Fbo', elapsed)
+        record_event('fbo_allocation', gradient_cls.__name__, elapsed)
+    elif tuple(fbo.size) != tuple(size):
+        start = perf_counter()
+        fbo.size = size
+        record_event(
+            'fbo_allocation', gradient_cls.__name__, perf_counter() - start
+        )
+    _draw_gradient(gradient_cls, size, kwargs, fbo)
+    # Kivy reads the pixels into a new bytes object, so it's the only copy
+    view[:] = fbo.pixels
+    return buffer
+
+
+def _draw_gradient(gradient_cls, size, kwargs, fbo):
+    widget = _get_renderer(gradient_cls, size, kwargs)
+    try:
+        if isinstance(widget, GradientBase):
+            widget._trigger_update_mesh.cancel()
+            widget._update_mesh()
+        trigger = getattr(widget, '_trigger_update_gradient_matrix', None)
+        if trigger is not None:
+            trigger.flush()
+        # apply the delayed canvas rules (e.g. the new size and gradient
+        # texture)
+        Builder.sync()
+
+        with fbo:
+            enable_blending = Callback(enable_copy_blending)
+            fbo.add(widget.canvas)
+            disable_blending = Callback(disable_copy_blending)
+        fbo.draw()
+        for instruction in (enable_blending, widget.canvas, disable_blending):
+            fbo.remove(instruction)
+    finally:
+        _reset_renderer(widget, kwargs)
+
+
+_renderers = {}     # gradient class -> widget
+
+
+def _get_renderer(gradient_cls, size, kwargs):
+    # Returns the widget of the class with the properties from `kwargs`.
+    # The names are checked first, so a wrong one doesn't leave the other
+    # properties applied.
+    for name in kwargs:
+        if not isinstance(getattr(gradient_cls, name, None), Property):
+            cls_name = gradient_cls.__name__
+            raise TypeError(f'{cls_name} has no property {name!r}.')
+
+    widget = _renderers.get(gradient_cls)
+    if widget is None:
+        # don't add the widget canvas to the active canvas, if any
+        holder = Canvas()
+        with holder:
+            widget = _renderers[gradient_cls] = gradient_cls()
+        holder.remove(widget.canvas)
+    try:
+        for name, value in kwargs.items():
+            setattr(widget, name, value)
+    except BaseException:
+        _reset_renderer(widget, kwargs)
+        raise
+    widget.size = size
+    return widget
+
+
+def _reset_renderer(widget, names):
+    # Sets the properties back to the defaults, so the next request starts
+    # from them and the widget doesn't keep the objects of the caller
+    # (e.g. it doesn't stay bound to the color stops).
+    for name in names:
+        prop = widget.property(name)
+        default = prop.defaultvalue
+        if isinstance(prop, ReferenceListProperty):
+            default = [p.defaultvalue for p in default]
+        setattr(widget, name, default)
+    if isinstance(widget, GradientBase):
+        widget.release_resources()
+    trigger = getattr(widget, '_trigger_update_gradient_matrix', None)
+    if trigger is not None:
+        trigger.cancel()
+
+
+def _texture_key(gradient_cls, size, kwargs):
+    # colors are normalized, so e.g. 'red', '#ff0000' and (1, 0, 0, 1)
+    # give the same key
+    items = []
+    for name, value in kwargs.items():
+        if isinstance(getattr(gradient_cls, name, None), ColorProperty):
+            try:
+                value = _parse_color(value)
+            except (ValueError, TypeError, KeyError):
+                pass
+        items.append((name, _hashable(value)))
+    key = gradient_cls, tuple(size), tuple(sorted(items))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _hashable(value):
+    if isinstance(value, ColorStop):
+        return value._data
+    if isinstance(value, ColorStopArray):
+        return tuple(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
 
 
 class ColorStop(EventDispatcher):
@@ -97,6 +550,201 @@ class ColorStop(EventDispatcher):
         return f'<ColorStop(position={self.position}, color={self.color})>'
 
 
+class ColorStopArray(EventDispatcher):
+    '''
+    Compact alternative to a list of :class:`ColorStop` objects for gradients
+    built from data, e.g. heatmaps and spectra with thousands of samples.
+    Positions and RGBA colors of the color stops are stored in one contiguous
+    buffer of doubles, and the gradient is updated once per change, no matter
+    how many color stops were changed.
+
+    .. code-block:: python
+
+        stops = ColorStopArray(positions, colors)
+        gradient.color_stops = stops
+
+        stops.set_many(colors=new_colors)
+        stops[10:20] = [(0.5, 'red')] * 10
+
+    Indexing returns `(position, r, g, b, a)` tuples; assigned items are
+    `(position, color)` pairs. Positions are clamped to the range from 0.0
+    to 1.0, like :attr:`ColorStop.position`.
+
+    :param positions:
+        Positions of the color stops.
+    :param colors:
+        Colors of the color stops, as RGB(A) sequences or strings accepted
+        by :class:`~kivy.properties.ColorProperty`.
+    :raises ValueError:
+        If the numbers of positions and colors differ or a color is invalid.
+
+    :Events:
+        `on_change`
+            Fired after the color stops are changed.
+    '''
+
+    __events__ = ('on_change', )
+
+    def __init__(self, positions=(), colors=(), **kwargs):
+        super(ColorStopArray, self).__init__(**kwargs)
+        self._buffer = _pack_stops(positions, colors)
+
+    def set_many(self, positions=None, colors=None, start: int = 0):
+        '''
+        Changes positions and/or colors of the consecutive color stops
+        starting at `start`, then fires a single `on_change` event.
+
+        :raises ValueError:
+            If both `positions` and `colors` are passed and their lengths
+            differ.
+        :raises IndexError: If the color stops don't exist.
+        '''
+        if positions is not None:
+            positions = list(positions)
+        if colors is not None:
+            colors = list(colors)
+        values = positions if colors is None else colors
+        if values is None:
+            return
+        if positions is not None and len(positions) != len(values):
+            raise ValueError('Positions and colors must have the same length.')
+        if start < 0 or start + len(values) > len(self):
+            raise IndexError('Color stop index out of range.')
+
+        buffer = self._buffer
+        if positions is not None:
+            for i, position in enumerate(positions, start):
+                buffer[i * 5] = _clamp_position(position)
+        if colors is not None:
+            for i, color in enumerate(colors, start):
+                buffer[i * 5 + 1:i * 5 + 5] = array('d', _parse_color(color))
+        self.dispatch('on_change')
+
+    def on_change(self):
+        pass
+
+    def _index(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('Color stop index out of range.')
+        return index
+
+    def _sorted_data(self) -> list:
+        # (position, r, g, b, a) tuples sorted by position
+        return sorted(self, key=itemgetter(0))
+
+    def _mesh(self) -> list:
+        # flat list of the sorted color stops for the ramp, the buffer
+        # is copied as is if the color stops are already sorted
+        buffer = self._buffer
+        positions = buffer[0::5]
+        if all(a <= b for a, b in zip(positions, positions[1:])):
+            mesh = buffer.tolist()
+        else:
+            mesh = [i for stop in self._sorted_data() for i in stop]
+        return _pad_mesh(mesh)
+
+    def __len__(self) -> int:
+        return len(self._buffer) // 5
+
+    def __iter__(self):
+        buffer = self._buffer
+        for i in range(0, len(buffer), 5):
+            yield tuple(buffer[i:i + 5])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = self._index(index)
+        return tuple(self._buffer[index * 5:index * 5 + 5])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('Extended slices are not supported.')
+            value = list(value)
+            positions = [position for position, _ in value]
+            colors = [color for _, color in value]
+            self._buffer[start * 5:max(start, stop) * 5] = \
+                _pack_stops(positions, colors)
+        else:
+            index = self._index(index)
+            position, color = value
+            self._buffer[index * 5:index * 5 + 5] = \
+                _pack_stops((position, ), (color, ))
+        self.dispatch('on_change')
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('Extended slices are not supported.')
+            del self._buffer[start * 5:max(start, stop) * 5]
+        else:
+            index = self._index(index)
+            del self._buffer[index * 5:index * 5 + 5]
+        self.dispatch('on_change')
+
+    def __repr__(self):
+        return f'<ColorStopArray({len(self)} color stops)>'
+
+
+def _clamp_position(position) -> float:
+    return min(max(float(position), 0.0), 1.0)
+
+
+def _parse_color(color) -> list:
+    if isinstance(color, str):
+        color = colormap[color] if color in colormap \
+            else get_color_from_hex(color)
+    color = [float(c) for c in color]
+    if len(color) == 3:
+        color.append(1.0)
+    elif len(color) != 4:
+        raise ValueError(f'Invalid color: {color!r}.')
+    return color
+
+
+def _pack_stops(positions, colors) -> array:
+    positions = list(positions)
+    colors = list(colors)
+    if len(positions) != len(colors):
+        raise ValueError('Positions and colors must have the same length.')
+    buffer = array('d')
+    for position, color in zip(positions, colors):
+        buffer.append(_clamp_position(position))
+        buffer.extend(_parse_color(color))
+    return buffer
+
+
+def _pack_analytic_stops(stops) -> tuple:
+    # note: Kivy uploads a flat list as a float array and lists of lists
+    # as vec4 arrays, and integer values as int arrays, so convert
+    # everything to float
+    positions = [0.0] * MAX_ANALYTIC_STOPS
+    colors = [[0.0, 0.0, 0.0, 0.0]] * MAX_ANALYTIC_STOPS
+    for i, (position, *color) in enumerate(stops):
+        positions[i] = float(position)
+        colors[i] = [float(c) for c in color]
+    return positions, colors
+
+
+def _pad_mesh(mesh: list) -> list:
+    # Adds the color stops at 0.0 and 1.0 to the flat list of the sorted
+    # color stops, so the ramp is covered from edge to edge.
+    if len(mesh) == 5:
+        color = mesh[1:]
+        return [0.0, *color, 1.0, *color]
+    if mesh[0] != 0.0:
+        mesh[0:0] = [0.0, *mesh[1:5]]
+    if mesh[-5] != 1.0:
+        mesh.extend([1.0, *mesh[-4:]])
+    return mesh
+
+
 class GradientBase(AnchorLayout):
     '''
     Base class for linear and radial gradients. Do not use it directly; use
@@ -111,78 +759,409 @@ class GradientBase(AnchorLayout):
 
     _1d_gradient_texture = ObjectProperty()
 
-    color_stops = ListProperty()
+    # properties (except color_stops) animated by GradientAnimation
+    _animated_properties = ()
+
+    _color_stop_list = ListProperty()
+
+    def _get_color_stops(self):
+        stops = self._color_stop_array
+        return self._color_stop_list if stops is None else stops
+
+    def _set_color_stops(self, value):
+        if isinstance(value, ColorStopArray):
+            if value is self._color_stop_array:
+                return False
+            self._color_stop_array = value
+            return True
+        stops_array = self._color_stop_array
+        self._color_stop_array = None
+        stops = self._color_stop_list
+        self._color_stop_list = [] if value is None else value
+        # the list property dispatches the change itself, unless
+        # the new list is equal to the old one
+        return stops_array is not None and self._color_stop_list is stops
+
+    color_stops = AliasProperty(
+        _get_color_stops, _set_color_stops, bind=('_color_stop_list', )
+    )
     '''
-    List of :class:`ColorStop` objects, describes how the gradient will look.
-    If the list is empty, the gradient will be completely white.
+    List of :class:`ColorStop` objects or a :class:`ColorStopArray`,
+    describes how the gradient will look. If it's empty, the gradient will
+    be completely white.
 
-    .. warning::
-        bouquet gradients supports up to 1024 color stops.
+    Changes of the list and its color stops are merged, so the gradient
+    texture is rebuilt at most once per frame. The number of color stops
+    isn't limited; ramps with more than
+    :data:`~bouquet.gradients.ramp.MAX_FBO_RAMP_STOPS` color stops are
+    computed on the CPU.
 
-    :raises ValueError: If the list length is greater than 1024.
     :raises TypeError: If the list contains anything other than
         :class:`ColorStop` objects.
 
-    :attr:`color_stops` is a :class:`~kivy.properties.ListProperty`
-    and is empty by default.
+    :attr:`color_stops` is an :class:`~kivy.properties.AliasProperty`
+    and is an empty list by default.
+    '''
+
+    ramp_engine = OptionProperty(
+        'default', options=('default', ) + RAMP_ENGINES
+    )
+    '''
+    Engine used to bake the 1D gradient texture:
+
+    - `'fbo'` renders the texture on the GPU;
+
+    - `'cpu'` computes the texture on the CPU (with NumPy if it's installed)
+      and uploads it to the GPU. The result doesn't depend on the driver;
+
+    - `'default'` uses the engine set by
+      :func:`~bouquet.gradients.ramp.set_default_ramp_engine`.
+
+    :attr:`ramp_engine` is an :class:`~kivy.properties.OptionProperty`
+    and defaults to `'default'`.
+    '''
+
+    ramp_storage = OptionProperty(
+        'private', options=('private', 'shared', 'atlas')
+    )
+    '''
+    Where the 1D gradient texture is stored:
+
+    - `'private'` - the gradient has its own texture;
+
+    - `'shared'` - gradients with the same color stops share one texture
+      from :data:`~bouquet.gradients.ramp.ramp_registry`. It's a good choice
+      when many gradients use the same palettes;
+
+    - `'atlas'` - the gradient uses a row of the shared
+      :data:`~bouquet.gradients.ramp.ramp_atlas` texture. Gradients with
+      the same color stops share the row. This reduces texture binds and GPU
+      memory when many gradients are displayed. The row is always computed
+      on the CPU and has the default width, :attr:`ramp_engine` and
+      :attr:`ramp_resolution` are ignored. If the atlas is full, the gradient
+      falls back to a private texture.
+
+    :attr:`ramp_storage` is an :class:`~kivy.properties.OptionProperty`
+    and defaults to `'private'`.
+    '''
+
+    max_analytic_stops = BoundedNumericProperty(
+        MAX_ANALYTIC_STOPS, min=0, max=MAX_ANALYTIC_STOPS
+    )
+    '''
+    Gradients with up to :attr:`max_analytic_stops` color stops don't use
+    the 1D gradient texture at all: the color stops are passed to the shader
+    and interpolated there. Changing such color stops is a cheap uniform
+    update. More color stops are baked into the texture. Set it to `0`
+    to always use the texture.
+
+    :attr:`max_analytic_stops` is a
+    :class:`~kivy.properties.BoundedNumericProperty` and defaults to `8`.
+    '''
+
+    ramp_resolution = BoundedNumericProperty(
+        RAMP_WIDTH, min=2, max=MAX_RAMP_WIDTH
+    )
+    '''
+    Width of the 1D gradient texture in texels. Smaller ramps (e.g. `256`)
+    save GPU memory in lists of small gradients; larger ones (e.g. `4096`)
+    remove banding of large backgrounds on high-resolution displays and keep
+    the details of dense colormaps. The value must not exceed the maximum
+    texture size of the device.
+
+    :attr:`ramp_resolution` is a
+    :class:`~kivy.properties.BoundedNumericProperty` and defaults to `1024`.
     '''
 
     def __init__(self, **kwargs):
+        ensure_gl_context()
+        self._trigger_update_mesh = \
+            rebake_scheduler.create_trigger(self._update_mesh)
+        self._color_stop_array = None
+        self._bound_stops = set()
+        # cache of the sorted color stops, see _get_stops_mesh()
+        self._sorted_stops = None
+        self._stops_mesh = []
+        self._stop_indices = {}
+        self._changed_stops = set()
+        self._ramp_span = None
+        # running GradientAnimation and its (keyframe, next keyframe)
+        self._animation = None
+        self._keyframes = None
         self.fbind('color_stops', self._on_color_stops)
+        self.fbind('ramp_engine', self._trigger_update_mesh)
+        self.fbind('ramp_storage', self._trigger_update_mesh)
+        self.fbind('max_analytic_stops', self._trigger_update_mesh)
+        self.fbind('ramp_resolution', self._trigger_update_mesh)
 
         self._default_texture = Texture.create(size=(1, 1))
         self._default_texture.blit_buffer(b'\xff\xff\xff\xff')
         self._1d_gradient_texture = self._default_texture
+        self._ramp = None
+        self._shared_ramp = None
+        self._atlas_row = None
+        self._set_ramp_coord(0.5)
+        self._set_analytic_stops(())
+        self._set_animation_time(0.0)
 
         super(AnchorLayout, self).__init__(**kwargs)
 
+    def release_resources(self):
+        '''
+        Frees the gradient texture and shows the default (white) texture.
+        The FBO of the texture is given back to
+        :data:`~bouquet.gradients.ramp.ramp_fbo_pool`. Call it when the
+        widget isn't used anymore. The texture is created again on the next
+        :attr:`color_stops` change.
+        '''
+        self._trigger_update_mesh.cancel()
+        self._release_ramps()
+        self._1d_gradient_texture = self._default_texture
+        self._set_ramp_coord(0.5)
+
+    def _release_ramps(self):
+        if self._ramp is not None:
+            release_ramp(self._ramp)
+            self._ramp = None
+        if self._shared_ramp is not None:
+            ramp_registry.release(*self._shared_ramp)
+            self._shared_ramp = None
+        if self._atlas_row is not None:
+            ramp_atlas.release(self._atlas_row)
+            self._atlas_row = None
+
+    def _set_ramp_coord(self, value):
+        # vertical texture coordinate of the ramp, used by the shaders
+        canvas = self.canvas
+        if isinstance(canvas, RenderContext):
+            canvas['gradientRow'] = value
+
+    def _set_analytic_stops(self, stops, next_stops=None) -> bool:
+        # Passes the sorted color stops to the shader. An empty sequence
+        # switches the shader to the 1D gradient texture. `next_stops` are
+        # the color stops of the next keyframe of GradientAnimation,
+        # the same number of them.
+        canvas = self.canvas
+        if not isinstance(canvas, RenderContext):
+            return False
+        canvas['gradientStopCount'] = len(stops)
+        positions, colors = _pack_analytic_stops(stops)
+        canvas['gradientStopPositions'] = positions
+        canvas['gradientStopColors'] = colors
+        if next_stops is not None:
+            positions, colors = _pack_analytic_stops(next_stops)
+            canvas['gradientNextStopPositions'] = positions
+            canvas['gradientNextStopColors'] = colors
+        return True
+
+    def _set_animation_time(self, value):
+        # progress between the keyframes of GradientAnimation, the shaders
+        # interpolate the keyframes with it
+        canvas = self.canvas
+        if isinstance(canvas, RenderContext):
+            canvas['gradientTime'] = value
+
+    def _set_keyframes(self, keyframes):
+        # Shows the `(keyframe, next keyframe)` pair of GradientAnimation
+        # instead of the properties of the widget; None shows the properties
+        # again. Subclasses upload the uniforms of their own properties.
+        self._keyframes = keyframes
+        if keyframes is None:
+            self._set_animation_time(0.0)
+            self._trigger_update_mesh.cancel()
+            self._update_mesh()
+        else:
+            keyframe, next_keyframe = keyframes
+            self._trigger_update_mesh.cancel()
+            self._set_analytic_stops(
+                keyframe['color_stops'], next_keyframe['color_stops']
+            )
+
+    def _get_keyframe_values(self, name) -> tuple:
+        # Returns the values of the property in the current and the next
+        # keyframe of GradientAnimation, or its value twice.
+        keyframes = self._keyframes
+        if keyframes is None:
+            value = getattr(self, name)
+            return value, value
+        return keyframes[0][name], keyframes[1][name]
+
     def _on_color_stops(self, widget, stops):
-        if len(stops) > 1024:
-            raise ValueError('More than 1024 color stops is not supported.')
-        callback = widget._update_mesh
-        for s in stops:
-            if isinstance(s, ColorStop):
-                s.bind(color=callback, position=callback)
+        if isinstance(stops, ColorStopArray):
+            new_stops = {stops}
+        else:
+            for s in stops:
+                if not isinstance(s, ColorStop):
+                    c = s.__class__.__name__
+                    raise TypeError(
+                        f'Expected ColorStop object, got {c} instead.'
+                    )
+            new_stops = set(stops)
+
+        # only the added color stops are bound and the removed ones are
+        # unbound, so the color stops shared with other widgets don't
+        # update this widget anymore
+        bound_stops = self._bound_stops
+        for stop in bound_stops - new_stops:
+            self._bind_color_stop(stop, unbind=True)
+        for stop in new_stops - bound_stops:
+            self._bind_color_stop(stop)
+        self._bound_stops = new_stops
+        self._sorted_stops = None
+        self._changed_stops.clear()
+        self._trigger_update_mesh()
+
+    def _bind_color_stop(self, stop, unbind=False):
+        if isinstance(stop, ColorStopArray):
+            bind = stop.funbind if unbind else stop.fbind
+            bind('on_change', self._trigger_update_mesh)
+        else:
+            # weak references, so shared color stops don't keep the widget
+            bind = stop.unbind if unbind else stop.bind
+            bind(
+                color=self._on_color_stop_changed,
+                position=self._on_color_stop_changed
+            )
+
+    def _on_color_stop_changed(self, stop, value):
+        self._changed_stops.add(stop)
+        self._trigger_update_mesh()
+
+    def _get_stops_mesh(self):
+        # Returns the flat list of `(position, r, g, b, a)` values of
+        # the sorted color stops and the `(start, end)` positions of the part
+        # of the gradient changed since the previous call (None if all of it
+        # could change). The list is kept between the updates, so only
+        # the values of the changed color stops are replaced; the color stops
+        # are sorted again only if they aren't in order anymore.
+        mesh = self._stops_mesh
+        changed, self._changed_stops = self._changed_stops, set()
+        span = None
+        if self._sorted_stops is not None and changed:
+            indices = self._stop_indices
+            changed = [i * 5 for stop in changed for i in indices[stop]]
+            for i in changed:
+                mesh[i:i + 5] = self._sorted_stops[i // 5]._data
+            last = len(mesh) - 5
+            start, end = 1.0, 0.0
+            for i in changed:
+                position = mesh[i]
+                # equal positions are sorted again too, their order
+                # depends on the order in the list
+                if i and mesh[i - 5] >= position \
+                        or i < last and mesh[i + 5] <= position:
+                    self._sorted_stops = None
+                    break
+                # the neighbours limit the changed part of the gradient
+                start = min(start, mesh[i - 5] if i else 0.0)
+                end = max(end, mesh[i + 5] if i < last else 1.0)
             else:
-                c = s.__class__.__name__
-                raise TypeError(f'Expected ColorStop object, got {c} instead.')
-        callback()
+                span = start, end
+
+        if self._sorted_stops is None:
+            stops = sorted(self.color_stops, key=lambda stop: stop.position)
+            mesh = self._stops_mesh = [i for s in stops for i in s._data]
+            indices = self._stop_indices = {}
+            for i, stop in enumerate(stops):
+                indices.setdefault(stop, []).append(i)
+            self._sorted_stops = stops
+        return mesh, span
 
+    def _flush_update_mesh(self):
+        # Rebuilds the pending gradient texture immediately.
+        trigger = self._trigger_update_mesh
+        if trigger.is_triggered:
+            trigger.cancel()
+            self._update_mesh()
+
+    @timed('update_mesh')
     def _update_mesh(self, *args):
-        stops = sorted(self.color_stops, key=lambda stop: stop.position)
+        if self._keyframes is not None:
+            # the animation shows its own color stops
+            return
+        stops = self.color_stops
+        is_array = isinstance(stops, ColorStopArray)
+        if is_array:
+            count = len(stops)
+        else:
+            mesh, span = self._get_stops_mesh()
+            count = len(mesh) // 5
 
-        if not stops:
+        if not count:
+            self._release_ramps()
             self._1d_gradient_texture = self._default_texture
+            self._set_ramp_coord(0.5)
+            self._set_analytic_stops(())
             return
-        elif len(stops) == 1:
-            color = stops[0].color
-            stops = [
-                ColorStop(position=0.0, color=color),
-                ColorStop(position=1.0, color=color)
-            ]
+        elif count <= self.max_analytic_stops:
+            if is_array:
+                data = stops._sorted_data()
+            else:
+                data = [mesh[i:i + 5] for i in range(0, len(mesh), 5)]
+            if self._set_analytic_stops(data):
+                self._release_ramps()
+                self._1d_gradient_texture = self._default_texture
+                return
+
+        self._set_analytic_stops(())
+        # the cached list of the color stops isn't modified
+        if is_array:
+            mesh, span = stops._mesh(), None
         else:
-            first_stop = stops[0]
-            if first_stop.position != 0.0:
-                stops.insert(0, ColorStop(position=0.0, color=first_stop.color))
+            mesh = _pad_mesh(mesh[:])
 
-            last_stop = stops[-1]
-            if last_stop.position != 1.0:
-                stops.append(ColorStop(position=1.0, color=last_stop.color))
+        # new ramps are acquired before releasing the old ones,
+        # so the same ramp isn't computed again
+        storage = self.ramp_storage
+        if storage == 'atlas':
+            row = ramp_atlas.acquire(mesh)
+            if row is not None:
+                self._release_ramps()
+                self._atlas_row = row
+                self._1d_gradient_texture = ramp_atlas.texture
+                self._set_ramp_coord(ramp_atlas.row_coord(row))
+                return
+        elif storage == 'shared':
+            key = tuple(mesh), int(self.ramp_resolution)
+            texture = ramp_registry.acquire(
+                key[0], self._get_ramp_engine(mesh), key[1]
+            )
+            self._release_ramps()
+            self._shared_ramp = key
+            self._1d_gradient_texture = texture
+            self._set_ramp_coord(0.5)
+            return
 
-        mesh = [i for stop in stops for i in stop._data]
+        if self._ramp is None:
+            # the shared or the atlas ramp was used before
+            self._release_ramps()
+        self._set_ramp_coord(0.5)
+        self._ramp_span = span
+        texture = self._render_texture(mesh)
+        if texture is self._1d_gradient_texture:
+            # the texture was updated in place
+            self.canvas.ask_update()
+        self._1d_gradient_texture = texture
 
-        self._1d_gradient_texture = self._render_texture(mesh)
+    def _get_ramp_engine(self, mesh) -> str:
+        if len(mesh) > MAX_FBO_RAMP_STOPS * 5:
+            return 'cpu'
+        engine = self.ramp_engine
+        if engine == 'default':
+            engine = get_default_ramp_engine()
+        return engine
 
+    @timed('bake_ramp')
     def _render_texture(self, mesh) -> Texture:
-        fbo = Fbo(size=(1024, 1), vs=FBO_VERTEX_SHADER, fs=FBO_FRAGMENT_SHADER)
-        with fbo:
-            Callback(enable_copy_blending)
-            Mesh(
-                vertices=mesh,
-                indices=tuple(range(len(mesh) // 5)),
-                mode='line_strip',
-                fmt=[(b'vertexPos', 1, 'float'), (b'vertexColor', 4, 'float')]
-            )
-            Callback(disable_copy_blending)
-        fbo.draw()
-        return fbo.texture
+        # only the part of the gradient changed since the previous call
+        # (_ramp_span) is updated by the CPU ramps
+        span, self._ramp_span = self._ramp_span, None
+        engine = self._get_ramp_engine(mesh)
+        width = int(self.ramp_resolution)
+        ramp = self._ramp
+        if ramp is None or ramp.engine != engine or ramp.width != width:
+            if ramp is not None:
+                release_ramp(ramp)
+            ramp = self._ramp = create_ramp(engine, width)
+            span = None
+        return ramp.render(mesh, span)
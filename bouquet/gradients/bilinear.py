@@ -4,18 +4,12 @@ Base module for bilinear gradient.
 
 __all__ = ('BilinearGradient', )
 
-from kivy.lang import Builder
-from kivy.factory import Factory
-from kivy.graphics import Callback, RenderContext
-from kivy.graphics.fbo import Fbo
 from kivy.graphics.texture import Texture
 from kivy.properties import ColorProperty
 from kivy.uix.anchorlayout import AnchorLayout
 
-# Make sure that OpenGL context is created
-import kivy.core.window
-
-from .base import enable_copy_blending, disable_copy_blending
+from .base import create_render_context, load_kv_rule, \
+                  render_gradient_texture, render_gradient_pixels
 
 
 KV = '''
@@ -89,27 +83,42 @@ class BilinearGradient(AnchorLayout):
     '''
 
     @staticmethod
-    def render_texture(**kwargs) -> Texture:
+    def render_texture(target=None, **kwargs) -> Texture:
+        '''
+        Renders gradient at FBO and returns the texture. If
+        :data:`~bouquet.gradients.cache.texture_cache` is enabled, identical
+        requests return the same texture from it, so don't modify it.
+
+        :param target:
+            :class:`~kivy.graphics.fbo.Fbo` or
+            :class:`~kivy.graphics.texture.Texture` to update in place
+            instead of creating a new texture, e.g. on resize. See
+            :func:`~bouquet.gradients.base.render_gradient_texture`.
+        :param kwargs:
+            Any :class:`BilinearGradient` properties.
         '''
-        Renders gradient at FBO and returns the texture.
+        return render_gradient_texture(BilinearGradient, kwargs, target)
 
+    @staticmethod
+    def render_pixels(buffer=None, **kwargs):
+        '''
+        Renders gradient and reads its RGBA pixels back into `buffer`, which
+        can be reused across calls. See
+        :func:`~bouquet.gradients.base.render_gradient_pixels`.
+
+        :param buffer:
+            Writable buffer (e.g. `bytearray` or NumPy array) of
+            `width * height * 4` bytes. By default, a new `bytearray`
+            is created.
         :param kwargs:
             Any :class:`BilinearGradient` properties.
         '''
-        width = kwargs.pop('width', 100)
-        height = kwargs.pop('height', 100)
-        width, height = kwargs.pop('size', (width, height))
-
-        fbo = Fbo(size=(width, height))
-        with fbo:
-            Callback(enable_copy_blending)
-            BilinearGradient(size=(width, height), **kwargs).canvas
-            Callback(disable_copy_blending)
-        fbo.draw()
-        return fbo.texture
+        return render_gradient_pixels(BilinearGradient, kwargs, buffer)
 
     def __init__(self, **kwargs):
-        self.canvas = RenderContext(
+        load_kv_rule('BilinearGradient', KV)
+        self.canvas = create_render_context(
+            self.__class__,
             fs=FRAGMENT_SHADER,
             use_parent_projection=True,
             use_parent_modelview=True,
@@ -134,7 +143,3 @@ class BilinearGradient(AnchorLayout):
     def _set_color(self, widget, value, uniform_name=None):
         if uniform_name is not None:
             widget.canvas[uniform_name] = tuple(value)
-
-
-Builder.load_string(KV)
-Factory.register('BilinearGradient', cls=BilinearGradient)
@@ -0,0 +1,346 @@
+'''
+Caches for textures baked by the ``***Gradient.render_texture()`` functions.
+'''
+
+__all__ = ('TextureCache', 'texture_cache', 'DiskCache', 'disk_cache')
+
+import os
+import mmap
+from hashlib import sha256
+from collections import OrderedDict
+from tempfile import NamedTemporaryFile
+
+from .. import __version__
+
+
+class TextureCache:
+    '''
+    Keeps recently baked gradient textures, so identical
+    ``render_texture()`` requests return the same
+    :class:`~kivy.graphics.texture.Texture` instead of rendering it again.
+
+    Textures are evicted in least recently used order once the total size of
+    the cached textures exceeds :attr:`max_bytes`.
+
+    .. warning::
+        Cached textures are shared between all callers, so don't modify
+        them (e.g. with :meth:`~kivy.graphics.texture.Texture.blit_buffer`).
+
+    :param max_bytes:
+        Byte budget of the cache. Set it to `0` to disable caching.
+    '''
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self._entries = OrderedDict()
+        self._max_bytes = max_bytes
+        self.size_bytes = 0
+        '''Total size of the cached textures in bytes.'''
+        self.hits = 0
+        '''Number of requests served from the cache.'''
+        self.misses = 0
+        '''Number of requests that required rendering a texture.'''
+        self.evictions = 0
+        '''Number of textures evicted because of the byte budget.'''
+
+    @property
+    def max_bytes(self) -> int:
+        '''
+        Byte budget of the cache. Lowering the budget evicts textures
+        immediately.
+        '''
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int):
+        if value < 0:
+            raise ValueError('Byte budget can not be negative.')
+        self._max_bytes = value
+        self._trim()
+
+    @staticmethod
+    def texture_bytes(texture) -> int:
+        '''
+        Returns size of the RGBA texture in bytes.
+        '''
+        return texture.width * texture.height * 4
+
+    def get(self, key):
+        '''
+        Returns the cached texture for `key` or `None`.
+        '''
+        texture = self._entries.get(key)
+        if texture is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return texture
+
+    def put(self, key, texture):
+        '''
+        Adds the texture to the cache. Textures larger than
+        :attr:`max_bytes` are not cached.
+        '''
+        size = self.texture_bytes(texture)
+        if size > self._max_bytes:
+            return
+        old_texture = self._entries.pop(key, None)
+        if old_texture is not None:
+            self.size_bytes -= self.texture_bytes(old_texture)
+        self._entries[key] = texture
+        self.size_bytes += size
+        self._trim()
+
+    def discard(self, texture) -> bool:
+        '''
+        Removes the texture from the cache, e.g. before it's modified.
+        Returns `False` if it isn't cached.
+        '''
+        for key, cached_texture in self._entries.items():
+            if cached_texture is texture:
+                del self._entries[key]
+                self.size_bytes -= self.texture_bytes(texture)
+                return True
+        return False
+
+    def clear(self):
+        '''
+        Removes all textures from the cache. Counters are not reset.
+        '''
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def reset_stats(self):
+        '''
+        Resets :attr:`hits`, :attr:`misses` and :attr:`evictions` counters.
+        '''
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        '''
+        Returns a snapshot of the cache counters.
+        '''
+        return {
+            'entries': len(self._entries),
+            'size_bytes': self.size_bytes,
+            'max_bytes': self._max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def _trim(self):
+        entries = self._entries
+        while entries and self.size_bytes > self._max_bytes:
+            _, texture = entries.popitem(last=False)
+            self.size_bytes -= self.texture_bytes(texture)
+            self.evictions += 1
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+texture_cache = TextureCache(max_bytes=0)
+'''
+Global :class:`TextureCache` instance used by
+the ``***Gradient.render_texture()`` functions. It's disabled by default,
+since the cached textures are shared between the callers; set its
+:attr:`~TextureCache.max_bytes` to enable it.
+'''
+
+
+class DiskCache:
+    '''
+    Keeps the pixels of baked gradient textures as raw RGBA files, so
+    the gradients aren't rendered again on the next launch of the app.
+    The files are memory-mapped and uploaded to the texture with
+    :meth:`~kivy.graphics.texture.Texture.blit_buffer`.
+
+    Files are named after a hash of the gradient class, its properties and
+    the bouquet version, so new versions don't use stale pixels. Least
+    recently used files are removed once the total size of the files exceeds
+    :attr:`max_bytes`.
+
+    :param directory:
+        Directory for the files, e.g. a subdirectory of
+        :attr:`~kivy.app.App.user_data_dir`. `None` disables the cache.
+    :param max_bytes:
+        Byte budget of the cache.
+    '''
+
+    extension = '.rgba'
+
+    def __init__(self, directory: str = None,
+                 max_bytes: int = 256 * 1024 * 1024):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._entries = None    # file name -> size, in LRU order
+        self.size_bytes = 0
+        '''Total size of the cached files in bytes.'''
+        self.hits = 0
+        '''Number of requests served from the disk.'''
+        self.misses = 0
+        '''Number of requests that required rendering a texture.'''
+        self.evictions = 0
+        '''Number of files removed because of the byte budget.'''
+
+    @property
+    def directory(self) -> str:
+        '''
+        Directory for the cached files. It's created on the first write.
+        `None` disables the cache.
+        '''
+        return self._directory
+
+    @directory.setter
+    def directory(self, value: str):
+        self._directory = value
+        self._entries = None
+        self.size_bytes = 0
+
+    @property
+    def max_bytes(self) -> int:
+        '''
+        Byte budget of the cache. Lowering the budget removes files
+        immediately.
+        '''
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int):
+        if value < 0:
+            raise ValueError('Byte budget can not be negative.')
+        self._max_bytes = value
+        if self._directory is not None:
+            self._trim()
+
+    @staticmethod
+    def digest(key) -> str:
+        '''
+        Returns the content hash of the hashable texture key.
+        '''
+        return sha256(repr((__version__, key)).encode()).hexdigest()
+
+    def get(self, key, nbytes: int):
+        '''
+        Returns the memory-mapped pixels for `key` or `None`, if there is no
+        file of `nbytes` size. Close the returned :class:`mmap.mmap` after
+        uploading the pixels.
+        '''
+        name = self.digest(key) + self.extension
+        entries = self._load_entries()
+        if entries.get(name) != nbytes:
+            self.misses += 1
+            return None
+        path = os.path.join(self._directory, name)
+        try:
+            with open(path, 'rb') as cache_file:
+                # copy-on-write mapping, because Texture.blit_buffer()
+                # accepts only writable buffers
+                pixels = mmap.mmap(
+                    cache_file.fileno(), 0, access=mmap.ACCESS_COPY
+                )
+            # the modification time keeps the LRU order between launches
+            os.utime(path)
+        except OSError:
+            self._remove(name)
+            self.misses += 1
+            return None
+        entries.move_to_end(name)
+        self.hits += 1
+        return pixels
+
+    def put(self, key, pixels: bytes):
+        '''
+        Writes the pixels to the file of `key`. Pixels larger than
+        :attr:`max_bytes` are not cached.
+        '''
+        size = len(pixels)
+        if self._directory is None or size > self._max_bytes:
+            return
+        entries = self._load_entries()
+        name = self.digest(key) + self.extension
+        os.makedirs(self._directory, exist_ok=True)
+        # write to a temporary file first, so other processes never read
+        # incomplete pixels
+        with NamedTemporaryFile(
+            dir=self._directory, suffix='.tmp', delete=False
+        ) as cache_file:
+            cache_file.write(pixels)
+        os.replace(cache_file.name, os.path.join(self._directory, name))
+        self.size_bytes -= entries.pop(name, 0)
+        entries[name] = size
+        self.size_bytes += size
+        self._trim()
+
+    def clear(self):
+        '''
+        Removes all cached files. Counters are not reset.
+        '''
+        for name in list(self._load_entries()):
+            self._remove(name)
+
+    def reset_stats(self):
+        '''
+        Resets :attr:`hits`, :attr:`misses` and :attr:`evictions` counters.
+        '''
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        '''
+        Returns a snapshot of the cache counters.
+        '''
+        return {
+            'entries': len(self._load_entries()),
+            'size_bytes': self.size_bytes,
+            'max_bytes': self._max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def _load_entries(self) -> OrderedDict:
+        entries = self._entries
+        if entries is not None:
+            return entries
+        files = []
+        if self._directory is not None and os.path.isdir(self._directory):
+            for entry in os.scandir(self._directory):
+                if entry.name.endswith(self.extension) and entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name, stat.st_size))
+        files.sort()
+        entries = self._entries = OrderedDict(
+            (name, size) for _, name, size in files
+        )
+        self.size_bytes = sum(entries.values())
+        return entries
+
+    def _remove(self, name: str):
+        self.size_bytes -= self._entries.pop(name, 0)
+        try:
+            os.remove(os.path.join(self._directory, name))
+        except OSError:
+            pass
+
+    def _trim(self):
+        entries = self._load_entries()
+        while entries and self.size_bytes > self._max_bytes:
+            self._remove(next(iter(entries)))
+            self.evictions += 1
+
+    def __contains__(self, key) -> bool:
+        return self.digest(key) + self.extension in self._load_entries()
+
+    def __len__(self) -> int:
+        return len(self._load_entries())
+
+
+disk_cache = DiskCache()
+'''
+Global :class:`DiskCache` instance used by the ``***Gradient.render_texture()``
+functions. It's disabled until :attr:`DiskCache.directory` is set.
+'''
@@ -4,18 +4,14 @@ Base module for conical gradient.
 
 __all__ = ('ConicalGradient', )
 
-from kivy.lang import Builder
-from kivy.factory import Factory
-from kivy.graphics import Callback, RenderContext
-from kivy.graphics.fbo import Fbo
 from kivy.graphics.texture import Texture
 from kivy.graphics.transformation import Matrix
 from kivy.properties import NumericProperty, ReferenceListProperty
 
-# Make sure that OpenGL context is created
-import kivy.core.window
-
-from .base import GradientBase, enable_copy_blending, disable_copy_blending
+from .base import GradientBase, GRADIENT_COLOR_FUNCTION, \
+                  create_render_context, load_kv_rule, \
+                  render_gradient_texture, render_gradient_pixels
+from .scheduler import rebake_scheduler
 
 
 KV = '''
@@ -35,11 +31,20 @@ KV = '''
 VERTEX_SHADER = '''
 $HEADER$
 
-uniform mat4 gradientMatrix;
+// current and next keyframe
+uniform mat4  gradientMatrix;
+uniform mat4  gradientNextMatrix;
+uniform float gradientTime;
 
 void main() {
     frag_color = color * vec4(1.0, 1.0, 1.0, opacity);
-    tex_coord0 = (gradientMatrix * vec4(vTexCoords0 * 2.0 - 1.0, 0.0, 1.0)).xy;
+    vec4 position = vec4(vTexCoords0 * 2.0 - 1.0, 0.0, 1.0);
+    // the matrices are linear in the center, so mixing the results is
+    // the same as mixing the centers
+    tex_coord0 = mix(
+        (gradientMatrix * position).xy, (gradientNextMatrix * position).xy,
+        gradientTime
+    );
     gl_Position = projection_mat * modelview_mat * vec4(vPosition, 0.0, 1.0);
 }
 '''
@@ -47,12 +52,10 @@ void main() {
 
 FRAGMENT_SHADER = '''
 $HEADER$
-
-uniform sampler2D gradientTexture;
-
+''' + GRADIENT_COLOR_FUNCTION + '''
 void main() {
     float result = atan(-tex_coord0.y, -tex_coord0.x) * 0.159154943091884 + 0.5;
-    gl_FragColor = frag_color * texture(gradientTexture, vec2(result, 0.5));
+    gl_FragColor = frag_color * gradientColor(result);
 }
 '''
 
@@ -95,28 +98,45 @@ class ConicalGradient(GradientBase):
     (:attr:`gradient_center_x`, :attr:`gradient_center_y`) properties.
     '''
 
+    _animated_properties = ('gradient_center_pos', )
+
     @staticmethod
-    def render_texture(**kwargs) -> Texture:
+    def render_texture(target=None, **kwargs) -> Texture:
+        '''
+        Renders gradient at FBO and returns the texture. If
+        :data:`~bouquet.gradients.cache.texture_cache` is enabled, identical
+        requests return the same texture from it, so don't modify it.
+
+        :param target:
+            :class:`~kivy.graphics.fbo.Fbo` or
+            :class:`~kivy.graphics.texture.Texture` to update in place
+            instead of creating a new texture, e.g. on resize. See
+            :func:`~bouquet.gradients.base.render_gradient_texture`.
+        :param kwargs:
+            Any :class:`ConicalGradient` properties.
         '''
-        Renders gradient at FBO and returns the texture.
+        return render_gradient_texture(ConicalGradient, kwargs, target)
 
+    @staticmethod
+    def render_pixels(buffer=None, **kwargs):
+        '''
+        Renders gradient and reads its RGBA pixels back into `buffer`, which
+        can be reused across calls. See
+        :func:`~bouquet.gradients.base.render_gradient_pixels`.
+
+        :param buffer:
+            Writable buffer (e.g. `bytearray` or NumPy array) of
+            `width * height * 4` bytes. By default, a new `bytearray`
+            is created.
         :param kwargs:
             Any :class:`ConicalGradient` properties.
         '''
-        width = kwargs.pop('width', 100)
-        height = kwargs.pop('height', 100)
-        width, height = kwargs.pop('size', (width, height))
-
-        fbo = Fbo(size=(width, height))
-        with fbo:
-            Callback(enable_copy_blending)
-            ConicalGradient(size=(width, height), **kwargs).canvas
-            Callback(disable_copy_blending)
-        fbo.draw()
-        return fbo.texture
+        return render_gradient_pixels(ConicalGradient, kwargs, buffer)
 
     def __init__(self, **kwargs):
-        self.canvas = RenderContext(
+        load_kv_rule('ConicalGradient', KV)
+        self.canvas = create_render_context(
+            self.__class__,
             vs=VERTEX_SHADER,
             fs=FRAGMENT_SHADER,
             use_parent_projection=True,
@@ -124,22 +144,30 @@ class ConicalGradient(GradientBase):
             use_parent_frag_modelview=True
         )
         self.canvas['gradientTexture'] = 1
-        self.fbind('size',                self._update_gradient_matrix)
-        self.fbind('gradient_center_pos', self._update_gradient_matrix)
+        trigger = self._trigger_update_gradient_matrix = \
+            rebake_scheduler.create_trigger(self._update_gradient_matrix)
+        self.fbind('size',                trigger)
+        self.fbind('gradient_center_pos', trigger)
         super(ConicalGradient, self).__init__(**kwargs)
 
-    def _update_gradient_matrix(self, _, __):
+    def _set_keyframes(self, keyframes):
+        super(ConicalGradient, self)._set_keyframes(keyframes)
+        self._trigger_update_gradient_matrix.cancel()
+        self._update_gradient_matrix()
+
+    def _update_gradient_matrix(self, *args):
+        centers = self._get_keyframe_values('gradient_center_pos')
+        canvas = self.canvas
+        canvas['gradientMatrix'] = self._get_gradient_matrix(centers[0])
+        canvas['gradientNextMatrix'] = self._get_gradient_matrix(centers[1])
+
+    def _get_gradient_matrix(self, center) -> Matrix:
         scale = self.width / self.height
-        x = self.gradient_center_x * 2.0 - 1.0
-        y = self.gradient_center_y * 2.0 - 1.0
+        x = center[0] * 2.0 - 1.0
+        y = center[1] * 2.0 - 1.0
         x *= scale
 
         matrix = Matrix()
         matrix = matrix.multiply(Matrix().translate(-x, -y, 0.0))
         matrix = matrix.multiply(Matrix().scale(scale, 1.0, 1.0))
-
-        self.canvas['gradientMatrix'] = matrix
-
-
-Builder.load_string(KV)
-Factory.register('ConicalGradient', cls=ConicalGradient)
+        return matrix
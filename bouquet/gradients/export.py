@@ -0,0 +1,294 @@
+'''
+Batch export of gradients to image files.
+
+The spec file is a JSON list of objects or a CSV file with a header. Each
+entry has the gradient ``type`` (e.g. `'linear'` or `'LinearGradient'`), an
+optional file ``name``, the ``size`` (or ``width`` and ``height``) and any
+properties of the gradient. Color stops are written as a list of
+``{"position": 0.0, "color": "red"}`` objects in JSON and as
+``0.0:red;1.0:#ffff00`` in CSV, pairs like ``size`` and
+``gradient_center_pos`` are written as lists in JSON and as ``1280;720``
+in CSV::
+
+    [
+        {"type": "linear", "name": "sunset", "size": [1280, 720],
+         "angle": 45, "color_stops": [
+            {"position": 0.0, "color": "red"},
+            {"position": 1.0, "color": "yellow"}
+         ]},
+        {"type": "bilinear", "width": 256, "height": 256}
+    ]
+
+Run it from the terminal::
+
+    python -m bouquet export spec.json -o build/backgrounds -j 8
+'''
+
+__all__ = (
+    'GRADIENT_TYPES', 'EXPORT_BACKENDS', 'EXPORT_FORMATS',
+    'load_spec', 'export_gradients', 'write_png', 'main'
+)
+
+import os
+import csv
+import json
+import zlib
+import struct
+from importlib import import_module
+from concurrent.futures import ProcessPoolExecutor
+
+
+GRADIENT_TYPES = {
+    'linear': 'LinearGradient',
+    'bilinear': 'BilinearGradient',
+    'radial': 'RadialGradient',
+    'conical': 'ConicalGradient'
+}
+'''Short names of the gradients accepted by the spec files.'''
+
+EXPORT_BACKENDS = ('cpu', 'gl')
+'''
+Rendering backends: `'cpu'` uses :mod:`bouquet.gradients.raster` (requires
+NumPy) and `'gl'` uses ``render_texture()`` with a hidden window per worker.
+'''
+
+EXPORT_FORMATS = ('png', 'rgba')
+'''
+Output formats: PNG images or raw RGBA bytes (rows from top to bottom).
+'''
+
+_INTEGER_FIELDS = (
+    'width', 'height', 'max_analytic_stops', 'ramp_resolution'
+)
+_NUMERIC_FIELDS = (
+    'angle', 'radius', 'gradient_center_x', 'gradient_center_y'
+)
+_PAIR_FIELDS = {'size': int, 'gradient_center_pos': float}
+
+
+def load_spec(path: str) -> list:
+    '''
+    Reads the JSON or CSV spec file and returns the list of entries.
+
+    :raises ValueError: If the spec file is malformed.
+    '''
+    with open(path, newline='') as spec_file:
+        if os.path.splitext(path)[1].lower() == '.csv':
+            entries = [_parse_csv_row(row) for row in csv.DictReader(spec_file)]
+        else:
+            entries = json.load(spec_file)
+    if not isinstance(entries, list):
+        raise ValueError('Spec file must contain a list of gradients.')
+    for entry in entries:
+        _gradient_name(entry)
+    return entries
+
+
+def _parse_csv_row(row: dict) -> dict:
+    entry = {}
+    for key, value in row.items():
+        value = value.strip() if value else ''
+        if not value:
+            continue
+        if key in _INTEGER_FIELDS:
+            value = int(value)
+        elif key in _NUMERIC_FIELDS:
+            value = float(value)
+        elif key in _PAIR_FIELDS:
+            convert = _PAIR_FIELDS[key]
+            value = [convert(item) for item in value.split(';')]
+            if len(value) != 2:
+                raise ValueError(f'Expected two values for {key!r}.')
+        elif key == 'color_stops':
+            value = [
+                {'position': float(position), 'color': color.strip()}
+                for position, _, color in (
+                    stop.partition(':') for stop in value.split(';')
+                )
+            ]
+        entry[key] = value
+    return entry
+
+
+def _gradient_name(entry: dict) -> str:
+    gradient = entry.get('type')
+    name = GRADIENT_TYPES.get(gradient, gradient)
+    if name not in GRADIENT_TYPES.values():
+        raise ValueError(f'Unsupported gradient type: {gradient!r}.')
+    return name
+
+
+def _file_name(index: int, entry: dict, image_format: str) -> str:
+    name = entry.get('name') or f'{index:05d}_{_gradient_name(entry)}'
+    name = str(name)
+    separators = {'/', '\\', os.sep, os.altsep} - {None}
+    if '..' in name or any(s in name for s in separators) \
+            or os.path.splitdrive(name)[0]:
+        raise ValueError(f'Invalid file name: {name!r}.')
+    return f'{name}.{image_format}'
+
+
+def write_png(path: str, pixels: bytes, width: int, height: int):
+    '''
+    Writes RGBA pixels (rows from top to bottom) to the PNG file.
+    '''
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + \
+            struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    stride = width * 4
+    # every row starts with the filter type byte, 0 means no filter
+    raw = b''.join(
+        b'\x00' + pixels[y * stride:(y + 1) * stride] for y in range(height)
+    )
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    with open(path, 'wb') as png_file:
+        png_file.write(b'\x89PNG\r\n\x1a\n')
+        png_file.write(chunk(b'IHDR', header))
+        png_file.write(chunk(b'IDAT', zlib.compress(raw, 6)))
+        png_file.write(chunk(b'IEND', b''))
+
+
+def _init_worker(backend: str):
+    if backend == 'gl':
+        from . import base
+        if not base._gl_context_created:
+            base.use_headless_context()
+        base.ensure_gl_context()
+
+
+def _render_entry(task: tuple) -> str:
+    index, entry, path, backend, image_format = task
+    gradient = _gradient_name(entry)
+    kwargs = {
+        key: value for key, value in entry.items()
+        if key not in ('type', 'name')
+    }
+    if 'size' in kwargs:
+        kwargs['width'], kwargs['height'] = kwargs.pop('size')
+    width = kwargs['width'] = int(kwargs.get('width', 100))
+    height = kwargs['height'] = int(kwargs.get('height', 100))
+    if 'color_stops' in kwargs:
+        from .base import ColorStop
+        kwargs['color_stops'] = [
+            ColorStop(**stop) for stop in kwargs['color_stops']
+        ]
+
+    if backend == 'cpu':
+        from .raster import render_pixels
+        # rows of the array go from bottom to top
+        pixels = render_pixels(gradient, **kwargs)[::-1].tobytes()
+    else:
+        gradient_cls = getattr(import_module(__package__), gradient)
+        pixels = gradient_cls.render_pixels(**kwargs)
+        stride = width * 4
+        pixels = b''.join(
+            pixels[y * stride:(y + 1) * stride]
+            for y in range(height - 1, -1, -1)
+        )
+
+    if image_format == 'png':
+        write_png(path, pixels, width, height)
+    else:
+        with open(path, 'wb') as raw_file:
+            raw_file.write(pixels)
+    return path
+
+
+def export_gradients(entries: list, output_dir: str, backend: str = None,
+                     image_format: str = 'png', workers: int = None) -> list:
+    '''
+    Renders the spec entries to image files and returns their paths.
+
+    :param entries:
+        Gradients to render, see :func:`load_spec`.
+    :param output_dir:
+        Directory for the image files. It's created if it doesn't exist.
+    :param backend:
+        One of :data:`EXPORT_BACKENDS`. Defaults to `'cpu'` if NumPy is
+        installed, otherwise to `'gl'`.
+    :param image_format:
+        One of :data:`EXPORT_FORMATS`.
+    :param workers:
+        Number of worker processes. Defaults to the number of CPUs.
+        With `1`, the gradients are rendered in the current process.
+    :raises ValueError: If the backend or the format is unknown, a file
+        name contains a path separator or `'..'`, or two gradients have
+        the same file name.
+    '''
+    if backend is None:
+        from .raster import numpy
+        backend = 'gl' if numpy is None else 'cpu'
+    if backend not in EXPORT_BACKENDS:
+        raise ValueError(f'Unknown export backend: {backend!r}.')
+    if image_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {image_format!r}.')
+
+    # the names are checked before anything is written, so the files
+    # can't be written outside the directory or overwrite each other
+    file_names = set()
+    tasks = []
+    for index, entry in enumerate(entries):
+        file_name = _file_name(index, entry, image_format)
+        if file_name in file_names:
+            raise ValueError(f'Duplicate file name: {file_name!r}.')
+        file_names.add(file_name)
+        path = os.path.join(output_dir, file_name)
+        tasks.append((index, entry, path, backend, image_format))
+
+    os.makedirs(output_dir, exist_ok=True)
+    if not tasks:
+        return []
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks)))
+    if workers == 1:
+        _init_worker(backend)
+        return [_render_entry(task) for task in tasks]
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(backend, )
+    ) as executor:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        return list(executor.map(_render_entry, tasks, chunksize=chunksize))
+
+
+def main(argv: list = None) -> int:
+    '''
+    Entry point of the ``python -m bouquet export`` command.
+    '''
+    import argparse
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(
+        prog='python -m bouquet export',
+        description='Renders gradients from the spec file to image files.'
+    )
+    parser.add_argument('spec', help='JSON or CSV file with gradients')
+    parser.add_argument(
+        '-o', '--output', default='.', help='output directory'
+    )
+    parser.add_argument(
+        '-f', '--format', choices=EXPORT_FORMATS, default='png',
+        help='image format (default: png)'
+    )
+    parser.add_argument(
+        '-b', '--backend', choices=EXPORT_BACKENDS,
+        help='rendering backend (default: cpu if NumPy is installed)'
+    )
+    parser.add_argument(
+        '-j', '--workers', type=int,
+        help='number of worker processes (default: number of CPUs)'
+    )
+    args = parser.parse_args(argv)
+
+    start = perf_counter()
+    paths = export_gradients(
+        load_spec(args.spec), args.output, backend=args.backend,
+        image_format=args.format, workers=args.workers
+    )
+    print(
+        f'Exported {len(paths)} gradients to {args.output!r} '
+        f'in {perf_counter() - start:.2f} s.'
+    )
+    return 0
@@ -0,0 +1,167 @@
+'''
+Counters and timings of the expensive operations done by the gradients.
+
+Shader compilations are always counted. Other events are recorded only
+after :func:`enable_instrumentation` is called; while it's disabled,
+the instrumented functions cost one extra function call.
+
+Recorded events:
+
+- `'render_texture'`: ``***Gradient.render_texture()`` calls, including
+  the cached ones;
+- `'update_mesh'`: updates of the color stops of the gradient widgets;
+- `'bake_ramp'`: renders of the 1D gradient textures (ramps);
+- `'shader_compile'`: shader compilations;
+- `'fbo_allocation'`: FBO allocations.
+'''
+
+__all__ = (
+    'count_shader_compile', 'shader_compile_stats',
+    'reset_shader_compile_stats', 'enable_instrumentation',
+    'disable_instrumentation', 'instrumentation_enabled', 'record_event',
+    'timed', 'instrumentation_stats', 'reset_instrumentation_stats'
+)
+
+from functools import wraps
+from time import perf_counter
+
+from kivy.logger import Logger
+
+
+_shader_compiles = {}       # owner -> [count, seconds]
+_events = {}                # (event, owner) -> [count, seconds, max seconds]
+_enabled = False
+_log = False
+
+
+def count_shader_compile(owner: str, seconds: float):
+    '''
+    Records a shader compilation.
+
+    :param owner:
+        Name of the class which compiled the shader.
+    :param seconds:
+        Time spent compiling and linking the shader.
+    '''
+    entry = _shader_compiles.get(owner)
+    if entry is None:
+        _shader_compiles[owner] = [1, seconds]
+    else:
+        entry[0] += 1
+        entry[1] += seconds
+    if _enabled:
+        record_event('shader_compile', owner, seconds)
+
+
+def shader_compile_stats() -> dict:
+    '''
+    Returns the number of compiled shaders and the time spent compiling
+    them (in seconds) per class, e.g.
+    ``{'LinearGradient': {'count': 2, 'time': 0.003}}``.
+    '''
+    return {
+        owner: {'count': count, 'time': seconds}
+        for owner, (count, seconds) in _shader_compiles.items()
+    }
+
+
+def reset_shader_compile_stats():
+    '''
+    Resets the shader compilation counters.
+    '''
+    _shader_compiles.clear()
+
+
+def enable_instrumentation(log: bool = False):
+    '''
+    Starts recording the events.
+
+    :param log:
+        Also log every event with Kivy's :data:`~kivy.logger.Logger`.
+    '''
+    global _enabled, _log
+    _enabled = True
+    _log = log
+
+
+def disable_instrumentation():
+    '''
+    Stops recording the events. The recorded stats are kept.
+    '''
+    global _enabled, _log
+    _enabled = _log = False
+
+
+def instrumentation_enabled() -> bool:
+    '''
+    Returns `True` if the events are recorded.
+    '''
+    return _enabled
+
+
+def record_event(event: str, owner: str, seconds: float):
+    '''
+    Records the event, if the instrumentation is enabled.
+
+    :param event:
+        Name of the event, e.g. `'render_texture'`.
+    :param owner:
+        Name of the class which caused the event.
+    :param seconds:
+        Duration of the event.
+    '''
+    if not _enabled:
+        return
+    entry = _events.get((event, owner))
+    if entry is None:
+        _events[event, owner] = [1, seconds, seconds]
+    else:
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+    if _log:
+        Logger.info(f'Bouquet: {event} {owner} {seconds * 1000.0:.3f} ms')
+
+
+def timed(event: str):
+    '''
+    Decorator recording the calls of the function as `event`. The owner is
+    the class of the first argument, or the argument itself if it's
+    a class (e.g. ``render_gradient_texture(gradient_cls, ...)``).
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(owner, *args, **kwargs):
+            if not _enabled:
+                return func(owner, *args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(owner, *args, **kwargs)
+            finally:
+                cls = owner if isinstance(owner, type) else type(owner)
+                record_event(event, cls.__name__, perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def instrumentation_stats() -> dict:
+    '''
+    Returns a snapshot of the recorded events: the number of events,
+    total and maximum time (in seconds) per event and class, e.g.
+    ``{'update_mesh': {'LinearGradient': {'count': 3, 'time': 0.002,
+    'max': 0.001}}}``.
+    '''
+    stats = {}
+    for (event, owner), (count, seconds, max_seconds) in _events.items():
+        stats.setdefault(event, {})[owner] = {
+            'count': count, 'time': seconds, 'max': max_seconds
+        }
+    return stats
+
+
+def reset_instrumentation_stats():
+    '''
+    Removes the recorded events.
+    '''
+    _events.clear()
@@ -4,20 +4,15 @@ Base module for linear gradient.
 
 __all__ = ('LinearGradient', )
 
-from math import sin, cos, radians
+from math import radians
 
-from kivy.lang import Builder
-from kivy.factory import Factory
-from kivy.graphics import Callback, RenderContext
-from kivy.graphics.fbo import Fbo
 from kivy.graphics.texture import Texture
-from kivy.graphics.transformation import Matrix
 from kivy.properties import NumericProperty
 
-# Make sure that OpenGL context is created
-import kivy.core.window
-
-from .base import GradientBase, enable_copy_blending, disable_copy_blending
+from .base import GradientBase, GRADIENT_COLOR_FUNCTION, \
+                  create_render_context, load_kv_rule, \
+                  render_gradient_texture, render_gradient_pixels
+from .scheduler import rebake_scheduler
 
 
 KV = '''
@@ -37,12 +32,18 @@ KV = '''
 VERTEX_SHADER = '''
 $HEADER$
 
-uniform mat4 gradientMatrix;
+uniform vec2  gradientSize;
+uniform vec2  gradientAngle;    // radians, current and next keyframe
+uniform float gradientTime;
 
 void main() {
     frag_color = color * vec4(1.0, 1.0, 1.0, opacity);
-    vec4 tex_coord = (gradientMatrix * vec4(vTexCoords0 * 2.0 - 1.0, 0.0, 1.0));
-    tex_coord0 = (tex_coord.xy + 1.0) * 0.5;
+    float angle = mix(gradientAngle.x, gradientAngle.y, gradientTime);
+    vec2 direction = vec2(sin(angle), cos(angle)) * gradientSize;
+    float length = abs(direction.x) + abs(direction.y);
+    // position at the gradient line going through the center
+    vec2 position = vec2(vTexCoords0.x - 0.5, 0.5 - vTexCoords0.y);
+    tex_coord0 = vec2(0.5 + dot(position, direction) / length, 0.0);
     gl_Position = projection_mat * modelview_mat * vec4(vPosition, 0.0, 1.0);
 }
 '''
@@ -50,11 +51,9 @@ void main() {
 
 FRAGMENT_SHADER = '''
 $HEADER$
-
-uniform sampler2D gradientTexture;
-
+''' + GRADIENT_COLOR_FUNCTION + '''
 void main() {
-    gl_FragColor = frag_color * texture2D(gradientTexture, tex_coord0);
+    gl_FragColor = frag_color * gradientColor(tex_coord0.x);
 }
 '''
 
@@ -84,28 +83,45 @@ class LinearGradient(GradientBase):
     and defaults to `0`.
     '''
 
+    _animated_properties = ('angle', )
+
     @staticmethod
-    def render_texture(**kwargs) -> Texture:
+    def render_texture(target=None, **kwargs) -> Texture:
+        '''
+        Renders gradient at FBO and returns the texture. If
+        :data:`~bouquet.gradients.cache.texture_cache` is enabled, identical
+        requests return the same texture from it, so don't modify it.
+
+        :param target:
+            :class:`~kivy.graphics.fbo.Fbo` or
+            :class:`~kivy.graphics.texture.Texture` to update in place
+            instead of creating a new texture, e.g. on resize. See
+            :func:`~bouquet.gradients.base.render_gradient_texture`.
+        :param kwargs:
+            Any :class:`LinearGradient` properties.
         '''
-        Renders gradient at FBO and returns the texture.
+        return render_gradient_texture(LinearGradient, kwargs, target)
 
+    @staticmethod
+    def render_pixels(buffer=None, **kwargs):
+        '''
+        Renders gradient and reads its RGBA pixels back into `buffer`, which
+        can be reused across calls. See
+        :func:`~bouquet.gradients.base.render_gradient_pixels`.
+
+        :param buffer:
+            Writable buffer (e.g. `bytearray` or NumPy array) of
+            `width * height * 4` bytes. By default, a new `bytearray`
+            is created.
         :param kwargs:
             Any :class:`LinearGradient` properties.
         '''
-        width = kwargs.pop('width', 100)
-        height = kwargs.pop('height', 100)
-        width, height = kwargs.pop('size', (width, height))
-
-        fbo = Fbo(size=(width, height))
-        with fbo:
-            Callback(enable_copy_blending)
-            LinearGradient(size=(width, height), **kwargs).canvas
-            Callback(disable_copy_blending)
-        fbo.draw()
-        return fbo.texture
+        return render_gradient_pixels(LinearGradient, kwargs, buffer)
 
     def __init__(self, **kwargs):
-        self.canvas = RenderContext(
+        load_kv_rule('LinearGradient', KV)
+        self.canvas = create_render_context(
+            self.__class__,
             vs=VERTEX_SHADER,
             fs=FRAGMENT_SHADER,
             use_parent_projection=True,
@@ -113,23 +129,19 @@ class LinearGradient(GradientBase):
             use_parent_frag_modelview=True
         )
         self.canvas['gradientTexture'] = 1
-        self.fbind('size', self._update_gradient_matrix)
-        self.fbind('angle', self._update_gradient_matrix)
+        trigger = self._trigger_update_gradient_matrix = \
+            rebake_scheduler.create_trigger(self._update_gradient_matrix)
+        self.fbind('size', trigger)
+        self.fbind('angle', trigger)
         super(LinearGradient, self).__init__(**kwargs)
 
-    def _update_gradient_matrix(self, _, __):
-        angle = radians(self.angle)
-        rotation = angle - radians(90)
-
-        width, height = self.size
-        length = abs(width * sin(angle)) + abs(height * cos(angle))
-
-        matrix = Matrix()
-        matrix = matrix.multiply(Matrix().scale(1.0, height / width, 1.0))
-        matrix = matrix.multiply(Matrix().rotate(rotation, 0.0, 0.0, 1.0))
-        matrix = matrix.multiply(Matrix().scale(width / length, 1.0, 1.0))
-        self.canvas['gradientMatrix'] = matrix.transpose()
-
+    def _set_keyframes(self, keyframes):
+        super(LinearGradient, self)._set_keyframes(keyframes)
+        self._trigger_update_gradient_matrix.cancel()
+        self._update_gradient_matrix()
 
-Builder.load_string(KV)
-Factory.register('LinearGradient', cls=LinearGradient)
+    def _update_gradient_matrix(self, *args):
+        angle, next_angle = self._get_keyframe_values('angle')
+        canvas = self.canvas
+        canvas['gradientSize'] = tuple(map(float, self.size))
+        canvas['gradientAngle'] = (radians(angle), radians(next_angle))
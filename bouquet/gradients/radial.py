@@ -4,17 +4,12 @@ Base module for radial gradient.
 
 __all__ = ('RadialGradient', )
 
-from kivy.lang import Builder
-from kivy.factory import Factory
-from kivy.graphics import Callback, RenderContext
-from kivy.graphics.fbo import Fbo
 from kivy.graphics.texture import Texture
 from kivy.properties import NumericProperty, ReferenceListProperty
 
-# Make sure that OpenGL context is created
-import kivy.core.window
-
-from .base import GradientBase, enable_copy_blending, disable_copy_blending
+from .base import GradientBase, GRADIENT_COLOR_FUNCTION, \
+                  create_render_context, load_kv_rule, \
+                  render_gradient_texture, render_gradient_pixels
 
 
 KV = '''
@@ -34,15 +29,18 @@ KV = '''
 FRAGMENT_SHADER = '''
 $HEADER$
 
-uniform vec2      gradientCenter;
-uniform float     gradientRadius;
-uniform sampler2D gradientTexture;
-
+// current and next keyframe
+uniform vec4  gradientCenter;
+uniform vec2  gradientRadius;
+''' + GRADIENT_COLOR_FUNCTION + '''
 void main() {
-    float distance = distance(tex_coord0, gradientCenter) * gradientRadius;
-    // workaround: when the radius equals 0.0, add 1.0 to the distance (0.0)
-    distance += step(gradientRadius, 0.0);
-    gl_FragColor = frag_color * texture2D(gradientTexture, vec2(distance, 0.5));
+    vec2 center = mix(gradientCenter.xy, gradientCenter.zw, gradientTime);
+    float radius = mix(gradientRadius.x, gradientRadius.y, gradientTime);
+    // when the radius isn't positive, the distance is 1.0
+    float distance = radius > 0.0
+        ? distance(tex_coord0, center) * (2.0 / radius)
+        : 1.0;
+    gl_FragColor = frag_color * gradientColor(distance);
 }
 '''
 
@@ -98,28 +96,45 @@ class RadialGradient(GradientBase):
     and defaults to `1.0`.
     '''
 
+    _animated_properties = ('gradient_center_pos', 'radius')
+
     @staticmethod
-    def render_texture(**kwargs) -> Texture:
+    def render_texture(target=None, **kwargs) -> Texture:
         '''
-        Renders gradient at FBO and returns the texture.
+        Renders gradient at FBO and returns the texture. If
+        :data:`~bouquet.gradients.cache.texture_cache` is enabled, identical
+        requests return the same texture from it, so don't modify it.
+
+        :param target:
+            :class:`~kivy.graphics.fbo.Fbo` or
+            :class:`~kivy.graphics.texture.Texture` to update in place
+            instead of creating a new texture, e.g. on resize. See
+            :func:`~bouquet.gradients.base.render_gradient_texture`.
+        :param kwargs:
+            Any :class:`RadialGradient` properties.
+        '''
+        return render_gradient_texture(RadialGradient, kwargs, target)
 
+    @staticmethod
+    def render_pixels(buffer=None, **kwargs):
+        '''
+        Renders gradient and reads its RGBA pixels back into `buffer`, which
+        can be reused across calls. See
+        :func:`~bouquet.gradients.base.render_gradient_pixels`.
+
+        :param buffer:
+            Writable buffer (e.g. `bytearray` or NumPy array) of
+            `width * height * 4` bytes. By default, a new `bytearray`
+            is created.
         :param kwargs:
             Any :class:`RadialGradient` properties.
         '''
-        width = kwargs.pop('width', 100)
-        height = kwargs.pop('height', 100)
-        width, height = kwargs.pop('size', (width, height))
-
-        fbo = Fbo(size=(width, height))
-        with fbo:
-            Callback(enable_copy_blending)
-            RadialGradient(size=(width, height), **kwargs).canvas
-            Callback(disable_copy_blending)
-        fbo.draw()
-        return fbo.texture
+        return render_gradient_pixels(RadialGradient, kwargs, buffer)
 
     def __init__(self, **kwargs):
-        self.canvas = RenderContext(
+        load_kv_rule('RadialGradient', KV)
+        self.canvas = create_render_context(
+            self.__class__,
             fs=FRAGMENT_SHADER,
             use_parent_projection=True,
             use_parent_modelview=True,
@@ -128,21 +143,24 @@ class RadialGradient(GradientBase):
 
         canvas = self.canvas
         canvas['gradientTexture'] = 1
-        canvas['gradientRadius'] = 2.0
-        canvas['gradientCenter'] = (0.5, 0.5)
+        canvas['gradientRadius'] = (1.0, 1.0)
+        canvas['gradientCenter'] = (0.5, 0.5, 0.5, 0.5)
 
         fbind = self.fbind
         fbind('radius',              self._update_gradient_radius)
         fbind('gradient_center_pos', self._update_gradient_center)
         super(RadialGradient, self).__init__(**kwargs)
 
-    def _update_gradient_center(self, _, value):
-        self.canvas['gradientCenter'] = tuple(value)
-
-    def _update_gradient_radius(self, _, value):
-        radius = 0.0 if value <= 0.0 else (1.0 / value) * 2.0
-        self.canvas['gradientRadius'] = radius
+    def _set_keyframes(self, keyframes):
+        super(RadialGradient, self)._set_keyframes(keyframes)
+        self._update_gradient_center()
+        self._update_gradient_radius()
 
+    def _update_gradient_center(self, *args):
+        center, next_center = self._get_keyframe_values('gradient_center_pos')
+        self.canvas['gradientCenter'] = \
+            tuple(map(float, (*center, *next_center)))
 
-Builder.load_string(KV)
-Factory.register('RadialGradient', cls=RadialGradient)
+    def _update_gradient_radius(self, *args):
+        radius, next_radius = self._get_keyframe_values('radius')
+        self.canvas['gradientRadius'] = (float(radius), float(next_radius))
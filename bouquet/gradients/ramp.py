@@ -0,0 +1,587 @@
+'''
+Module for baking 1D gradient textures (ramps) from color stops.
+'''
+
+__all__ = (
+    'RAMP_ENGINES', 'RAMP_WIDTH', 'MAX_RAMP_WIDTH', 'MAX_FBO_RAMP_STOPS',
+    'RampFbo', 'RampFboPool', 'CpuRamp', 'RampAtlas',
+    'RampRegistry', 'ramp_fbo_pool', 'ramp_atlas', 'ramp_registry',
+    'compute_ramp', 'create_ramp', 'release_ramp',
+    'get_default_ramp_engine', 'set_default_ramp_engine',
+    'enable_copy_blending', 'disable_copy_blending'
+)
+
+from array import array
+from bisect import bisect_left, bisect_right
+from math import ceil, floor
+from time import perf_counter
+
+from kivy.graphics import Callback, Mesh
+from kivy.graphics.fbo import Fbo
+from kivy.graphics.opengl import glBlendFuncSeparate, \
+                                 GL_ZERO, GL_ONE_MINUS_SRC_ALPHA, \
+                                 GL_SRC_ALPHA, GL_ONE
+from kivy.graphics.texture import Texture
+
+from .instrumentation import count_shader_compile, record_event
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+RAMP_WIDTH = 1024
+'''Default width of the ramps in texels.'''
+
+MAX_RAMP_WIDTH = 16384
+'''Maximum width of the ramps in texels.'''
+
+MAX_FBO_RAMP_STOPS = 1024
+'''
+:class:`RampFbo` draws a vertex per color stop, so ramps with more color
+stops are always computed on the CPU.
+'''
+
+RAMP_ENGINES = ('fbo', 'cpu')
+'''
+Available ramp engines:
+
+- `'fbo'` renders the ramp on the GPU (:class:`RampFbo`);
+
+- `'cpu'` computes the ramp on the CPU and uploads it with
+  :meth:`~kivy.graphics.texture.Texture.blit_buffer` (:class:`CpuRamp`).
+'''
+
+_default_ramp_engine = 'fbo'
+
+
+FBO_VERTEX_SHADER = '''
+#ifdef GL_ES
+    precision highp float;
+#endif
+
+attribute float vertexPos;
+attribute vec4  vertexColor;
+
+varying vec4 fragmentColor;
+
+void main() {
+    fragmentColor = vertexColor;
+    gl_Position = vec4(vertexPos * 2.0 - 1.0, 0.0, 0.0, 1.0);
+}
+'''
+
+
+FBO_FRAGMENT_SHADER = '''
+#ifdef GL_ES
+    precision highp float;
+#endif
+
+varying vec4 fragmentColor;
+
+void main() {
+    gl_FragColor = fragmentColor;
+}
+'''
+
+
+def enable_copy_blending(_):
+    glBlendFuncSeparate(GL_ONE, GL_ZERO, GL_ONE, GL_ZERO)
+
+
+def disable_copy_blending(_):
+    glBlendFuncSeparate(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA, GL_ONE, GL_ONE)
+
+
+def get_default_ramp_engine() -> str:
+    '''
+    Returns the ramp engine used by gradients with
+    :attr:`~bouquet.gradients.base.GradientBase.ramp_engine` set to
+    `'default'`.
+    '''
+    return _default_ramp_engine
+
+
+def set_default_ramp_engine(engine: str):
+    '''
+    Sets the ramp engine used by gradients with
+    :attr:`~bouquet.gradients.base.GradientBase.ramp_engine` set to
+    `'default'`. Existing ramps are updated with the new engine on the next
+    color stops change.
+
+    :param engine:
+        One of :data:`RAMP_ENGINES`.
+    :raises ValueError: If the engine is unknown.
+    '''
+    global _default_ramp_engine
+    if engine not in RAMP_ENGINES:
+        raise ValueError(f'Unknown ramp engine: {engine!r}.')
+    _default_ramp_engine = engine
+
+
+def compute_ramp(mesh, width: int = RAMP_WIDTH, start: int = 0,
+                 stop: int = None) -> bytes:
+    '''
+    Computes RGBA pixels of the ramp on the CPU. The result matches
+    the ramp rendered by :class:`RampFbo`. The function doesn't use OpenGL,
+    so it can be called from any thread. NumPy is used if it's installed.
+
+    :param mesh:
+        Flat list of `(position, r, g, b, a)` values of the sorted color
+        stops. The first position must be 0.0 and the last one 1.0.
+    :param width:
+        Width of the ramp in pixels.
+    :param start:
+        Index of the first computed pixel.
+    :param stop:
+        Index after the last computed pixel, defaults to `width`. When only
+        a part of the ramp is computed, the `mesh` may contain only the color
+        stops around it.
+    '''
+    if stop is None:
+        stop = width
+    if numpy is not None:
+        return _compute_ramp_numpy(mesh, width, start, stop)
+    return _compute_ramp_array(mesh, width, start, stop)
+
+
+def _compute_ramp_numpy(mesh, width, start=0, stop=None):
+    if stop is None:
+        stop = width
+    stops = numpy.asarray(mesh, dtype=numpy.float64).reshape(-1, 5)
+    # color at the center of each texel
+    x = (numpy.arange(start, stop, dtype=numpy.float64) + 0.5) / width
+    pixels = numpy.empty((stop - start, 4), dtype=numpy.float64)
+    positions = stops[:, 0]
+    for channel in range(4):
+        pixels[:, channel] = numpy.interp(x, positions, stops[:, channel + 1])
+    numpy.clip(pixels, 0.0, 1.0, out=pixels)
+    pixels *= 255.0
+    pixels += 0.5
+    return pixels.astype(numpy.uint8).tobytes()
+
+
+def _compute_ramp_array(mesh, width, start=0, stop=None):
+    if stop is None:
+        stop = width
+    pixels = array('B', bytes((stop - start) * 4))
+    last = len(mesh) - 5
+    offset = 0
+    for i in range(stop - start):
+        x = (start + i + 0.5) / width
+        # find the segment of color stops containing the texel
+        while offset < last - 5 and mesh[offset + 5] < x:
+            offset += 5
+        position = mesh[offset]
+        length = mesh[offset + 5] - position
+        t = (x - position) / length if length > 0.0 else 1.0
+        t = min(max(t, 0.0), 1.0)
+        for channel in range(1, 5):
+            a = mesh[offset + channel]
+            b = mesh[offset + 5 + channel]
+            value = min(max(a + (b - a) * t, 0.0), 1.0)
+            pixels[i * 4 + channel - 1] = int(value * 255.0 + 0.5)
+    return pixels.tobytes()
+
+
+def create_ramp(engine: str, width: int = RAMP_WIDTH):
+    '''
+    Returns a new ramp (:class:`RampFbo` or :class:`CpuRamp`) for
+    the `engine`.
+
+    :param width:
+        Width of the ramp in texels.
+    '''
+    if engine == 'fbo':
+        return ramp_fbo_pool.acquire(width)
+    elif engine == 'cpu':
+        return CpuRamp(width)
+    raise ValueError(f'Unknown ramp engine: {engine!r}.')
+
+
+def release_ramp(ramp):
+    '''
+    Frees the ramp created by :func:`create_ramp`.
+    '''
+    if isinstance(ramp, RampFbo):
+        ramp_fbo_pool.release(ramp)
+
+
+class RampFbo:
+    '''
+    Persistent FBO for rendering the 1D gradient texture. The FBO, its shader
+    and the mesh are created once, so updating the ramp only uploads the
+    vertices and redraws the FBO.
+
+    :param width:
+        Width of the ramp in texels.
+    '''
+
+    engine = 'fbo'
+
+    def __init__(self, width: int = RAMP_WIDTH):
+        self.width = width
+        start = perf_counter()
+        self.fbo = fbo = Fbo(
+            size=(width, 1), vs=FBO_VERTEX_SHADER, fs=FBO_FRAGMENT_SHADER
+        )
+        elapsed = perf_counter() - start
+        count_shader_compile('RampFbo', elapsed)
+        record_event('fbo_allocation', 'RampFbo', elapsed)
+        with fbo:
+            Callback(enable_copy_blending)
+            self.mesh = Mesh(
+                mode='line_strip',
+                fmt=[(b'vertexPos', 1, 'float'), (b'vertexColor', 4, 'float')]
+            )
+            Callback(disable_copy_blending)
+
+    @property
+    def texture(self) -> Texture:
+        '''
+        The ramp texture. It's the same object after every :meth:`render`.
+        '''
+        return self.fbo.texture
+
+    def render(self, mesh, span: tuple = None) -> Texture:
+        '''
+        Renders the ramp and returns :attr:`texture`.
+
+        :param mesh:
+            Flat list of `(position, r, g, b, a)` values of the sorted color
+            stops. The first position must be 0.0 and the last one 1.0.
+        :param span:
+            Ignored, the whole ramp is rendered; see :meth:`CpuRamp.render`.
+        '''
+        self.mesh.vertices = mesh
+        self.mesh.indices = range(len(mesh) // 5)
+        self.fbo.draw()
+        return self.fbo.texture
+
+
+class CpuRamp:
+    '''
+    1D gradient texture computed on the CPU with :func:`compute_ramp`
+    and uploaded with :meth:`~kivy.graphics.texture.Texture.blit_buffer`.
+    Unlike :class:`RampFbo`, it supports any number of color stops.
+
+    :param width:
+        Width of the ramp in texels.
+    '''
+
+    engine = 'cpu'
+
+    def __init__(self, width: int = RAMP_WIDTH):
+        self.width = width
+        self._pixels = None
+        self.texture = Texture.create(size=(width, 1), colorfmt='rgba')
+        '''
+        The ramp texture. It's the same object after every :meth:`render`.
+        '''
+        self.texture.add_reload_observer(self._on_reload)
+
+    def render(self, mesh, span: tuple = None) -> Texture:
+        '''
+        Computes the ramp and returns :attr:`texture`. See :meth:`upload`
+        to compute the pixels in another thread.
+
+        :param mesh:
+            Flat list of `(position, r, g, b, a)` values of the sorted color
+            stops. The first position must be 0.0 and the last one 1.0.
+        :param span:
+            `(start, end)` positions of the part of the ramp which changed
+            since the previous :meth:`render` call, e.g. the positions of
+            the neighbours of the moved color stop. Only the pixels of this
+            part are computed and uploaded. By default, the whole ramp is
+            computed.
+        '''
+        if span is None or self._pixels is None:
+            return self.upload(compute_ramp(mesh, self.width))
+
+        left, right = span
+        width = self.width
+        # pixels with centers from `left` to `right`
+        start = max(ceil(left * width - 0.5), 0)
+        stop = min(floor(right * width - 0.5) + 1, width)
+        if start >= stop:
+            return self.texture
+        # only the color stops around the span are needed, including
+        # the closest ones outside of it
+        positions = mesh[0::5]
+        first = max(bisect_left(positions, left) - 1, 0)
+        last = min(bisect_right(positions, right), len(positions) - 1)
+        pixels = compute_ramp(mesh[first * 5:last * 5 + 5], width, start, stop)
+        self._pixels[start * 4:stop * 4] = pixels
+        self.texture.blit_buffer(
+            pixels, pos=(start, 0), size=(stop - start, 1),
+            colorfmt='rgba', bufferfmt='ubyte'
+        )
+        return self.texture
+
+    def upload(self, pixels: bytes) -> Texture:
+        '''
+        Uploads pixels computed by :func:`compute_ramp` and returns
+        :attr:`texture`.
+        '''
+        self._pixels = bytearray(pixels)
+        self.texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        return self.texture
+
+    def _on_reload(self, texture):
+        # restore pixels after the OpenGL context is lost
+        if self._pixels is not None:
+            texture.blit_buffer(
+                self._pixels, colorfmt='rgba', bufferfmt='ubyte'
+            )
+
+
+class RampAtlas:
+    '''
+    Single texture with ramps of many gradients, where each distinct set of
+    color stops occupies one row. Gradients sharing the atlas bind the same
+    texture and sample their row, which saves texture binds and GPU memory in
+    UIs with many gradients. Rows are reference counted and reused when the
+    last gradient releases them. Ramps are computed with
+    :func:`compute_ramp`.
+
+    :param rows:
+        Number of rows (maximum number of distinct ramps).
+    '''
+
+    def __init__(self, rows: int = 256):
+        self.rows = rows
+        self._texture = None
+        self._rows = {}         # mesh -> [row, reference count]
+        self._row_keys = {}     # row -> mesh
+        self._free_rows = list(range(rows - 1, -1, -1))
+
+    @property
+    def texture(self) -> Texture:
+        '''
+        The atlas texture of `RAMP_WIDTH` x :attr:`rows` size. It's created
+        on first access.
+        '''
+        if self._texture is None:
+            self._texture = Texture.create(
+                size=(RAMP_WIDTH, self.rows), colorfmt='rgba'
+            )
+            self._texture.add_reload_observer(self._on_reload)
+        return self._texture
+
+    @property
+    def used_rows(self) -> int:
+        '''
+        Number of rows used by the gradients.
+        '''
+        return len(self._rows)
+
+    def acquire(self, mesh):
+        '''
+        Returns the row with the ramp of the `mesh`, adding the ramp to the
+        atlas if needed. Returns `None` if the atlas is full.
+
+        :param mesh:
+            Flat list of `(position, r, g, b, a)` values of the sorted color
+            stops. The first position must be 0.0 and the last one 1.0.
+        '''
+        key = tuple(mesh)
+        entry = self._rows.get(key)
+        if entry is not None:
+            entry[1] += 1
+            return entry[0]
+        if not self._free_rows:
+            return None
+        row = self._free_rows.pop()
+        self._upload(row, compute_ramp(key))
+        self._rows[key] = [row, 1]
+        self._row_keys[row] = key
+        return row
+
+    def release(self, row: int):
+        '''
+        Releases the row returned by :meth:`acquire`.
+        '''
+        key = self._row_keys.get(row)
+        if key is None:
+            return
+        entry = self._rows[key]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._rows[key]
+            del self._row_keys[row]
+            self._free_rows.append(row)
+
+    def row_coord(self, row: int) -> float:
+        '''
+        Returns the texture coordinate of the row center.
+        '''
+        return (row + 0.5) / self.rows
+
+    def _upload(self, row, pixels):
+        self.texture.blit_buffer(
+            pixels, pos=(0, row), size=(RAMP_WIDTH, 1),
+            colorfmt='rgba', bufferfmt='ubyte'
+        )
+
+    def _on_reload(self, texture):
+        # restore rows after the OpenGL context is lost
+        for key, (row, _) in self._rows.items():
+            self._upload(row, compute_ramp(key))
+
+
+class RampRegistry:
+    '''
+    Content-addressed registry of ramps. Gradients with equal color stops
+    and ramp width share one ramp texture, which is freed when the last
+    gradient releases it.
+    '''
+
+    def __init__(self):
+        self._entries = {}      # (mesh, width) -> [ramp, reference count]
+
+    @property
+    def live_ramps(self) -> int:
+        '''
+        Number of unique ramps in use.
+        '''
+        return len(self._entries)
+
+    @property
+    def references(self) -> int:
+        '''
+        Number of gradients using the ramps.
+        '''
+        return sum(entry[1] for entry in self._entries.values())
+
+    @property
+    def bytes_saved(self) -> int:
+        '''
+        GPU memory saved by sharing the ramps, in bytes.
+        '''
+        return sum(
+            (count - 1) * ramp.width * 4
+            for ramp, count in self._entries.values()
+        )
+
+    def acquire(self, mesh: tuple, engine: str,
+                width: int = RAMP_WIDTH) -> Texture:
+        '''
+        Returns the ramp texture of the `mesh`, rendering it with the `engine`
+        if the ramp isn't registered yet.
+
+        :param mesh:
+            Tuple of `(position, r, g, b, a)` values of the sorted color
+            stops. The first position must be 0.0 and the last one 1.0.
+        :param engine:
+            One of :data:`RAMP_ENGINES`.
+        :param width:
+            Width of the ramp in texels.
+        '''
+        entry = self._entries.get((mesh, width))
+        if entry is not None:
+            entry[1] += 1
+            return entry[0].texture
+        ramp = create_ramp(engine, width)
+        ramp.render(mesh)
+        self._entries[mesh, width] = [ramp, 1]
+        return ramp.texture
+
+    def release(self, mesh: tuple, width: int = RAMP_WIDTH):
+        '''
+        Releases the ramp returned by :meth:`acquire`.
+        '''
+        entry = self._entries.get((mesh, width))
+        if entry is None:
+            return
+        entry[1] -= 1
+        if not entry[1]:
+            del self._entries[mesh, width]
+            release_ramp(entry[0])
+
+    def stats(self) -> dict:
+        '''
+        Returns a snapshot of the registry counters.
+        '''
+        return {
+            'live_ramps': self.live_ramps,
+            'references': self.references,
+            'bytes_saved': self.bytes_saved
+        }
+
+
+class RampFboPool:
+    '''
+    Pool of idle :class:`RampFbo` objects. Gradient widgets take an FBO from
+    the pool on the first ramp update and give it back on
+    :meth:`~bouquet.gradients.base.GradientBase.release_resources`.
+
+    :param max_size:
+        Maximum number of idle FBOs kept by the pool. Extra FBOs are dropped,
+        so their GPU resources are freed by the garbage collector.
+    '''
+
+    def __init__(self, max_size: int = 8):
+        self._idle = []
+        self._max_size = max_size
+        self.created = 0
+        '''Number of FBOs created by the pool.'''
+
+    @property
+    def max_size(self) -> int:
+        '''
+        Maximum number of idle FBOs kept by the pool.
+        '''
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value: int):
+        if value < 0:
+            raise ValueError('Pool size can not be negative.')
+        self._max_size = value
+        del self._idle[value:]
+
+    def acquire(self, width: int = RAMP_WIDTH) -> RampFbo:
+        '''
+        Returns an idle FBO of the `width` or creates a new one.
+        '''
+        idle = self._idle
+        for index in range(len(idle) - 1, -1, -1):
+            if idle[index].width == width:
+                return idle.pop(index)
+        self.created += 1
+        return RampFbo(width)
+
+    def release(self, ramp: RampFbo):
+        '''
+        Returns the FBO to the pool. The FBO must not be used after that.
+        '''
+        if len(self._idle) < self._max_size:
+            self._idle.append(ramp)
+
+    def clear(self):
+        '''
+        Drops all idle FBOs.
+        '''
+        self._idle.clear()
+
+    def __len__(self) -> int:
+        return len(self._idle)
+
+
+ramp_fbo_pool = RampFboPool()
+'''
+Global :class:`RampFboPool` instance used by the gradient widgets.
+'''
+
+ramp_registry = RampRegistry()
+'''
+Global :class:`RampRegistry` instance used by the gradient widgets with
+:attr:`~bouquet.gradients.base.GradientBase.ramp_storage` set to `'shared'`.
+'''
+
+ramp_atlas = RampAtlas()
+'''
+Global :class:`RampAtlas` instance used by the gradient widgets with
+:attr:`~bouquet.gradients.base.GradientBase.ramp_storage` set to `'atlas'`.
+'''
@@ -0,0 +1,203 @@
+'''
+CPU backend rendering gradients into NumPy arrays without OpenGL.
+
+The functions of this module evaluate the same math as the gradient shaders,
+vectorized over the whole image, so gradients can be rendered by build
+servers and tests with no GPU or window. NumPy is required.
+'''
+
+__all__ = ('render_pixels', )
+
+from math import sin, cos, radians, pi
+
+from kivy.utils import colormap, get_color_from_hex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+_GRADIENT_BASE_PROPERTIES = {
+    'color_stops': [],
+    # properties of the ramp texture don't affect the result
+    'ramp_engine': None,
+    'ramp_storage': None,
+    'max_analytic_stops': None,
+    'ramp_resolution': None
+}
+
+_PROPERTIES = {
+    'LinearGradient': dict(_GRADIENT_BASE_PROPERTIES, angle=0.0),
+    'RadialGradient': dict(
+        _GRADIENT_BASE_PROPERTIES,
+        gradient_center_x=0.5, gradient_center_y=0.5, radius=1.0
+    ),
+    'ConicalGradient': dict(
+        _GRADIENT_BASE_PROPERTIES, gradient_center_x=0.5, gradient_center_y=0.5
+    ),
+    'BilinearGradient': {
+        'top_left_color': 'green',
+        'top_right_color': 'yellow',
+        'bottom_left_color': 'black',
+        'bottom_right_color': 'red'
+    }
+}
+
+
+def render_pixels(gradient, out=None, **kwargs) -> 'numpy.ndarray':
+    '''
+    Renders the gradient on the CPU and returns its RGBA pixels as
+    a `(height, width, 4)` array of `uint8`. Like
+    :attr:`~kivy.graphics.texture.Texture.pixels`, the first row of
+    the array is the bottom row of the image.
+
+    :param gradient:
+        Gradient class (e.g. :class:`~bouquet.gradients.LinearGradient`)
+        or its name.
+    :param out:
+        Writable buffer of `width * height * 4` bytes (e.g. a NumPy array
+        of `uint8` or a `bytearray`) to write the pixels to, so it can be
+        reused across calls. The returned array shares memory with it.
+    :param kwargs:
+        Same arguments as ``render_texture()`` of the gradient class.
+    :raises ImportError: If NumPy isn't installed.
+    :raises TypeError: If the gradient has no such property.
+    :raises ValueError:
+        If the gradient class is not supported or the `out` buffer has wrong
+        size or is read-only.
+    '''
+    if numpy is None:
+        raise ImportError('NumPy is required for the CPU rendering.')
+    return _render(*_parse_request(gradient, kwargs), out)
+
+
+def _parse_request(gradient, kwargs):
+    # returns the gradient name, the image size and all properties
+    name = getattr(gradient, '__name__', gradient)
+    defaults = _PROPERTIES.get(name)
+    if defaults is None:
+        raise ValueError(f'Unsupported gradient: {name!r}.')
+
+    width = kwargs.pop('width', 100)
+    height = kwargs.pop('height', 100)
+    width, height = kwargs.pop('size', (width, height))
+    width, height = int(width), int(height)
+
+    if 'gradient_center_pos' in kwargs and 'gradient_center_x' in defaults:
+        x, y = kwargs.pop('gradient_center_pos')
+        kwargs['gradient_center_x'] = x
+        kwargs['gradient_center_y'] = y
+    for key in kwargs:
+        if key not in defaults:
+            raise TypeError(f'{name} has no property {key!r}.')
+    props = dict(defaults, **kwargs)
+    if 'color_stops' in props:
+        # copy the color stops, so the image can be rendered in a thread
+        # (ColorStopArray items are already tuples)
+        props['color_stops'] = [
+            stop if isinstance(stop, tuple) else stop._data
+            for stop in props['color_stops']
+        ]
+    return name, width, height, props
+
+
+def _render(name, width, height, props, out=None):
+    # texture coordinates of the pixel centers, like vTexCoords0 in shaders,
+    # the first row of the baked texture has the highest `v` coordinate
+    u = (numpy.arange(width, dtype=numpy.float64) + 0.5) / width
+    v = (numpy.arange(height, 0, -1, dtype=numpy.float64) - 0.5) / height
+    u, v = numpy.meshgrid(u, v)
+
+    if name == 'BilinearGradient':
+        colors = _bilinear(u, v, props)
+    else:
+        if name == 'LinearGradient':
+            t = _linear(u, v, width, height, props)
+        elif name == 'RadialGradient':
+            t = _radial(u, v, props)
+        else:
+            t = _conical(u, v, width, height, props)
+        colors = _interpolate(t, props['color_stops'])
+
+    numpy.clip(colors, 0.0, 1.0, out=colors)
+    colors *= 255.0
+    colors += 0.5
+    if out is None:
+        return colors.astype(numpy.uint8)
+    pixels = numpy.frombuffer(out, dtype=numpy.uint8)
+    pixels = pixels.reshape(height, width, 4)
+    pixels[...] = colors
+    return pixels
+
+
+def _linear(u, v, width, height, props):
+    angle = radians(props['angle'])
+    length = abs(width * sin(angle)) + abs(height * cos(angle))
+    # position at the gradient line going through the center
+    x = (u - 0.5) * width
+    y = (0.5 - v) * height
+    return 0.5 + (x * sin(angle) + y * cos(angle)) / length
+
+
+def _radial(u, v, props):
+    radius = props['radius']
+    radius = 0.0 if radius <= 0.0 else (1.0 / radius) * 2.0
+    x = props['gradient_center_x']
+    y = props['gradient_center_y']
+    distance = numpy.hypot(u - x, v - y) * radius
+    # workaround from the shader: when the radius equals 0.0, add 1.0
+    if radius <= 0.0:
+        distance += 1.0
+    return distance
+
+
+def _conical(u, v, width, height, props):
+    scale = width / height
+    x = (props['gradient_center_x'] * 2.0 - 1.0) * scale
+    y = props['gradient_center_y'] * 2.0 - 1.0
+    # atan(-y, -x) from the shader, but the center row gets +0.0 instead
+    # of -0.0, so the seam has the color of the last stop like on GPU
+    x = x - (u * 2.0 - 1.0) * scale
+    y = y - (v * 2.0 - 1.0)
+    return numpy.arctan2(y, x) / (2.0 * pi) + 0.5
+
+
+def _bilinear(u, v, props):
+    u = u[..., numpy.newaxis]
+    v = v[..., numpy.newaxis]
+    top_left, top_right, bottom_left, bottom_right = (
+        numpy.array(_rgba(props[key]), dtype=numpy.float64)
+        for key in ('top_left_color', 'top_right_color',
+                    'bottom_left_color', 'bottom_right_color')
+    )
+    top = top_left + (top_right - top_left) * u
+    bottom = bottom_left + (bottom_right - bottom_left) * u
+    return top + (bottom - top) * v
+
+
+def _interpolate(t, color_stops):
+    stops = sorted(color_stops, key=lambda data: data[0])
+    colors = numpy.empty(t.shape + (4, ), dtype=numpy.float64)
+    if not stops:
+        colors.fill(1.0)
+        return colors
+    stops = numpy.array(stops, dtype=numpy.float64)
+    positions = stops[:, 0]
+    # colors before the first stop and after the last stop are constant,
+    # numpy.interp does the same
+    for channel in range(4):
+        colors[..., channel] = numpy.interp(
+            t, positions, stops[:, channel + 1]
+        )
+    return colors
+
+
+def _rgba(color):
+    if isinstance(color, str):
+        color = colormap[color] if color in colormap \
+            else get_color_from_hex(color)
+    color = list(color)
+    if len(color) == 3:
+        color.append(1.0)
+    return color
@@ -0,0 +1,208 @@
+'''
+Scheduler of the gradient updates.
+
+Gradient widgets don't update their textures and matrices immediately.
+The updates are queued in :data:`rebake_scheduler` and processed once per
+frame, before drawing. When many gradients change at once (e.g. theme switch
+or window resize), set :attr:`RebakeScheduler.budget` to spread the updates
+over several frames; visible widgets are updated first.
+'''
+
+__all__ = ('RebakeScheduler', 'RebakeTrigger', 'rebake_scheduler')
+
+from time import perf_counter
+from weakref import WeakMethod
+
+from kivy.clock import Clock
+
+
+class RebakeTrigger:
+    '''
+    Trigger created by :meth:`RebakeScheduler.create_trigger`. Like
+    the :meth:`~kivy.clock.Clock.create_trigger` triggers, calling it
+    (with any arguments) schedules the callback, so it can be bound to
+    properties directly. The callback is called without arguments.
+    '''
+
+    __slots__ = ('_callback', '_scheduler', '_pending')
+
+    def __init__(self, scheduler, callback):
+        self._callback = WeakMethod(callback)
+        self._scheduler = scheduler
+        self._pending = False
+
+    @property
+    def is_triggered(self) -> bool:
+        '''
+        Indicates if the callback is scheduled.
+        '''
+        return self._pending
+
+    @property
+    def widget(self):
+        '''
+        Widget of the callback or `None`, if it was garbage collected.
+        '''
+        callback = self._callback()
+        return None if callback is None else callback.__self__
+
+    def cancel(self):
+        '''
+        Unschedules the callback.
+        '''
+        if self._pending:
+            self._pending = False
+            self._scheduler._pending.pop(self, None)
+
+    def flush(self):
+        '''
+        Calls the scheduled callback immediately.
+        '''
+        if self._pending:
+            self.cancel()
+            self._run()
+
+    def _run(self):
+        callback = self._callback()
+        if callback is not None:
+            callback()
+
+    def __call__(self, *args):
+        if not self._pending:
+            self._pending = True
+            self._scheduler._schedule(self)
+
+
+class RebakeScheduler:
+    '''
+    Processes the queued gradient updates before drawing each frame.
+
+    :param budget:
+        Time budget in milliseconds per frame, see :attr:`budget`.
+    '''
+
+    def __init__(self, budget: float = None):
+        self._pending = {}      # ordered set of RebakeTrigger
+        self._budget = None
+        self.budget = budget
+        self.processed = 0
+        '''Number of processed updates.'''
+        self.deferred = 0
+        '''Number of updates postponed to the next frame.'''
+        # average time of an update in the last frame with a budget,
+        # None until it's measured
+        self._update_time = None
+        # updates are done before the frame is drawn, and the ones
+        # exceeding the budget are postponed to the next frame
+        self._trigger = Clock.create_trigger(self._process, -1)
+        self._trigger_next_frame = Clock.create_trigger(self._process, 0)
+
+    @property
+    def budget(self) -> float:
+        '''
+        Time budget in milliseconds for the updates per frame. At least one
+        update is processed each frame, the remaining ones are postponed
+        to the next frame. `None` (the default) processes all updates in
+        the same frame.
+        '''
+        return self._budget
+
+    @budget.setter
+    def budget(self, value: float):
+        if value is not None and value < 0:
+            raise ValueError('Time budget can not be negative.')
+        self._budget = value
+
+    def create_trigger(self, callback) -> RebakeTrigger:
+        '''
+        Returns a :class:`RebakeTrigger`, which schedules the `callback`
+        (a method of the widget) to the next frame. The scheduled callbacks
+        are called once, no matter how many times the trigger is called.
+        '''
+        return RebakeTrigger(self, callback)
+
+    def flush(self):
+        '''
+        Processes all queued updates immediately, ignoring the budget.
+        '''
+        while self._pending:
+            trigger = next(iter(self._pending))
+            trigger.flush()
+            self.processed += 1
+
+    def reset_stats(self):
+        '''
+        Resets :attr:`processed` and :attr:`deferred` counters.
+        '''
+        self.processed = self.deferred = 0
+
+    def stats(self) -> dict:
+        '''
+        Returns a snapshot of the scheduler counters.
+        '''
+        return {
+            'pending': len(self._pending),
+            'processed': self.processed,
+            'deferred': self.deferred,
+            'budget': self._budget
+        }
+
+    def _schedule(self, trigger):
+        self._pending[trigger] = None
+        self._trigger()
+
+    def _process(self, *args):
+        triggers = list(self._pending)
+        if not triggers:
+            return
+        budget = self._budget
+        if budget is None:
+            for trigger in triggers:
+                if trigger._pending:
+                    trigger.flush()
+                    self.processed += 1
+            return
+
+        # the visible widgets are updated first only if the updates don't
+        # fit in the budget, the sort is stable, so the order of the updates
+        # is kept otherwise
+        budget /= 1000
+        update_time = self._update_time
+        if len(triggers) > 1 and (
+                update_time is None or update_time * len(triggers) > budget):
+            triggers.sort(key=lambda trigger: not _is_visible(trigger.widget))
+
+        start = perf_counter()
+        deadline = start + budget
+        processed = 0
+        for index, trigger in enumerate(triggers):
+            if index and perf_counter() > deadline:
+                self.deferred += sum(t._pending for t in triggers[index:])
+                self._trigger_next_frame()
+                break
+            if trigger._pending:
+                trigger.flush()
+                processed += 1
+        if processed:
+            self.processed += processed
+            self._update_time = (perf_counter() - start) / processed
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+def _is_visible(widget) -> bool:
+    if widget is None:
+        return False
+    window = widget.get_root_window()
+    if window is None:
+        return False
+    x, y = widget.to_window(widget.x, widget.y)
+    right, top = widget.to_window(widget.right, widget.top)
+    return right > 0 and top > 0 and x < window.width and y < window.height
+
+
+rebake_scheduler = RebakeScheduler()
+'''
+Global :class:`RebakeScheduler` instance used by the gradient widgets.
+'''
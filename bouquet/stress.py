@@ -0,0 +1,227 @@
+'''
+Stress mode of the demo application.
+
+Fills the window with animated gradient widgets and shows FPS, frame time
+percentiles and the number of gradient updates. Run it with::
+
+    python -m bouquet --stress -n 400 --duration 30 --seed 1
+
+With ``--duration``, the app quits after the given number of seconds and
+prints a JSON summary, so the results of different releases and devices can
+be compared.
+'''
+
+import sys
+import json
+import random
+import argparse
+from math import ceil, sin, cos, sqrt, pi
+
+from kivy.app import runTouchApp, stopTouchApp
+from kivy.clock import Clock
+from kivy.lang import Builder
+from kivy.uix.floatlayout import FloatLayout
+from kivy.uix.gridlayout import GridLayout
+from kivy.uix.label import Label
+
+from bouquet.gradients import ColorStop, LinearGradient, BilinearGradient, \
+                              RadialGradient, ConicalGradient
+from bouquet.gradients.base import enable_instrumentation, \
+                                   instrumentation_stats
+from bouquet.gradients.instrumentation import shader_compile_stats
+from bouquet.gradients.scheduler import rebake_scheduler
+
+
+GRADIENTS = (LinearGradient, RadialGradient, ConicalGradient, BilinearGradient)
+FRAME_HISTORY = 240     # frames used for the percentiles
+
+KV = '''
+<StressOverlay>:
+    size_hint: None, None
+    size: self.texture_size
+    padding: '8dp', '4dp'
+    pos_hint: {'x': 0, 'top': 1}
+    font_size: '14sp'
+    canvas.before:
+        Color:
+            rgba: 0, 0, 0, 0.7
+        Rectangle:
+            pos: self.pos
+            size: self.size
+'''
+
+
+class StressOverlay(Label):
+    pass
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class StressTest:
+    '''
+    Creates the widgets and animates them every frame.
+    '''
+
+    def __init__(self, count, stops, seed):
+        self.random = random.Random(seed)
+        self.stops_count = stops
+        self.time = 0.0
+        self.frames = 0
+        self.frame_times = []
+        self.all_frame_times = []
+        self.phases = {}    # widget -> animation phase
+
+        Builder.load_string(KV)
+        self.root = FloatLayout()
+        grid = GridLayout(cols=ceil(sqrt(count)))
+        self.widgets = []
+        for i in range(count):
+            widget = self.create_widget(GRADIENTS[i % len(GRADIENTS)])
+            grid.add_widget(widget)
+            self.widgets.append(widget)
+        self.root.add_widget(grid)
+        self.overlay = StressOverlay()
+        self.root.add_widget(self.overlay)
+
+    def random_color(self):
+        r = self.random.random
+        return (r(), r(), r(), 1.0)
+
+    def create_widget(self, gradient_cls):
+        widget = gradient_cls()
+        self.phases[widget] = self.random.random() * 2.0 * pi
+        if gradient_cls is BilinearGradient:
+            return widget
+        count = self.stops_count
+        widget.color_stops = [
+            ColorStop(
+                position=i / max(1, count - 1), color=self.random_color()
+            )
+            for i in range(count)
+        ]
+        return widget
+
+    def animate(self, dt):
+        self.time += dt
+        self.frames += 1
+        self.frame_times.append(dt)
+        self.all_frame_times.append(dt)
+        del self.frame_times[:-FRAME_HISTORY]
+
+        t = self.time
+        phases = self.phases
+        for widget in self.widgets:
+            phase = t + phases[widget]
+            if isinstance(widget, LinearGradient):
+                widget.angle = (phase * 45.0) % 360.0
+            elif isinstance(widget, RadialGradient):
+                widget.radius = 0.75 + 0.25 * sin(phase)
+            elif isinstance(widget, ConicalGradient):
+                widget.gradient_center_pos = (
+                    0.5 + 0.25 * cos(phase), 0.5 + 0.25 * sin(phase)
+                )
+            else:
+                widget.top_left_color = (
+                    0.5 + 0.5 * sin(phase), 0.2, 0.5 + 0.5 * cos(phase), 1.0
+                )
+            if isinstance(widget, (LinearGradient, RadialGradient)):
+                stops = widget.color_stops
+                if len(stops) > 2:
+                    # keep the stop between its neighbours
+                    low, high = stops[0].position, stops[2].position
+                    stops[1].position = low + (high - low) * (
+                        0.5 + 0.4 * sin(phase * 2.0)
+                    )
+
+    def update_overlay(self, dt):
+        times = self.frame_times
+        if not times:
+            return
+        stats = self.stats()
+        self.overlay.text = (
+            f'{len(self.widgets)} gradients, '
+            f'{self.stops_count} color stops\n'
+            f'FPS: {Clock.get_fps():.1f}\n'
+            f'Frame time p50/p95/p99: {stats["p50_ms"]:.1f} / '
+            f'{stats["p95_ms"]:.1f} / {stats["p99_ms"]:.1f} ms\n'
+            f'Rebakes: {stats["rebakes"]} '
+            f'({stats["ramp_bakes"]} ramps), '
+            f'pending: {len(rebake_scheduler)}\n'
+            f'Shader compiles: {stats["shader_compiles"]}'
+        )
+
+    def stats(self, times=None) -> dict:
+        times = self.frame_times if times is None else times
+        events = instrumentation_stats()
+
+        def count(event):
+            return sum(s['count'] for s in events.get(event, {}).values())
+
+        return {
+            'gradients': len(self.widgets),
+            'color_stops': self.stops_count,
+            'frames': self.frames,
+            'seconds': self.time,
+            'fps': self.frames / self.time if self.time else 0.0,
+            'p50_ms': percentile(times, 0.5) * 1000.0,
+            'p95_ms': percentile(times, 0.95) * 1000.0,
+            'p99_ms': percentile(times, 0.99) * 1000.0,
+            'rebakes': count('update_mesh'),
+            'ramp_bakes': count('bake_ramp'),
+            'shader_compiles': sum(
+                s['count'] for s in shader_compile_stats().values()
+            )
+        }
+
+
+def main(argv=None) -> int:
+    '''
+    Entry point of the ``python -m bouquet --stress`` command.
+    '''
+    parser = argparse.ArgumentParser(
+        prog='python -m bouquet --stress',
+        description='Load test with many animated gradients.'
+    )
+    parser.add_argument(
+        '-n', '--count', type=int, default=200,
+        help='number of gradient widgets (default: 200)'
+    )
+    parser.add_argument(
+        '-s', '--stops', type=int, default=4,
+        help='color stops per gradient; more than 8 stops are baked '
+             'into textures (default: 4)'
+    )
+    parser.add_argument(
+        '-d', '--duration', type=float,
+        help='quit after this number of seconds and print the summary'
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0, help='seed of the random colors'
+    )
+    parser.add_argument(
+        '--budget', type=float,
+        help='time budget of the gradient updates per frame, in ms'
+    )
+    args = parser.parse_args(argv)
+
+    enable_instrumentation()
+    rebake_scheduler.budget = args.budget
+    test = StressTest(args.count, args.stops, args.seed)
+    Clock.schedule_interval(test.animate, 0)
+    Clock.schedule_interval(test.update_overlay, 0.5)
+    if args.duration:
+        Clock.schedule_once(lambda dt: stopTouchApp(), args.duration)
+    runTouchApp(test.root)
+
+    if args.duration:
+        # skip the first frames, they include the widget creation
+        times = test.all_frame_times[2:] or test.all_frame_times
+        print(json.dumps(test.stats(times), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
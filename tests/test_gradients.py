@@ -22,6 +22,18 @@ is_github_actions = pytest.mark.skipif(
 
 class GradientsTests(GraphicUnitTest):
 
+    def enable_texture_cache(self):
+        # texture_cache is disabled by default
+        from bouquet.gradients.cache import texture_cache
+
+        max_bytes = texture_cache.max_bytes
+        texture_cache.max_bytes = 32 * 1024 * 1024
+        texture_cache.clear()
+        texture_cache.reset_stats()
+        self.addCleanup(texture_cache.clear)
+        self.addCleanup(setattr, texture_cache, 'max_bytes', max_bytes)
+        return texture_cache
+
     def test_color_stop(self):
         from bouquet.gradients import ColorStop
 
@@ -54,8 +66,13 @@ class GradientsTests(GraphicUnitTest):
         wid = GradientBase()
         self.render(wid)
 
-        with self.assertRaises(ValueError):
-            wid.color_stops = [ColorStop() for _ in range(1025)]
+        # ramps with many color stops are computed on the CPU
+        wid.color_stops = [
+            ColorStop(position=i / 2047, color=(i % 2, 0.0, 0.0, 1.0))
+            for i in range(2048)
+        ]
+        self.render(wid)
+        self.assertEqual(wid._ramp.engine, 'cpu')
 
         with self.assertRaises(TypeError):
             wid.color_stops = [1]
@@ -78,6 +95,7 @@ class GradientsTests(GraphicUnitTest):
         wid.color_stops = [
             ColorStop(color=(0.0, 1.0, 0.5, 0.25))
         ]
+        self.advance_frames(1)
         texture = wid._1d_gradient_texture
         pixels = texture.pixels
         self.assertEqual(texture.height, 1)
@@ -89,6 +107,7 @@ class GradientsTests(GraphicUnitTest):
             ColorStop(position=0.0, color='black'),
             ColorStop(position=1.0, color='white')
         ]
+        self.advance_frames(1)
         texture = wid._1d_gradient_texture
         pixels = texture.pixels
         self.assertEqual(texture.height, 1)
@@ -106,6 +125,7 @@ class GradientsTests(GraphicUnitTest):
             ColorStop(position=0.75, color=[1.0, 0.0, 0.0, 0.0]),
             ColorStop(position=0.25, color=[0.0, 0.0, 1.0, 1.0])
         ]
+        self.advance_frames(1)
         texture = wid._1d_gradient_texture
         pixels = texture.pixels
         self.assertEqual(texture.height, 1)
@@ -120,6 +140,507 @@ class GradientsTests(GraphicUnitTest):
         # 1.0 -> transparent red -> (255, 0, 0, 0)
         self.assertEqual(pixels[-4:], b'\xff\x00\x00\x00')
 
+    def test_gradient_base_update_coalescing(self):
+        from bouquet.gradients import ColorStop
+        from bouquet.gradients.base import GradientBase
+
+        class CountingGradient(GradientBase):
+            renders = 0
+
+            def _render_texture(self, mesh):
+                CountingGradient.renders += 1
+                return super()._render_texture(mesh)
+
+        wid = CountingGradient()
+        wid.color_stops = [ColorStop(position=i / 9) for i in range(10)]
+        wid.color_stops.append(ColorStop(color='red'))
+        self.advance_frames(1)
+        self.assertEqual(CountingGradient.renders, 1)
+
+        for stop in wid.color_stops:
+            stop.color = 'blue'
+            stop.position = 0.5
+        self.assertEqual(CountingGradient.renders, 1)
+        self.advance_frames(1)
+        self.assertEqual(CountingGradient.renders, 2)
+
+        self.advance_frames(1)
+        self.assertEqual(CountingGradient.renders, 2)
+
+    @is_github_actions
+    def test_gradient_base_fbo_reuse(self):
+        from bouquet.gradients import ColorStop
+        from bouquet.gradients.base import GradientBase
+        from bouquet.gradients.ramp import ramp_fbo_pool
+
+        ramp_fbo_pool.clear()
+        created = ramp_fbo_pool.created
+
+        wid = GradientBase(color_stops=[ColorStop(color='red')])
+        self.advance_frames(1)
+        texture = wid._1d_gradient_texture
+        self.assertEqual(texture.pixels, b'\xff\x00\x00\xff' * 1024)
+
+        wid.color_stops[0].color = 'blue'
+        self.advance_frames(1)
+        self.assertIs(wid._1d_gradient_texture, texture)
+        self.assertEqual(texture.pixels, b'\x00\x00\xff\xff' * 1024)
+        self.assertEqual(ramp_fbo_pool.created, created + 1)
+
+        wid.release_resources()
+        self.assertIs(wid._1d_gradient_texture, wid._default_texture)
+        self.assertEqual(len(ramp_fbo_pool), 1)
+
+        other = GradientBase(color_stops=[ColorStop(color='lime')])
+        self.advance_frames(1)
+        self.assertIs(other._1d_gradient_texture, texture)
+        self.assertEqual(ramp_fbo_pool.created, created + 1)
+        self.assertEqual(len(ramp_fbo_pool), 0)
+
+        other.release_resources()
+        ramp_fbo_pool.max_size = 0
+        self.assertEqual(len(ramp_fbo_pool), 0)
+        ramp_fbo_pool.max_size = 8
+
+    def test_compute_ramp(self):
+        from bouquet.gradients import ramp
+
+        mesh = [
+            0.0, 0.0, 0.0, 0.0, 1.0,
+            0.25, 0.0, 0.0, 1.0, 1.0,
+            0.25, 1.0, 0.0, 0.0, 0.5,
+            1.0, 1.0, 1.0, 1.0, 1.0
+        ]
+        pixels = ramp._compute_ramp_array(mesh, 1024)
+        self.assertEqual(len(pixels), 4 * 1024)
+        self.assertEqual(pixels[:4], b'\x00\x00\x00\xff')
+        self.assertEqual(pixels[4 * 255:4 * 256], b'\x00\x00\xff\xff')
+        self.assertEqual(pixels[4 * 256:4 * 257], b'\xff\x00\x00\x80')
+        self.assertEqual(pixels[-4:], b'\xff\xff\xff\xff')
+
+        if ramp.numpy is not None:
+            self.assertEqual(ramp._compute_ramp_numpy(mesh, 1024), pixels)
+            self.assertEqual(
+                ramp._compute_ramp_numpy(mesh, 7),
+                ramp._compute_ramp_array(mesh, 7)
+            )
+
+    @is_github_actions
+    def test_gradient_base_cpu_engine(self):
+        from bouquet.gradients import ColorStop
+        from bouquet.gradients.base import GradientBase
+        from bouquet.gradients.ramp import CpuRamp, set_default_ramp_engine
+
+        color_stops = [
+            ColorStop(position=0.1, color=(1.0, 0.0, 0.5, 1.0)),
+            ColorStop(position=0.4, color=(0.0, 0.3, 1.0, 0.2)),
+            ColorStop(position=0.9, color=(0.2, 1.0, 0.0, 0.7))
+        ]
+        gpu = GradientBase(ramp_engine='fbo', color_stops=color_stops)
+        cpu = GradientBase(ramp_engine='cpu', color_stops=color_stops)
+        self.advance_frames(1)
+        self.assertIsInstance(cpu._ramp, CpuRamp)
+        gpu_pixels = gpu._1d_gradient_texture.pixels
+        cpu_pixels = cpu._1d_gradient_texture.pixels
+        self.assertEqual(len(cpu_pixels), 4 * 1024)
+        for a, b in zip(gpu_pixels, cpu_pixels):
+            self.assertLessEqual(abs(a - b), 1)
+
+        set_default_ramp_engine('cpu')
+        try:
+            wid = GradientBase(color_stops=color_stops)
+            self.advance_frames(1)
+            self.assertIsInstance(wid._ramp, CpuRamp)
+            self.assertEqual(wid._1d_gradient_texture.pixels, cpu_pixels)
+
+            wid.ramp_engine = 'fbo'
+            self.advance_frames(1)
+            self.assertNotIsInstance(wid._ramp, CpuRamp)
+        finally:
+            set_default_ramp_engine('fbo')
+
+        with self.assertRaises(ValueError):
+            set_default_ramp_engine('vulkan')
+
+    @is_github_actions
+    def test_gradient_ramp_resolution(self):
+        from bouquet.gradients import ColorStop
+        from bouquet.gradients.base import GradientBase
+        from bouquet.gradients.ramp import compute_ramp, ramp_registry
+
+        color_stops = [
+            ColorStop(position=0.0, color=(1.0, 0.0, 0.5, 1.0)),
+            ColorStop(position=1.0, color=(0.2, 1.0, 0.0, 0.7))
+        ]
+        mesh = [i for stop in color_stops for i in stop._data]
+        cpu = GradientBase(
+            ramp_engine='cpu', ramp_resolution=256, color_stops=color_stops
+        )
+        gpu = GradientBase(ramp_resolution=256, color_stops=color_stops)
+        self.advance_frames(1)
+        self.assertEqual(cpu._1d_gradient_texture.size, (256, 1))
+        self.assertEqual(gpu._1d_gradient_texture.size, (256, 1))
+        cpu_pixels = cpu._1d_gradient_texture.pixels
+        self.assertEqual(cpu_pixels, compute_ramp(mesh, 256))
+        for a, b in zip(gpu._1d_gradient_texture.pixels, cpu_pixels):
+            self.assertLessEqual(abs(a - b), 1)
+
+        cpu.ramp_resolution = 4096
+        self.advance_frames(1)
+        self.assertEqual(cpu._1d_gradient_texture.size, (4096, 1))
+
+        with self.assertRaises(ValueError):
+            cpu.ramp_resolution = 1
+
+        # shared ramps of different widths are different textures
+        shared = [
+            GradientBase(
+                ramp_storage='shared', ramp_resolution=width,
+                color_stops=color_stops
+            )
+            for width in (256, 256, 512)
+        ]
+        self.advance_frames(1)
+        textures = [wid._1d_gradient_texture for wid in shared]
+        self.assertIs(textures[0], textures[1])
+        self.assertEqual(textures[2].size, (512, 1))
+        self.assertEqual(ramp_registry.bytes_saved, 256 * 4)
+        for wid in shared:
+            wid.release_resources()
+        self.assertEqual(ramp_registry.live_ramps, 0)
+
+    @is_github_actions
+    def test_gradient_ramp_atlas(self):
+        from bouquet.gradients import ColorStop, LinearGradient
+        from bouquet.gradients.ramp import RAMP_WIDTH, ramp_atlas
+
+        used_rows = ramp_atlas.used_rows
+        first, second, third = [
+            LinearGradient(
+                ramp_storage='atlas', max_analytic_stops=0,
+                color_stops=[ColorStop(color=color)]
+            ) for color in ('red', 'red', 'lime')
+        ]
+        self.advance_frames(1)
+
+        texture = ramp_atlas.texture
+        self.assertIs(first._1d_gradient_texture, texture)
+        self.assertIs(third._1d_gradient_texture, texture)
+        self.assertEqual(first._atlas_row, second._atlas_row)
+        self.assertNotEqual(first._atlas_row, third._atlas_row)
+        self.assertEqual(ramp_atlas.used_rows, used_rows + 2)
+        self.assertEqual(
+            first.canvas['gradientRow'],
+            ramp_atlas.row_coord(first._atlas_row)
+        )
+
+        row_size = RAMP_WIDTH * 4
+        pixels = texture.pixels
+        row = third._atlas_row
+        self.assertEqual(
+            pixels[row * row_size:(row + 1) * row_size],
+            b'\x00\xff\x00\xff' * RAMP_WIDTH
+        )
+
+        # a row is freed when the last gradient releases it
+        first.release_resources()
+        self.assertEqual(ramp_atlas.used_rows, used_rows + 2)
+        second.ramp_storage = 'private'
+        self.advance_frames(1)
+        self.assertIsNot(second._1d_gradient_texture, texture)
+        self.assertEqual(second.canvas['gradientRow'], 0.5)
+        self.assertEqual(ramp_atlas.used_rows, used_rows + 1)
+
+        third.color_stops = []
+        self.advance_frames(1)
+        self.assertIs(third._1d_gradient_texture, third._default_texture)
+        self.assertEqual(ramp_atlas.used_rows, used_rows)
+
+        color_stops = [
+            ColorStop(position=0.2, color='yellow'),
+            ColorStop(position=0.7, color='blue')
+        ]
+        atlas_texture = LinearGradient.render_texture(
+            ramp_storage='atlas', max_analytic_stops=0,
+            color_stops=color_stops, size=(100, 1), angle=90
+        )
+        private_texture = LinearGradient.render_texture(
+            ramp_storage='private', ramp_engine='cpu', max_analytic_stops=0,
+            color_stops=color_stops, size=(100, 1), angle=90
+        )
+        self.assertEqual(atlas_texture.pixels, private_texture.pixels)
+        self.assertEqual(ramp_atlas.used_rows, used_rows)
+
+    @is_github_actions
+    def test_gradient_ramp_registry(self):
+        from bouquet.gradients import ColorStop, RadialGradient
+        from bouquet.gradients.ramp import RAMP_WIDTH, ramp_registry
+
+        def create(color):
+            return RadialGradient(
+                ramp_storage='shared', max_analytic_stops=0,
+                color_stops=[
+                    ColorStop(position=0.0, color='white'),
+                    ColorStop(position=1.0, color=color)
+                ]
+            )
+
+        live_ramps = ramp_registry.live_ramps
+        widgets = [create('red') for _ in range(3)] + [create('blue')]
+        self.advance_frames(1)
+
+        texture = widgets[0]._1d_gradient_texture
+        self.assertIs(widgets[1]._1d_gradient_texture, texture)
+        self.assertIs(widgets[2]._1d_gradient_texture, texture)
+        self.assertIsNot(widgets[3]._1d_gradient_texture, texture)
+        self.assertEqual(texture.pixels[-4:], b'\xff\x00\x00\xff')
+        self.assertEqual(ramp_registry.live_ramps, live_ramps + 2)
+        self.assertEqual(ramp_registry.bytes_saved, 2 * RAMP_WIDTH * 4)
+
+        # the shared ramp isn't modified by other widgets
+        widgets[0].color_stops[1].color = 'blue'
+        self.advance_frames(1)
+        self.assertIs(
+            widgets[0]._1d_gradient_texture, widgets[3]._1d_gradient_texture
+        )
+        self.assertEqual(texture.pixels[-4:], b'\xff\x00\x00\xff')
+
+        for wid in widgets[1:]:
+            wid.release_resources()
+        self.assertEqual(ramp_registry.live_ramps, live_ramps + 1)
+        widgets[0].ramp_storage = 'private'
+        self.advance_frames(1)
+        self.assertEqual(ramp_registry.stats(), {
+            'live_ramps': live_ramps, 'references': live_ramps,
+            'bytes_saved': 0
+        })
+
+    @is_github_actions
+    def test_gradient_analytic_stops(self):
+        from bouquet.gradients import ColorStop, ConicalGradient, \
+                                      LinearGradient, RadialGradient
+
+        color_stops = [
+            ColorStop(position=0.1, color=(1.0, 0.0, 0.5, 1.0)),
+            ColorStop(position=0.4, color=(0.0, 0.3, 1.0, 0.2)),
+            ColorStop(position=0.4, color=(0.0, 1.0, 1.0, 0.6)),
+            ColorStop(position=0.9, color=(0.2, 1.0, 0.0, 0.7))
+        ]
+        # all eight stops are interpolated in the shader
+        many_stops = [
+            ColorStop(position=i / 7, color=(i % 2, i / 7, 1.0 - i / 7, 1.0))
+            for i in range(8)
+        ]
+        for cls in (LinearGradient, RadialGradient, ConicalGradient):
+            for stops in (color_stops, many_stops):
+                analytic = cls.render_texture(
+                    color_stops=stops, size=(64, 64)
+                )
+                texture = cls.render_texture(
+                    color_stops=stops, size=(64, 64), max_analytic_stops=0
+                )
+                different = sum(
+                    abs(a - b) > 2
+                    for a, b in zip(analytic.pixels, texture.pixels)
+                )
+                # only pixels at the hard color stop can differ
+                self.assertLess(different, 64 * 4)
+
+        wid = LinearGradient(color_stops=color_stops)
+        self.advance_frames(1)
+        self.assertIs(wid._1d_gradient_texture, wid._default_texture)
+        self.assertEqual(wid.canvas['gradientStopCount'], 4)
+
+        wid.color_stops = [ColorStop(position=i / 8) for i in range(9)]
+        self.advance_frames(1)
+        self.assertIsNot(wid._1d_gradient_texture, wid._default_texture)
+        self.assertEqual(wid.canvas['gradientStopCount'], 0)
+
+        wid.max_analytic_stops = 0
+        wid.color_stops = color_stops
+        self.advance_frames(1)
+        self.assertIsNot(wid._1d_gradient_texture, wid._default_texture)
+        self.assertEqual(wid.canvas['gradientStopCount'], 0)
+
+    @is_github_actions
+    def test_render_texture_shader_reuse(self):
+        from bouquet.gradients import ColorStop, LinearGradient
+        from bouquet.gradients.base import _renderers
+        from bouquet.gradients.cache import texture_cache
+        from bouquet.gradients.instrumentation import \
+            shader_compile_stats, reset_shader_compile_stats
+        from bouquet.gradients.ramp import ramp_fbo_pool
+
+        max_bytes = texture_cache.max_bytes
+        texture_cache.max_bytes = 0
+        self.addCleanup(setattr, texture_cache, 'max_bytes', max_bytes)
+        # the widgets of the previous tests would be reused
+        _renderers.clear()
+        reset_shader_compile_stats()
+        color_stops = [
+            ColorStop(position=0.0, color='red'),
+            ColorStop(position=1.0, color='blue')
+        ]
+        vertical = LinearGradient.render_texture(
+            color_stops=color_stops, size=(1, 10)
+        )
+        LinearGradient.render_texture(
+            color_stops=color_stops, size=(10, 1), angle=90
+        )
+        # the angle is reset to the default value
+        texture = LinearGradient.render_texture(
+            color_stops=color_stops, size=(1, 10)
+        )
+        self.assertEqual(texture.pixels, vertical.pixels)
+        self.assertEqual(shader_compile_stats()['LinearGradient']['count'], 1)
+
+        with self.assertRaises(TypeError):
+            LinearGradient.render_texture(radius=1.0)
+        # the valid properties of the failed request aren't kept either
+        with self.assertRaises(TypeError):
+            LinearGradient.render_texture(angle=90, radius=1.0)
+        texture = LinearGradient.render_texture(
+            color_stops=color_stops, size=(1, 10)
+        )
+        self.assertEqual(texture.pixels, vertical.pixels)
+
+        # the widget doesn't keep the color stops of the caller
+        renderer = _renderers[LinearGradient]
+        self.assertEqual(renderer.color_stops, [])
+        ramp_fbo_pool.clear()
+        LinearGradient.render_texture(
+            color_stops=color_stops, size=(1, 10), max_analytic_stops=0
+        )
+        self.assertEqual(len(ramp_fbo_pool), 1)
+        color_stops[0].color = 'green'
+        self.advance_frames(1)
+        self.assertIsNone(renderer._ramp)
+        self.assertEqual(len(ramp_fbo_pool), 1)
+
+        wid = LinearGradient()
+        self.render(wid)
+        stats = shader_compile_stats()['LinearGradient']
+        self.assertEqual(stats['count'], 2)
+        self.assertGreater(stats['time'], 0.0)
+
+        reset_shader_compile_stats()
+        self.assertEqual(shader_compile_stats(), {})
+
+    def test_import_without_window(self):
+        import subprocess
+        import sys
+
+        code = (
+            'import sys, bouquet, bouquet.gradients; '
+            'print(\'kivy.core.window\' in sys.modules)'
+        )
+        env = dict(os.environ, KIVY_NO_ARGS='1')
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            capture_output=True, text=True, env=env, check=True
+        )
+        self.assertEqual(result.stdout.strip(), 'False')
+
+    def test_lazy_import(self):
+        import subprocess
+        import sys
+
+        code = '''if True:
+            import sys
+            import bouquet.gradients as gradients
+            loaded = lambda: {
+                m for m in sys.modules if m.startswith('bouquet.gradients.')
+            }
+            print(sorted(loaded()))
+            gradients.RadialGradient
+            print('bouquet.gradients.radial' in loaded())
+            print(sorted(loaded() & {
+                'bouquet.gradients.linear', 'bouquet.gradients.bilinear',
+                'bouquet.gradients.conical'
+            }))
+
+            from kivy.factory import Factory
+            from bouquet.gradients import base
+            print(Factory.LinearGradient is gradients.LinearGradient)
+            print(sorted(base._loaded_kv_rules))
+        '''
+        env = dict(os.environ, KIVY_NO_ARGS='1')
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            capture_output=True, text=True, env=env, check=True
+        )
+        self.assertEqual(
+            result.stdout.splitlines(), ['[]', 'True', '[]', 'True', '[]']
+        )
+
+        from bouquet import gradients
+        with self.assertRaises(AttributeError):
+            gradients.UnknownGradient
+        self.assertIn('ConicalGradient', dir(gradients))
+
+    def test_kv_rule_order(self):
+        import subprocess
+        import sys
+
+        # the rule of the app is loaded before the gradient rule,
+        # but it's still applied after it, and the rules loaded before
+        # the import (e.g. style.kv of Kivy) are still applied before it
+        code = '''if True:
+            from kivy.lang import Builder
+            from bouquet.gradients import LinearGradient
+            Builder.load_string("""
+<LinearGradient>:
+    canvas:
+        Line:
+            points: 0, 0, 10, 10
+""")
+            names = [
+                c.__class__.__name__
+                for c in LinearGradient().canvas.children
+            ]
+            files = [rule.ctx.filename or '' for _, rule in Builder.rules]
+            print(
+                names.index('Rectangle') < names.index('Line'),
+                files[0].endswith('style.kv'),
+                files[-1] != 'bouquet.gradients.LinearGradient.kv'
+            )
+        '''
+        env = dict(os.environ, KIVY_NO_ARGS='1')
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            capture_output=True, text=True, env=env, check=True
+        )
+        self.assertEqual(result.stdout.strip(), 'True True True')
+
+    def test_gl_context(self):
+        from bouquet.gradients import base
+
+        base.ensure_gl_context()
+        self.assertTrue(base._gl_context_created)
+        with self.assertRaises(RuntimeError):
+            base.use_headless_context()
+
+    def test_render_before_gl_context(self):
+        import subprocess
+        import sys
+
+        # render_texture() and render_pixels() are the first GL calls
+        for method in ('render_texture', 'render_pixels'):
+            code = (
+                'from bouquet.gradients import LinearGradient; '
+                'from bouquet.gradients.base import use_headless_context; '
+                'use_headless_context(); '
+                f'LinearGradient.{method}(size=(4, 2)); '
+                'print(\'rendered\')'
+            )
+            env = dict(os.environ, KIVY_NO_ARGS='1')
+            result = subprocess.run(
+                [sys.executable, '-c', code],
+                capture_output=True, text=True, env=env
+            )
+            self.assertEqual(result.returncode, 0)
+            self.assertEqual(result.stdout.strip(), 'rendered')
+
     def test_linear_gradient_widget(self):
         from bouquet.gradients import ColorStop, LinearGradient
 
@@ -525,3 +1046,1056 @@ class GradientsTests(GraphicUnitTest):
         self.assertEqual(len(texture.pixels), 4 * 1000 * 1)
         self.assertEqual(texture.pixels[:4], b'\xff\x80\x00\xff')
         self.assertEqual(texture.pixels[-4:], b'\xff\xff\x00\xff')
+
+    def test_texture_cache(self):
+        from bouquet.gradients.cache import TextureCache
+
+        class FakeTexture:
+            width = height = 16     # 1 KiB
+
+        cache = TextureCache(max_bytes=2048)
+        first, second, third = FakeTexture(), FakeTexture(), FakeTexture()
+
+        self.assertIsNone(cache.get('first'))
+        cache.put('first', first)
+        cache.put('second', second)
+        self.assertIs(cache.get('first'), first)
+        self.assertEqual(cache.size_bytes, 2048)
+
+        # 'second' is the least recently used texture
+        cache.put('third', third)
+        self.assertNotIn('second', cache)
+        self.assertIs(cache.get('first'), first)
+        self.assertIs(cache.get('third'), third)
+
+        self.assertEqual(cache.stats(), {
+            'entries': 2, 'size_bytes': 2048, 'max_bytes': 2048,
+            'hits': 3, 'misses': 1, 'evictions': 1
+        })
+
+        cache.max_bytes = 1024
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.evictions, 2)
+
+        self.assertFalse(cache.discard(first))
+        self.assertTrue(cache.discard(third))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size_bytes, 0)
+
+        cache.max_bytes = 0
+        cache.put('first', first)
+        self.assertEqual(len(cache), 0)
+
+        with self.assertRaises(ValueError):
+            cache.max_bytes = -1
+
+    def test_render_texture_cache(self):
+        from bouquet.gradients import BilinearGradient, ColorStop, \
+            LinearGradient
+        from bouquet.gradients.base import _texture_key
+        from bouquet.gradients.cache import texture_cache
+
+        self.assertEqual(texture_cache.max_bytes, 0)
+        texture = LinearGradient.render_texture(size=(8, 8))
+        self.assertIsNot(LinearGradient.render_texture(size=(8, 8)), texture)
+        self.assertEqual(len(texture_cache), 0)
+
+        # the same colors give the same key
+        keys = [
+            _texture_key(BilinearGradient, (8, 8), {'top_left_color': color})
+            for color in ('red', '#ff0000', (1, 0, 0, 1), [1.0, 0.0, 0.0])
+        ]
+        self.assertEqual(len(set(keys)), 1)
+        self.assertNotEqual(keys[0], _texture_key(
+            BilinearGradient, (8, 8), {'top_left_color': 'blue'}
+        ))
+
+        self.enable_texture_cache()
+        texture = LinearGradient.render_texture(
+            size=(64, 32), angle=45, color_stops=[ColorStop(color='red')]
+        )
+        same_texture = LinearGradient.render_texture(
+            angle=45, color_stops=[ColorStop(color='red')], size=(64, 32)
+        )
+        self.assertIs(texture, same_texture)
+
+        other_texture = LinearGradient.render_texture(
+            size=(64, 32), angle=90, color_stops=[ColorStop(color='red')]
+        )
+        self.assertIsNot(texture, other_texture)
+
+        self.assertEqual(texture_cache.hits, 1)
+        self.assertEqual(texture_cache.misses, 2)
+        self.assertEqual(texture_cache.size_bytes, 2 * 64 * 32 * 4)
+
+    def cpu_render_requests(self):
+        from bouquet.gradients import ColorStop, LinearGradient, \
+            BilinearGradient, RadialGradient, ConicalGradient
+
+        color_stops = [
+            ColorStop(position=0.1, color=(1.0, 0.0, 0.5, 1.0)),
+            ColorStop(position=0.5, color=(0.0, 0.3, 1.0, 0.2)),
+            ColorStop(position=0.9, color=(0.2, 1.0, 0.0, 0.7))
+        ]
+        return [
+            (LinearGradient, dict(angle=30, color_stops=color_stops)),
+            (LinearGradient, dict(angle=-120, color_stops=color_stops)),
+            (RadialGradient, dict(
+                gradient_center_pos=(0.2, 0.7), radius=0.6,
+                color_stops=color_stops
+            )),
+            (RadialGradient, dict(radius=0, color_stops=color_stops)),
+            (ConicalGradient, dict(
+                gradient_center_pos=(0.2, 0.8), color_stops=color_stops
+            )),
+            (BilinearGradient, dict(
+                top_left_color='#ff000080',
+                bottom_right_color=(0.0, 0.0, 1.0)
+            ))
+        ]
+
+    def test_cpu_render_pixels(self):
+        numpy = pytest.importorskip('numpy')
+        from bouquet.gradients import LinearGradient
+        from bouquet.gradients.raster import render_pixels
+
+        for gradient, kwargs in self.cpu_render_requests():
+            pixels = render_pixels(gradient, size=(37, 24), **kwargs)
+            self.assertEqual(pixels.shape, (24, 37, 4))
+            self.assertEqual(pixels.dtype, numpy.uint8)
+
+        pixels = render_pixels('LinearGradient', width=3, height=1)
+        self.assertEqual(pixels.tobytes(), b'\xff' * 12)
+
+        with self.assertRaises(TypeError):
+            render_pixels(LinearGradient, radius=1.0)
+        with self.assertRaises(ValueError):
+            render_pixels('SpiralGradient')
+
+    @is_github_actions
+    def test_cpu_render_pixels_match_gpu(self):
+        numpy = pytest.importorskip('numpy')
+        from bouquet.gradients.raster import render_pixels
+
+        for gradient, kwargs in self.cpu_render_requests():
+            pixels = render_pixels(gradient, size=(37, 24), **kwargs)
+            texture = gradient.render_texture(size=(37, 24), **kwargs)
+            expected = numpy.frombuffer(texture.pixels, dtype=numpy.uint8)
+            difference = numpy.abs(
+                pixels.reshape(-1).astype(int) - expected.astype(int)
+            )
+            self.assertLessEqual(difference.max(), 1, gradient.__name__)
+
+    def test_cpu_render_without_window(self):
+        pytest.importorskip('numpy')
+        import subprocess
+        import sys
+
+        code = (
+            'import sys; '
+            'from bouquet.gradients import ColorStop; '
+            'from bouquet.gradients.raster import render_pixels; '
+            'stops = [ColorStop(color=\'red\'), '
+            'ColorStop(position=1.0, color=\'blue\')]; '
+            'p = render_pixels(\'LinearGradient\', size=(2, 1), angle=90, '
+            'color_stops=stops); '
+            'print(p.tolist(), \'kivy.core.window\' in sys.modules)'
+        )
+        env = dict(os.environ, KIVY_NO_ARGS='1')
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            capture_output=True, text=True, env=env, check=True
+        )
+        self.assertEqual(
+            result.stdout.strip(),
+            '[[[191, 0, 64, 255], [64, 0, 191, 255]]] False'
+        )
+
+    def test_export_gradients(self):
+        pytest.importorskip('numpy')
+        import json
+        import struct
+        import subprocess
+        import sys
+        import tempfile
+        import zlib
+        from bouquet.gradients.export import export_gradients, load_spec
+
+        with tempfile.TemporaryDirectory() as directory:
+            spec = os.path.join(directory, 'spec.csv')
+            with open(spec, 'w') as spec_file:
+                spec_file.write(
+                    'type,name,width,height,angle,color_stops\n'
+                    'linear,red_blue,2,1,90,0.0:red;1.0:#0000ff\n'
+                    'BilinearGradient,,3,2,,\n'
+                )
+            entries = load_spec(spec)
+            self.assertEqual(entries[0], {
+                'type': 'linear', 'name': 'red_blue', 'width': 2.0,
+                'height': 1.0, 'angle': 90.0, 'color_stops': [
+                    {'position': 0.0, 'color': 'red'},
+                    {'position': 1.0, 'color': '#0000ff'}
+                ]
+            })
+
+            paths = export_gradients(
+                entries, directory, backend='cpu', workers=1,
+                image_format='rgba'
+            )
+            self.assertEqual(paths, [
+                os.path.join(directory, 'red_blue.rgba'),
+                os.path.join(directory, '00001_BilinearGradient.rgba')
+            ])
+            with open(paths[0], 'rb') as raw_file:
+                self.assertEqual(
+                    raw_file.read(), b'\xbf\x00\x40\xff\x40\x00\xbf\xff'
+                )
+            with open(paths[1], 'rb') as raw_file:
+                pixels = raw_file.read()
+            self.assertEqual(len(pixels), 3 * 2 * 4)
+            # the first row is the top row, which is closer to green color
+            self.assertEqual(pixels[:4], b'\x2b\x70\x00\xff')
+
+            with self.assertRaises(ValueError):
+                export_gradients(entries, directory, backend='vulkan')
+
+            # pairs and integers
+            with open(spec, 'w') as spec_file:
+                spec_file.write(
+                    'type,name,size,gradient_center_pos,ramp_resolution\n'
+                    'radial,center,4;2,0.25;0.5,64\n'
+                )
+            entries = load_spec(spec)
+            self.assertEqual(entries, [{
+                'type': 'radial', 'name': 'center', 'size': [4, 2],
+                'gradient_center_pos': [0.25, 0.5], 'ramp_resolution': 64
+            }])
+            self.assertIsInstance(entries[0]['size'][0], int)
+            paths = export_gradients(
+                entries, directory, backend='cpu', workers=1,
+                image_format='rgba'
+            )
+            with open(paths[0], 'rb') as raw_file:
+                self.assertEqual(len(raw_file.read()), 4 * 2 * 4)
+            with open(spec, 'w') as spec_file:
+                spec_file.write('type,size\nlinear,4;2;1\n')
+            with self.assertRaises(ValueError):
+                load_spec(spec)
+
+            # the files can't be written outside the directory
+            # or overwrite each other
+            output = os.path.join(directory, 'names')
+            for name in ('../escaped', os.path.abspath('absolute'), '..'):
+                with self.assertRaises(ValueError):
+                    export_gradients(
+                        [{'type': 'linear', 'name': name}], output,
+                        backend='cpu', workers=1
+                    )
+            with self.assertRaises(ValueError):
+                export_gradients(
+                    [{'type': 'linear', 'name': 'same'}] * 2, output,
+                    backend='cpu', workers=1
+                )
+            self.assertFalse(os.path.exists(output))
+            self.assertFalse(
+                os.path.exists(os.path.join(directory, 'escaped.png'))
+            )
+
+            spec = os.path.join(directory, 'spec.json')
+            with open(spec, 'w') as spec_file:
+                json.dump([
+                    {'type': 'radial', 'name': f'radial_{i}', 'size': [4, 3]}
+                    for i in range(3)
+                ], spec_file)
+            output = os.path.join(directory, 'png')
+            env = dict(os.environ, KIVY_NO_ARGS='1')
+            subprocess.run(
+                [sys.executable, '-m', 'bouquet', 'export', spec,
+                 '-o', output, '-j', '2'],
+                capture_output=True, env=env, check=True
+            )
+            self.assertEqual(
+                sorted(os.listdir(output)),
+                ['radial_0.png', 'radial_1.png', 'radial_2.png']
+            )
+            with open(os.path.join(output, 'radial_0.png'), 'rb') as f:
+                png = f.read()
+            self.assertEqual(png[:8], b'\x89PNG\r\n\x1a\n')
+            self.assertEqual(struct.unpack('>II', png[16:24]), (4, 3))
+            raw = zlib.decompress(png[41:-12])
+            self.assertEqual(raw, (b'\x00' + b'\xff' * 16) * 3)
+
+    @is_github_actions
+    def test_render_pixels(self):
+        from bouquet.gradients import ColorStop, LinearGradient, \
+            BilinearGradient
+        from bouquet.gradients.instrumentation import shader_compile_stats
+
+        kwargs = dict(
+            angle=30, color_stops=[
+                ColorStop(position=0.2, color='red'),
+                ColorStop(position=0.8, color=(0.0, 0.0, 1.0, 0.5))
+            ]
+        )
+        texture = LinearGradient.render_texture(size=(40, 30), **kwargs)
+        pixels = LinearGradient.render_pixels(size=(40, 30), **kwargs)
+        self.assertIsInstance(pixels, bytearray)
+        self.assertEqual(bytes(pixels), texture.pixels)
+
+        fbos = shader_compile_stats()['Fbo']['count']
+        buffer = bytearray(40 * 30 * 4)
+        result = BilinearGradient.render_pixels(buffer, size=(40, 30))
+        self.assertIs(result, buffer)
+        self.assertEqual(
+            bytes(buffer),
+            BilinearGradient.render_texture(size=(40, 30)).pixels
+        )
+        view = memoryview(buffer)
+        LinearGradient.render_pixels(view, size=(40, 30), **kwargs)
+        self.assertEqual(bytes(buffer), texture.pixels)
+        # render_texture() creates one Fbo, the readback Fbo is reused
+        self.assertEqual(shader_compile_stats()['Fbo']['count'], fbos + 1)
+
+        with self.assertRaises(ValueError):
+            LinearGradient.render_pixels(bytearray(10), size=(40, 30))
+        with self.assertRaises(TypeError):
+            LinearGradient.render_pixels(bytes(4800), size=(40, 30))
+
+        try:
+            import numpy
+        except ImportError:
+            return
+        array = numpy.zeros((30, 40, 4), dtype=numpy.uint8)
+        LinearGradient.render_pixels(array, size=(40, 30), **kwargs)
+        self.assertEqual(array.tobytes(), texture.pixels)
+
+        from bouquet.gradients.raster import render_pixels
+        result = render_pixels(LinearGradient, out=array, size=(40, 30))
+        self.assertTrue(numpy.shares_memory(result, array))
+        self.assertEqual(array.tobytes(), b'\xff' * 4800)
+
+    @is_github_actions
+    def test_render_texture_target(self):
+        import gc
+        import weakref
+        from kivy.graphics.fbo import Fbo
+        from kivy.graphics.texture import Texture
+        from bouquet.gradients import ColorStop, RadialGradient, base
+        from bouquet.gradients.instrumentation import shader_compile_stats
+
+        texture_cache = self.enable_texture_cache()
+
+        kwargs = dict(color_stops=[
+            ColorStop(position=0.0, color='red'),
+            ColorStop(position=1.0, color='blue')
+        ])
+        expected = RadialGradient.render_texture(size=(20, 10), **kwargs)
+        cached = len(texture_cache)
+
+        fbo = Fbo(size=(20, 10))
+        fbo_texture = fbo.texture
+        texture = RadialGradient.render_texture(fbo, size=(20, 10), **kwargs)
+        self.assertIs(texture, fbo_texture)
+        self.assertEqual(texture.pixels, expected.pixels)
+        self.assertEqual(len(texture_cache), cached)
+
+        # the FBO is resized only when the size changes
+        texture = RadialGradient.render_texture(fbo, size=(8, 6))
+        self.assertEqual(texture.size, (8, 6))
+        self.assertIs(
+            RadialGradient.render_texture(fbo, size=(8, 6)), texture
+        )
+        self.assertEqual(texture.pixels, b'\xff' * 8 * 6 * 4)
+
+        fbos = shader_compile_stats()['Fbo']['count']
+        target = Texture.create(size=(20, 10))
+        texture = RadialGradient.render_texture(
+            target, size=(20, 10), **kwargs
+        )
+        self.assertIs(texture, target)
+        self.assertEqual(target.pixels, expected.pixels)
+        # only the framebuffer of the texture is created
+        self.assertEqual(shader_compile_stats()['Fbo']['count'], fbos + 1)
+        # and it's reused
+        fbo = base._target_fbo
+        self.assertIs(fbo.texture, target)
+        RadialGradient.render_texture(target, size=(20, 10))
+        self.assertIs(base._target_fbo, fbo)
+        self.assertEqual(shader_compile_stats()['Fbo']['count'], fbos + 1)
+        self.assertEqual(target.pixels, b'\xff' * 20 * 10 * 4)
+
+        texture = RadialGradient.render_texture(target, size=(10, 10))
+        self.assertIsNot(texture, target)
+        self.assertEqual(texture.size, (10, 10))
+
+        # the framebuffer doesn't keep the texture alive
+        target_ref = weakref.ref(target)
+        del fbo, target, texture
+        trigger = base._trigger_release_target_fbo
+        trigger.cancel()
+        trigger.timeout = 0
+        self.addCleanup(setattr, trigger, 'timeout', 1.0)
+        trigger()
+        self.advance_frames(1)
+        self.assertIsNone(base._target_fbo)
+        gc.collect()
+        self.assertIsNone(target_ref())
+
+        # the target isn't shared with the other callers of the cache
+        pixels = expected.pixels
+        cached = RadialGradient.render_texture(size=(20, 10), **kwargs)
+        self.assertIs(cached, expected)
+        RadialGradient.render_texture(cached, size=(20, 10))
+        self.assertEqual(cached.pixels, b'\xff' * 20 * 10 * 4)
+        texture = RadialGradient.render_texture(size=(20, 10), **kwargs)
+        self.assertIsNot(texture, cached)
+        self.assertEqual(texture.pixels, pixels)
+
+    def test_disk_cache(self):
+        import tempfile
+        from bouquet.gradients.cache import DiskCache
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskCache(directory, max_bytes=20)
+            self.assertIsNone(cache.get('first', 8))
+            cache.put('first', b'\x01' * 8)
+            cache.put('second', b'\x02' * 8)
+            self.assertEqual(len(os.listdir(directory)), 2)
+            self.assertIsNone(cache.get('first', 4))
+            with cache.get('first', 8) as pixels:
+                self.assertEqual(pixels[:], b'\x01' * 8)
+
+            cache.put('third', b'\x03' * 8)
+            self.assertNotIn('second', cache)
+            self.assertIn('first', cache)
+            self.assertEqual(cache.stats(), {
+                'entries': 2, 'size_bytes': 16, 'max_bytes': 20,
+                'hits': 1, 'misses': 2, 'evictions': 1
+            })
+
+            # a new cache (e.g. on the next launch) finds the files
+            cache = DiskCache(directory, max_bytes=20)
+            self.assertEqual(len(cache), 2)
+            self.assertEqual(cache.size_bytes, 16)
+            cache.max_bytes = 8
+            self.assertEqual(len(os.listdir(directory)), 1)
+            cache.put('huge', b'\x00' * 16)
+            self.assertNotIn('huge', cache)
+            cache.clear()
+            self.assertEqual(os.listdir(directory), [])
+
+            with self.assertRaises(ValueError):
+                cache.max_bytes = -1
+
+        self.assertNotEqual(DiskCache.digest(('a', 1)), DiskCache.digest('a'))
+
+    @is_github_actions
+    def test_render_texture_disk_cache(self):
+        import tempfile
+        from bouquet.gradients import ColorStop, ConicalGradient
+        from bouquet.gradients.cache import disk_cache
+
+        texture_cache = self.enable_texture_cache()
+        kwargs = dict(size=(30, 20), color_stops=[
+            ColorStop(position=0.0, color='red'),
+            ColorStop(position=1.0, color='blue')
+        ])
+        with tempfile.TemporaryDirectory() as directory:
+            disk_cache.directory = directory
+            try:
+                texture = ConicalGradient.render_texture(**kwargs)
+                self.assertEqual(len(os.listdir(directory)), 1)
+                self.assertEqual(disk_cache.misses, 1)
+
+                texture_cache.clear()
+                disk_cache.directory = directory
+                loaded = ConicalGradient.render_texture(**kwargs)
+                self.assertIsNot(loaded, texture)
+                self.assertEqual(disk_cache.hits, 1)
+                self.assertEqual(loaded.size, (30, 20))
+                self.assertEqual(loaded.pixels, texture.pixels)
+                self.assertIs(ConicalGradient.render_texture(**kwargs), loaded)
+            finally:
+                disk_cache.directory = None
+
+    @is_github_actions
+    def test_bake_texture(self):
+        import asyncio
+        import time
+        from bouquet.gradients import ColorStop, LinearGradient, \
+            RadialGradient
+        from bouquet.gradients import bake, raster
+
+        def wait(*bakes):
+            for _ in range(500):
+                self.advance_frames(1)
+                if all(b.done for b in bakes):
+                    return
+                time.sleep(0.01)
+            self.fail('Gradient is not baked.')
+
+        self.enable_texture_cache()
+        kwargs = dict(angle=60, color_stops=[
+            ColorStop(position=0.1, color='red'),
+            ColorStop(position=0.9, color=(0.0, 0.0, 1.0, 0.5))
+        ])
+        results = []
+        baking = bake.bake_texture(
+            LinearGradient, callback=results.append, size=(64, 32), **kwargs
+        )
+        self.assertFalse(baking.done)
+        self.assertEqual(baking.texture.size, (1, 1))
+        if raster.numpy is not None:
+            wait(baking)
+            self.assertEqual(results, [baking.texture])
+            expected = LinearGradient.render_pixels(size=(64, 32), **kwargs)
+            self.assertEqual(baking.texture.size, (64, 32))
+            for a, b in zip(baking.texture.pixels, expected):
+                self.assertLessEqual(abs(a - b), 1)
+
+            # baked textures are cached
+            cached = bake.bake_texture(LinearGradient, size=(64, 32), **kwargs)
+            self.assertTrue(cached.done)
+            self.assertIs(cached.texture, baking.texture)
+            self.assertIs(
+                LinearGradient.render_texture(size=(64, 32), **kwargs),
+                baking.texture
+            )
+
+            with self.assertRaises(TypeError):
+                bake.bake_texture(LinearGradient, radius=1.0)
+
+        preview = bake.bake_texture(
+            RadialGradient, preview=True, size=(100, 50)
+        )
+        cancelled = bake.bake_texture(RadialGradient, size=(100, 51))
+        cancelled.cancel()
+        self.assertEqual(preview.texture.size, (16, 8))
+        wait(preview)
+        self.assertEqual(preview.texture.size, (100, 50))
+        self.assertFalse(cancelled.done)
+
+        # without NumPy, one gradient per frame is rendered with OpenGL
+        numpy, raster.numpy = raster.numpy, None
+        try:
+            first = bake.bake_texture(RadialGradient, size=(10, 10))
+            second = bake.bake_texture(RadialGradient, size=(20, 10))
+            self.advance_frames(1)
+            self.assertTrue(first.done)
+            self.assertFalse(second.done)
+            wait(second)
+        finally:
+            raster.numpy = numpy
+
+        loop = asyncio.new_event_loop()
+        try:
+            task = loop.create_task(
+                bake.bake_texture_async(RadialGradient, size=(30, 30))
+            )
+            for _ in range(500):
+                loop.run_until_complete(asyncio.sleep(0.01))
+                self.advance_frames(1)
+                if task.done():
+                    break
+            self.assertEqual(task.result().size, (30, 30))
+        finally:
+            loop.close()
+
+    @is_github_actions
+    def test_bake_texture_error(self):
+        import asyncio
+        import time
+        from bouquet.gradients import LinearGradient
+        from bouquet.gradients import bake, raster
+
+        def wait(baking):
+            for _ in range(500):
+                self.advance_frames(1)
+                if baking.done:
+                    return
+                time.sleep(0.01)
+            self.fail('Gradient is not baked.')
+
+        def check_error():
+            results, errors = [], []
+            failed = bake.bake_texture(LinearGradient, size=(10, 10))
+            failed.add_done_callback(results.append, errors.append)
+            wait(failed)
+            self.assertIsInstance(failed.error, RuntimeError)
+            self.assertEqual(failed.texture.size, (1, 1))
+            self.assertEqual(results, [])
+            self.assertEqual(errors, [failed.error])
+            failed.add_done_callback(results.append, errors.append)
+            self.assertEqual(errors, [failed.error] * 2)
+
+            loop = asyncio.new_event_loop()
+            try:
+                task = loop.create_task(
+                    bake.bake_texture_async(LinearGradient, size=(10, 10))
+                )
+                for _ in range(500):
+                    loop.run_until_complete(asyncio.sleep(0.01))
+                    self.advance_frames(1)
+                    if task.done():
+                        break
+                with self.assertRaises(RuntimeError):
+                    task.result()
+            finally:
+                loop.close()
+
+        def fail(*args):
+            raise RuntimeError('Baking failed.')
+
+        if raster.numpy is not None:
+            render = raster._render
+            raster._render = fail
+            try:
+                check_error()
+            finally:
+                raster._render = render
+
+        # with OpenGL, the next gradients in the queue are still baked
+        def fail_first(gradient_cls, kwargs):
+            if kwargs['size'] == (10, 10):
+                fail()
+            return render_texture(gradient_cls, kwargs)
+
+        numpy, raster.numpy = raster.numpy, None
+        render_texture = bake.render_gradient_texture
+        bake.render_gradient_texture = fail_first
+        try:
+            check_error()
+            failed = bake.bake_texture(LinearGradient, size=(10, 10))
+            baked = bake.bake_texture(LinearGradient, size=(11, 10))
+            wait(baked)
+            self.assertIsNotNone(failed.error)
+            self.assertIsNone(baked.error)
+            self.assertEqual(baked.texture.size, (11, 10))
+        finally:
+            bake.render_gradient_texture = render_texture
+            raster.numpy = numpy
+
+    def test_rebake_scheduler(self):
+        from kivy.core.window import Window
+        from bouquet.gradients import ColorStop, LinearGradient
+        from bouquet.gradients import scheduler
+        from bouquet.gradients.scheduler import rebake_scheduler
+
+        widgets = [LinearGradient(max_analytic_stops=0) for _ in range(3)]
+        visible = widgets[2]
+        Window.add_widget(visible)
+        rebake_scheduler.flush()
+        rebake_scheduler.reset_stats()
+        try:
+            rebake_scheduler.budget = 0
+            for widget in widgets:
+                widget.color_stops = [ColorStop(color='red')]
+                self.assertTrue(widget._trigger_update_mesh.is_triggered)
+            self.assertEqual(len(rebake_scheduler), 3)
+
+            # one update per frame, the visible widget first
+            self.advance_frames(1)
+            self.assertEqual(rebake_scheduler.processed, 1)
+            self.assertFalse(visible._trigger_update_mesh.is_triggered)
+            self.assertIsNot(
+                visible._1d_gradient_texture, visible._default_texture
+            )
+            self.assertTrue(widgets[0]._trigger_update_mesh.is_triggered)
+            self.advance_frames(2)
+            self.assertEqual(len(rebake_scheduler), 0)
+            self.assertEqual(rebake_scheduler.deferred, 3)
+
+            # the visibility is checked only if the updates don't fit
+            # in the budget
+            checked = []
+            is_visible = scheduler._is_visible
+            self.addCleanup(setattr, scheduler, '_is_visible', is_visible)
+            scheduler._is_visible = lambda widget: checked.append(widget)
+
+            rebake_scheduler.budget = None
+            for angle in (10, 20, 30):
+                widgets[0].angle = angle
+                widgets[1].angle = angle
+            self.assertEqual(len(rebake_scheduler), 2)
+            self.advance_frames(1)
+            self.assertEqual(rebake_scheduler.stats(), {
+                'pending': 0, 'processed': 5, 'deferred': 3, 'budget': None
+            })
+
+            rebake_scheduler.budget = 1000
+            widgets[0].angle = 40
+            widgets[1].angle = 40
+            self.advance_frames(1)
+            self.assertEqual(rebake_scheduler.processed, 7)
+            self.assertEqual(checked, [])
+
+            with self.assertRaises(ValueError):
+                rebake_scheduler.budget = -1
+        finally:
+            rebake_scheduler.budget = None
+            Window.remove_widget(visible)
+
+    @is_github_actions
+    def test_instrumentation(self):
+        from bouquet.gradients import ColorStop, LinearGradient
+        from bouquet.gradients.base import enable_instrumentation, \
+            disable_instrumentation, instrumentation_stats, \
+            reset_instrumentation_stats, _renderers
+
+        # the widgets of the previous tests would be reused
+        _renderers.clear()
+        self.enable_texture_cache()
+        reset_instrumentation_stats()
+        color_stops = [ColorStop(color='red'), ColorStop(color='blue')]
+        widget = LinearGradient(max_analytic_stops=0, color_stops=color_stops)
+        self.advance_frames(1)
+        self.assertEqual(instrumentation_stats(), {})
+
+        enable_instrumentation()
+        try:
+            widget.color_stops = [ColorStop(color='green'), color_stops[1]]
+            self.advance_frames(1)
+            LinearGradient.render_texture(size=(7, 5), angle=10)
+            LinearGradient.render_texture(size=(7, 5), angle=10)
+            LinearGradient(color_stops=color_stops)
+        finally:
+            disable_instrumentation()
+        widget.color_stops = color_stops[:1]
+        self.advance_frames(1)
+
+        stats = instrumentation_stats()
+        # the widget and the widget of render_texture()
+        update = stats['update_mesh']['LinearGradient']
+        self.assertEqual(update['count'], 2)
+        self.assertGreaterEqual(update['time'], update['max'])
+        self.assertEqual(stats['bake_ramp']['LinearGradient']['count'], 1)
+        # the second call is served from the cache
+        self.assertEqual(stats['render_texture']['LinearGradient']['count'], 2)
+        self.assertEqual(stats['fbo_allocation']['LinearGradient']['count'], 1)
+        # the new widget and the widget of render_texture()
+        self.assertEqual(stats['shader_compile']['LinearGradient']['count'], 2)
+
+        reset_instrumentation_stats()
+        self.assertEqual(instrumentation_stats(), {})
+
+    def test_stress_mode(self):
+        import json
+        import subprocess
+        import sys
+
+        result = subprocess.run(
+            [sys.executable, '-m', 'bouquet', '--stress', '-n', '8',
+             '-s', '3', '--duration', '1'],
+            capture_output=True, text=True, check=True, timeout=120
+        )
+        stats = json.loads(result.stdout)
+        self.assertEqual(stats['gradients'], 8)
+        self.assertEqual(stats['color_stops'], 3)
+        self.assertGreater(stats['frames'], 0)
+        self.assertGreater(stats['rebakes'], 0)
+        self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+
+    def test_color_stop_array(self):
+        from bouquet.gradients import ColorStop, ColorStopArray, \
+                                      LinearGradient
+        from bouquet.gradients.base import instrumentation_stats, \
+            reset_instrumentation_stats, enable_instrumentation, \
+            disable_instrumentation
+        from bouquet.gradients.scheduler import rebake_scheduler
+
+        stops = ColorStopArray([0.0, 1.5], ['red', (0.0, 0.0, 1.0)])
+        self.assertEqual(len(stops), 2)
+        self.assertEqual(stops[0], (0.0, 1.0, 0.0, 0.0, 1.0))
+        self.assertEqual(stops[-1], (1.0, 0.0, 0.0, 1.0, 1.0))
+        with self.assertRaises(ValueError):
+            ColorStopArray([0.0], [])
+        with self.assertRaises(IndexError):
+            stops.set_many(positions=[0.1, 0.2], start=1)
+
+        events = []
+        stops.bind(on_change=lambda *args: events.append(args))
+        stops.set_many(positions=[0.25, 0.75], colors=['green', 'yellow'])
+        stops[2:] = [(1.0, 'white'), (0.5, 'black')]
+        del stops[-1]
+        self.assertEqual(len(events), 3)
+        self.assertEqual([s[0] for s in stops], [0.25, 0.75, 1.0])
+
+        # the array gives the same result as the list of ColorStop objects
+        def as_list(array):
+            return [
+                ColorStop(position=position, color=color)
+                for position, *color in array
+            ]
+
+        for count in (3, 40):
+            positions = [(i * 7 % count) / (count - 1) for i in range(count)]
+            colors = [(i / count, 1.0 - i / count, 0.5) for i in range(count)]
+            stops = ColorStopArray(positions, colors)
+            expected = LinearGradient.render_texture(
+                size=(64, 4), color_stops=as_list(stops)
+            ).pixels
+            texture = LinearGradient.render_texture(
+                size=(64, 4), color_stops=stops
+            )
+            self.assertEqual(texture.pixels, expected)
+
+        # bulk updates rebuild the gradient once
+        widget = LinearGradient(color_stops=stops)
+        rebake_scheduler.flush()
+        enable_instrumentation()
+        try:
+            reset_instrumentation_stats()
+            stops.set_many(colors=['red'] * 20, start=10)
+            stops[0] = (0.0, 'blue')
+            rebake_scheduler.flush()
+            stats = instrumentation_stats()
+            self.assertEqual(stats['update_mesh']['LinearGradient']['count'], 1)
+        finally:
+            disable_instrumentation()
+
+        # switching between lists and arrays
+        widget.color_stops = [ColorStop(color='red')]
+        self.assertIsInstance(widget.color_stops, list)
+        widget.color_stops.append(ColorStop(position=1.0, color='blue'))
+        self.assertEqual(len(widget.color_stops), 2)
+        widget.color_stops = stops
+        self.assertIs(widget.color_stops, stops)
+        rebake_scheduler.flush()
+        self.assertEqual(widget._1d_gradient_texture.size, (1024, 1))
+
+    def test_color_stops_bindings(self):
+        from bouquet.gradients import ColorStop, ColorStopArray, \
+                                      LinearGradient
+        from bouquet.gradients.scheduler import rebake_scheduler
+
+        def observers(stop):
+            return len(stop.get_property_observers('color'))
+
+        palette = [ColorStop(color='red'), ColorStop(position=1.0)]
+        first = LinearGradient(color_stops=palette)
+        second = LinearGradient(color_stops=palette)
+        self.assertEqual(observers(palette[0]), 2)
+
+        # reassigning and mutating the list doesn't duplicate the bindings
+        first.color_stops = palette
+        first.color_stops = [palette[0], palette[0], palette[1]]
+        first.color_stops.append(palette[1])
+        self.assertEqual(observers(palette[0]), 2)
+        self.assertEqual(observers(palette[1]), 2)
+
+        # replaced color stops don't update the widget anymore
+        first.color_stops = [ColorStop(color='blue')]
+        self.assertEqual(observers(palette[0]), 1)
+        rebake_scheduler.flush()
+        palette[0].color = 'green'
+        self.assertFalse(first._trigger_update_mesh.is_triggered)
+        self.assertTrue(second._trigger_update_mesh.is_triggered)
+
+        del second.color_stops[0]
+        self.assertEqual(observers(palette[0]), 0)
+        self.assertEqual(observers(palette[1]), 1)
+
+        # the same for the arrays
+        stops = ColorStopArray([0.0, 1.0], ['red', 'blue'])
+        second.color_stops = stops
+        self.assertEqual(observers(palette[1]), 0)
+        second.color_stops = palette
+        rebake_scheduler.flush()
+        stops[0] = (0.0, 'green')
+        self.assertFalse(second._trigger_update_mesh.is_triggered)
+
+        with self.assertRaises(TypeError):
+            second.color_stops = [palette[0], 1]
+        self.assertEqual(observers(palette[0]), 1)
+
+    @is_github_actions
+    def test_cpu_ramp_incremental_update(self):
+        import random
+        from bouquet.gradients import ColorStop, LinearGradient
+        from bouquet.gradients.ramp import compute_ramp, _compute_ramp_array
+        from bouquet.gradients.scheduler import rebake_scheduler
+
+        rng = random.Random(5)
+        color_stops = [
+            ColorStop(
+                position=position, color=(rng.random(), rng.random(), 0.5)
+            )
+            for position in sorted(rng.random() for _ in range(200))
+        ]
+        mesh = [i for stop in color_stops for i in stop._data]
+        mesh = [0.0, *mesh[1:5], *mesh, 1.0, *mesh[-4:]]
+        self.assertEqual(
+            compute_ramp(mesh, 64, 10, 20),
+            compute_ramp(mesh, 64)[10 * 4:20 * 4]
+        )
+        self.assertEqual(
+            _compute_ramp_array(mesh, 1024, 10, 20),
+            compute_ramp(mesh)[10 * 4:20 * 4]
+        )
+
+        wid = LinearGradient(
+            color_stops=color_stops, ramp_engine='cpu', ramp_resolution=256
+        )
+        rebake_scheduler.flush()
+        ramp = wid._ramp
+        for n in range(30):
+            stops = sorted(color_stops, key=lambda stop: stop.position)
+            index = rng.randrange(len(stops))
+            stop = stops[index]
+            if n % 10 == 9:
+                # the order of the color stops changes
+                stop.position = rng.random()
+            else:
+                # move the color stop between its neighbours and recolor it
+                low = stops[index - 1].position if index else 0.0
+                high = stops[index + 1].position \
+                    if index + 1 < len(stops) else 1.0
+                stop.position = rng.uniform(low, high)
+                stop.color = (rng.random(), 0.0, 1.0, 1.0)
+                mesh, span = wid._get_stops_mesh()
+                self.assertEqual(span, (low, high))
+                wid._changed_stops.add(stop)
+            rebake_scheduler.flush()
+            self.assertIs(wid._ramp, ramp)
+
+            stops = sorted(color_stops, key=lambda stop: stop.position)
+            mesh = [i for stop in stops for i in stop._data]
+            mesh = [0.0, *mesh[1:5], *mesh, 1.0, *mesh[-4:]]
+            expected = compute_ramp(mesh, 256)
+            self.assertEqual(bytes(ramp._pixels), expected)
+            self.assertEqual(ramp.texture.pixels, expected)
+
+    @is_github_actions
+    def test_gradient_animation(self):
+        from kivy.graphics import Callback
+        from kivy.graphics.fbo import Fbo
+        from bouquet.gradients import ColorStop, ColorStopArray, \
+            LinearGradient, BilinearGradient, RadialGradient, \
+            ConicalGradient, GradientAnimation
+        from bouquet.gradients.animation import _mix
+        from bouquet.gradients.base import enable_copy_blending, \
+            disable_copy_blending, enable_instrumentation, \
+            disable_instrumentation, instrumentation_stats, \
+            reset_instrumentation_stats
+
+        def draw(widget):
+            fbo = Fbo(size=widget.size)
+            with fbo:
+                Callback(enable_copy_blending)
+            fbo.add(widget.canvas)
+            with fbo:
+                Callback(disable_copy_blending)
+            fbo.draw()
+            fbo.remove(widget.canvas)
+            return fbo.pixels
+
+        first = [
+            ColorStop(position=0.1, color='red'),
+            ColorStop(position=0.9, color='blue')
+        ]
+        second = ColorStopArray(
+            [1.0, 0.0, 0.5], ['#00ff00', '#ffff00', '#00ffff']
+        )
+        requests = [
+            (LinearGradient, [dict(angle=10), dict(angle=120), {}]),
+            (RadialGradient, [
+                dict(radius=0.5, gradient_center_pos=(0.2, 0.3)),
+                dict(radius=1.5),
+                dict(gradient_center_pos=(0.7, 0.6))
+            ]),
+            (ConicalGradient, [
+                dict(gradient_center_pos=(0.2, 0.3)),
+                dict(gradient_center_pos=(0.7, 0.6)),
+                {}
+            ])
+        ]
+        for gradient_cls, properties in requests:
+            widget = gradient_cls(size=(40, 30))
+            keyframes = [
+                dict(properties[0], color_stops=first),
+                dict(properties[1], color_stops=second),
+                dict(properties[2], color_stops=first[:1])
+            ]
+            animation = GradientAnimation(*keyframes, duration=2.0)
+            events = []
+            animation.bind(
+                on_start=lambda a, w: events.append(('start', w)),
+                on_complete=lambda a, w: events.append(('complete', w))
+            )
+            for dt, index, time in ((0.75, 0, 0.75), (1.5, 1, 0.5)):
+                animation.start(widget)
+                self.assertIs(widget._animation, animation)
+                reset_instrumentation_stats()
+                enable_instrumentation()
+                try:
+                    for i in range(3):
+                        animation._update(dt / 3)
+                finally:
+                    disable_instrumentation()
+                # only the time uniform is updated on the frames
+                self.assertEqual(instrumentation_stats(), {})
+                pixels = draw(widget)
+
+                # the widget keeps the shown values
+                animation.stop(widget)
+                self.assertEqual(events[-2:], [
+                    ('start', widget), ('complete', widget)
+                ])
+                self.assertIsNone(widget._animation)
+                self.assertEqual(draw(widget), pixels)
+                self.assertEqual(len(widget.color_stops), 3)
+                expected = animation._get_keyframes(widget)[0]
+                for name in gradient_cls._animated_properties:
+                    value = getattr(widget, name)
+                    if not isinstance(value, (int, float)):
+                        value = list(value)
+                    self.assertEqual(value, pytest.approx(_mix(
+                        expected[index][name], expected[index + 1][name], time
+                    )))
+
+            # the widget is set to the last keyframe at the end
+            animation.start(widget)
+            animation._update(1.0)
+            self.assertEqual(animation.widgets, [widget])
+            animation._update(1.0)
+            self.assertEqual(events[-1], ('complete', widget))
+            self.assertEqual(animation.widgets, [])
+            self.assertIsNone(animation._clock_event)
+            self.assertEqual(widget.color_stops, first[:1])
+            for name, value in keyframes[2].items():
+                if name != 'color_stops':
+                    self.assertEqual(tuple(getattr(widget, name)), value)
+            pixels = draw(widget)
+            red = [p == 255 for p in pixels[:4]]
+            self.assertEqual(red, [True, False, False, True])
+
+        # a new animation of the widget cancels the old one
+        widget = LinearGradient(color_stops=first)
+        animation = GradientAnimation({'angle': 0}, {'angle': 90})
+        repeated = GradientAnimation(
+            {'angle': 0}, {'angle': 90}, duration=1.0, repeat=True
+        )
+        animation.start(widget)
+        repeated.start(widget)
+        self.assertEqual(animation.widgets, [])
+        self.assertEqual(widget.angle, 0)
+        for i in range(5):
+            repeated._update(0.25)
+        # the second loop
+        self.assertEqual(repeated.widgets, [widget])
+        repeated.cancel(widget)
+        self.assertEqual(widget.angle, pytest.approx(22.5))
+        self.assertIsNone(widget._keyframes)
+
+        with self.assertRaises(TypeError):
+            animation.start(BilinearGradient())
+        with self.assertRaises(ValueError):
+            animation.start(RadialGradient())
+        with self.assertRaises(ValueError):
+            GradientAnimation({'color_stops': first}).start(widget)
+        with self.assertRaises(ValueError):
+            GradientAnimation({}, {}, duration=0)
+        with self.assertRaises(ValueError):
+            GradientAnimation(
+                {}, {'color_stops': [ColorStop() for i in range(9)]}
+            ).start(widget)